@@ -0,0 +1,4 @@
+"""
+Benchmarks for query against synthetic SQLite databases. Run with
+`python -m benchmarks.run --help` from the repository root.
+"""
@@ -0,0 +1,180 @@
+"""
+Time QueryDb startup, the QueryDbOrm helpers and query throughput against
+synthetic SQLite databases, and write the results as JSON.
+
+Usage:
+    python -m benchmarks.run --tables 2000 --rows 1000000 --output results.json
+    python -m benchmarks.run --compare results.json  # Re-run and compare
+
+Each benchmark is repeated and reports the min, median and mean seconds,
+plus rows per second for the fetching benchmarks. Compare runs on the
+same machine by their median.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+
+import numpy as np
+import pandas as pd
+import sqlalchemy
+
+from query.core import QueryDb
+from benchmarks.synthetic import make_database, table_name
+
+
+def _time(fn, repeat):
+    times, result = [], None
+    for _ in range(repeat):
+        start = timeit.default_timer()
+        result = fn()
+        times.append(timeit.default_timer() - start)
+    return times, result
+
+
+def _summary(times, rows=None):
+    summary = {"min": min(times), "median": float(np.median(times)),
+               "mean": float(np.mean(times)), "repeat": len(times)}
+    if rows is not None:
+        summary["rows"] = rows
+        summary["rows_per_sec"] = rows / summary["median"] if summary["median"] else None
+    return summary
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.STDOUT).decode("utf-8").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _open(path, **kwargs):
+    return QueryDb(drivername="sqlite", database=path, use_env_vars=False,
+                   index_check=None, **kwargs)
+
+
+def run_benchmarks(tmp_dir, tables=1000, columns=10, rows=1000000, repeat=5):
+    """
+    Run all benchmarks, generating their databases in tmp_dir.
+
+    Returns:
+        results (dict): Benchmark name -> summary of its timings.
+    """
+    results = {}
+
+    # Startup: reflection and summary building over a wide schema
+    schema_path = make_database(os.path.join(tmp_dir, "schema.sqlite"), tables=tables,
+                                columns=columns, rows=10)
+    times, db = _time(lambda: _open(schema_path, show_table_stats=False), repeat)
+    results["init"] = _summary(times)
+    times, _ = _time(lambda: _open(schema_path, lazy=True), repeat)
+    results["init_lazy"] = _summary(times)
+
+    def _summary_html():
+        db._html = None
+        return db._repr_html_()
+
+    times, _ = _time(_summary_html, repeat)
+    results["summary_html"] = _summary(times)
+    times, _ = _time(lambda: db.table_stats(refresh=True), repeat)
+    results["table_stats"] = _summary(times)
+
+    # Helpers and fetching over a large table
+    table_path = make_database(os.path.join(tmp_dir, "table.sqlite"), tables=1,
+                               columns=columns, rows=rows)
+    db = _open(table_path)
+    table = getattr(db.inspect, table_name(0))
+    for name, fn in [("head", lambda: table.head(100)),
+                     ("tail", lambda: table.tail(100)),
+                     ("where_pk", lambda: table.where(rows // 2)),
+                     ("where_indexed", lambda: table.where("c1 < 1000")),
+                     ("where_scan", lambda: table.where("c2 < 1"))]:
+        times, df = _time(fn, repeat)
+        results[name] = _summary(times, rows=len(df))
+
+    sql = "SELECT * FROM %s" % table_name(0)
+    for fetch_engine in ["pandas", "columnar"]:
+        times, df = _time(lambda: db.query(sql, fetch_engine=fetch_engine,
+                                           columns=table.table.columns), repeat)
+        results["query_%s" % fetch_engine] = _summary(times, rows=len(df))
+    times, df = _time(lambda: db._to_df(sqlalchemy.sql.text(sql), db._engine), repeat)
+    results["to_df"] = _summary(times, rows=len(df))
+    times, n = _time(lambda: sum(len(c) for c in db.query(sql, return_as="chunks")), repeat)
+    results["query_chunks"] = _summary(times, rows=n)
+
+    return results
+
+
+def compare(results, baseline):
+    """
+    Ratio of each benchmark's median time to the baseline's, as a
+    DataFrame. Ratios above 1 are slower than the baseline.
+    """
+    rows = []
+    for name in sorted(set(results) & set(baseline)):
+        old, new = baseline[name]["median"], results[name]["median"]
+        rows.append((name, old, new, new / old if old else None))
+    return pd.DataFrame(rows, columns=["Benchmark", "Baseline (s)", "Median (s)", "Ratio"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--tables", type=int, default=1000,
+                        help="Tables in the wide schema database (default: 1000)")
+    parser.add_argument("--columns", type=int, default=10,
+                        help="Columns per table (default: 10)")
+    parser.add_argument("--rows", type=int, default=1000000,
+                        help="Rows in the large table (default: 1000000)")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="Times each benchmark is run (default: 5)")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare to")
+    args = parser.parse_args(argv)
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        results = run_benchmarks(tmp_dir, tables=args.tables, columns=args.columns,
+                                 rows=args.rows, repeat=args.repeat)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    report = {
+        "meta": {
+            "timestamp": time.time(),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "sqlalchemy": sqlalchemy.__version__,
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "sqlite": sqlite3.sqlite_version,
+            "params": {"tables": args.tables, "columns": args.columns, "rows": args.rows,
+                       "repeat": args.repeat},
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline["meta"]["params"] != report["meta"]["params"]:
+            sys.stderr.write("Warning: the baseline was run with different parameters.\n")
+        print(compare(results, baseline["results"]).to_string(index=False))
+    else:
+        print(json.dumps(results, indent=2, sort_keys=True))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Generator of synthetic SQLite databases with a configurable number of
+tables, columns and rows, e.g., thousands of tables to stress reflection
+and the database summary, or millions of rows to stress fetching.
+
+Tables are named t0000, t0001, ... and have an INTEGER PRIMARY KEY id
+column followed by integer, float and text columns in rotation. The first
+integer column, c1, is indexed.
+"""
+import os
+import sqlite3
+
+import numpy as np
+
+
+COLUMN_TYPES = ["INTEGER", "REAL", "TEXT"]
+
+
+def table_name(i):
+    return "t%04d" % i
+
+
+def column_names(columns):
+    """
+    Names of a synthetic table's columns, incl. the id primary key.
+    """
+    return ["id"] + ["c%d" % i for i in range(1, columns)]
+
+
+def _column_values(sql_type, n, rand):
+    if sql_type == "INTEGER":
+        return rand.randint(0, 1000000, size=n).tolist()
+    if sql_type == "REAL":
+        return rand.uniform(0, 1000, size=n).tolist()
+    # Repeated strings, as in typical dimension columns
+    return ["value %d" % v for v in rand.randint(0, 1000, size=n)]
+
+
+def make_database(path, tables=1, columns=10, rows=1000, row_tables=None, seed=0,
+                  batch_size=100000):
+    """
+    Create a synthetic SQLite database, replacing any file at path.
+
+    Args:
+        path (str): Database file to create.
+
+    Kwargs:
+        tables (int): Number of tables.
+
+        columns (int): Columns per table, incl. the id primary key.
+
+        rows (int): Rows per table.
+
+        row_tables (int): Only fill the first row_tables tables with rows,
+        leaving the others empty. Defaults to all tables.
+
+        seed (int): Seed of the generated values, so that databases are
+        identical across runs.
+
+        batch_size (int): Rows inserted per executemany() call.
+
+    Returns:
+        path (str)
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    rand = np.random.RandomState(seed)
+    names = column_names(columns)
+    types = ["INTEGER PRIMARY KEY"] + [COLUMN_TYPES[(i - 1) % len(COLUMN_TYPES)]
+                                       for i in range(1, columns)]
+    row_tables = tables if row_tables is None else row_tables
+
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        for t in range(tables):
+            name = table_name(t)
+            conn.execute("CREATE TABLE %s (%s)" %
+                         (name, ", ".join("%s %s" % c for c in zip(names, types))))
+            if columns > 1:
+                conn.execute("CREATE INDEX ix_%s_c1 ON %s (c1)" % (name, name))
+
+            if t >= row_tables:
+                continue
+            insert = "INSERT INTO %s VALUES (%s)" % (name, ", ".join("?" * columns))
+            for start in range(0, rows, batch_size):
+                n = min(batch_size, rows - start)
+                values = [list(range(start + 1, start + n + 1))]
+                values += [_column_values(sql_type, n, rand) for sql_type in types[1:]]
+                conn.executemany(insert, zip(*values))
+        conn.commit()
+    finally:
+        conn.close()
+    return path
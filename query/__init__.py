@@ -5,6 +5,7 @@ principally for read-only data exploration. Use with IPython Notebook is heartil
 recommended.
 """
 from query.core import QueryDb  # noqa
+from query.sharded import ShardedQueryDb  # noqa
 
 # Aliases
 from query.core import QueryDb as QueryDB  # noqa
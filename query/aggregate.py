@@ -0,0 +1,201 @@
+"""
+Aggregations pushed down to the database as GROUP BY queries, with
+results shaped like their pandas equivalents.
+"""
+import numpy as np
+import pandas as pd
+import sqlalchemy
+
+from query.columnar import column_kind
+
+
+# pandas aggregation name -> SQL aggregate of a column expression
+AGGREGATES = {
+    "count": lambda col: sqlalchemy.func.count(col),
+    "sum": lambda col: sqlalchemy.func.sum(col),
+    "mean": lambda col: sqlalchemy.func.avg(col),
+    "min": lambda col: sqlalchemy.func.min(col),
+    "max": lambda col: sqlalchemy.func.max(col),
+    "nunique": lambda col: sqlalchemy.func.count(sqlalchemy.distinct(col)),
+    "size": lambda col: sqlalchemy.func.count(),
+}
+
+# Aggregations pandas only applies to numeric columns of a DataFrame
+NUMERIC_AGGREGATES = ["sum", "mean"]
+
+
+def histogram_edges(bins, lo, hi):
+    """
+    Bin edges like numpy.histogram(): bins equal-width bins over [lo, hi],
+    or the given edges if bins is a sequence.
+    """
+    if not np.isscalar(bins):
+        return [float(edge) for edge in bins]
+    if lo == hi:
+        lo, hi = lo - 0.5, hi + 0.5
+    return list(np.linspace(lo, hi, int(bins) + 1))
+
+
+def bucket_expr(col, edges, equal_width=True, dialect=None):
+    """
+    SQL expression of the 0-based histogram bin of col. Bins are half-open
+    except the last, which includes its right edge. Values outside the
+    edges must be filtered out separately.
+
+    Kwargs:
+        dialect (str): Name of the database dialect. Casts to an integer
+        round on most databases, so bins are floored; SQLite may lack
+        FLOOR() but its casts truncate, which floors the (non-negative)
+        offsets from the first edge.
+    """
+    last = len(edges) - 2
+    if equal_width:
+        width = (edges[-1] - edges[0]) / float(last + 1)
+        offset = (col - edges[0]) / width
+        if dialect != "sqlite":
+            offset = sqlalchemy.func.floor(offset)
+        bucket = sqlalchemy.cast(offset, sqlalchemy.types.Integer)
+        return sqlalchemy.case([(col >= edges[-1], last)], else_=bucket)
+    return sqlalchemy.case([(col < edge, i) for i, edge in enumerate(edges[1:-1])],
+                           else_=last)
+
+
+class QueryDbGroupBy(object):
+    """
+    A grouping of a Table/Column by one or more columns (or SQL expressions,
+    e.g., "DATE(InvoiceDate)"), returned by QueryDbOrm.groupby(). Its
+    aggregations run as a single GROUP BY query. Results are indexed by the
+    group keys, like pandas' groupby().
+    """
+    def __init__(self, orm, by, where=None, dropna=True, sort=True):
+        self._orm = orm
+        self._by = [by] if isinstance(by, str) else list(by)
+        self._where = where
+        self._dropna = dropna
+        self._sort = sort
+
+    def __repr__(self):
+        return "GroupBy of %s by %s" % (self._orm.table.name, ", ".join(self._by))
+
+    def _value_columns(self, func):
+        """
+        Columns aggregated by default: the Column, or the Table's columns
+        that aren't group keys (numeric ones only for sum and mean).
+        """
+        if self._orm.column is not None:
+            return [self._orm.column.name]
+        columns = [c for c in self._orm.table.columns.values() if c.name not in self._by]
+        if func in NUMERIC_AGGREGATES:
+            columns = [c for c in columns if column_kind(c.type) in ["int", "float", "bool"]]
+        return [c.name for c in columns]
+
+    def _run(self, aggregates, helper, **kwargs):
+        """
+        Run the GROUP BY query for a list of (column, func) aggregates and
+        return a DataFrame indexed by the group keys, with one column per
+        aggregate.
+        """
+        for _, func in aggregates:
+            if func not in AGGREGATES:
+                raise ValueError("Unknown aggregation %s, use one of %s." %
+                                 (func, ", ".join(sorted(AGGREGATES))))
+
+        keys = [self._orm._column_expr(b) for b in self._by]
+        columns = [key.label("_key%d" % i) for i, key in enumerate(keys)]
+        columns += [AGGREGATES[func](None if col is None else self._orm._column_expr(col))
+                    .label("_agg%d" % i)
+                    for i, (col, func) in enumerate(aggregates)]
+
+        select = sqlalchemy.select(columns).select_from(self._orm.table)
+        if self._where is not None:
+            select = select.where(sqlalchemy.sql.text(self._where))
+        if self._dropna:
+            for key in keys:
+                select = select.where(key.isnot(None))
+        select = select.group_by(*keys)
+        if self._sort:
+            select = select.order_by(*keys)
+
+        sql, params = self._orm._db._compile(select)
+        df = self._orm._query(helper, sql, params, **kwargs)
+        df.columns = self._by + list(range(len(aggregates)))
+        return df.set_index(self._by)
+
+    def agg(self, func=None, **named):
+        """
+        Aggregate each group with count, sum, mean, min, max, nunique or
+        size. Additional keywords of the form name=(column, func) are named
+        aggregations; other keywords are passed to QueryDb.query().
+
+        Args:
+            func (str, list or dict): An aggregation, a list of them, or a
+            dict of column -> aggregation(s).
+
+        Returns:
+            result (pandas.DataFrame or pandas.Series): Shaped as pandas'
+            groupby().agg() would, e.g., a Series for one aggregation of a
+            Column and MultiIndex columns for lists of aggregations.
+        """
+        kwargs = dict((k, v) for k, v in named.items() if not isinstance(v, tuple))
+        named = [(k, v) for k, v in named.items() if isinstance(v, tuple)]
+
+        if named:
+            if func is not None:
+                raise ValueError("Pass either func or named aggregations, not both.")
+            df = self._run([v for _, v in named], "groupby.agg", **kwargs)
+            df.columns = [k for k, _ in named]
+            return df
+
+        if isinstance(func, str):
+            columns = self._value_columns(func)
+            df = self._run([(c, func) for c in columns], "groupby.%s" % func, **kwargs)
+            df.columns = columns
+            if self._orm.column is not None:
+                return df[columns[0]]
+            return df
+
+        if isinstance(func, dict):
+            spec = [(c, f if isinstance(f, str) else list(f)) for c, f in func.items()]
+        elif self._orm.column is not None:
+            spec = [(self._orm.column.name, list(func))]
+        else:
+            spec = [(c, list(func)) for c in self._value_columns(None)]
+        aggregates = [(c, f) for c, fs in spec for f in ([fs] if isinstance(fs, str) else fs)]
+        df = self._run(aggregates, "groupby.agg", **kwargs)
+
+        if self._orm.column is not None and not isinstance(func, dict):
+            df.columns = [f for _, f in aggregates]
+        elif all(isinstance(fs, str) for _, fs in spec):
+            df.columns = [c for c, _ in aggregates]
+        else:
+            df.columns = pd.MultiIndex.from_tuples(aggregates)
+        return df
+
+    aggregate = agg
+
+    def size(self, **kwargs):
+        """
+        Number of rows in each group, as a Series.
+        """
+        df = self._run([(None, "size")], "groupby.size", **kwargs)
+        series = df[0]
+        series.name = None if self._orm.column is None else self._orm.column.name
+        return series
+
+    def count(self, **kwargs):
+        return self.agg("count", **kwargs)
+
+    def sum(self, **kwargs):
+        return self.agg("sum", **kwargs)
+
+    def mean(self, **kwargs):
+        return self.agg("mean", **kwargs)
+
+    def min(self, **kwargs):
+        return self.agg("min", **kwargs)
+
+    def max(self, **kwargs):
+        return self.agg("max", **kwargs)
+
+    def nunique(self, **kwargs):
+        return self.agg("nunique", **kwargs)
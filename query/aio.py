@@ -0,0 +1,72 @@
+"""
+asyncio support for QueryDb, backed by sqlalchemy's async engine
+(sqlalchemy>=1.4). Kept out of core.py as it requires Python 3 syntax.
+"""
+import sqlalchemy
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from query.core import QueryDbError
+from query.limits import is_truncated
+
+
+# Default async driver for each sync backend
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "mysql": "mysql+aiomysql",
+}
+
+
+def get_async_engine(db):
+    """
+    Return the QueryDb's async engine, creating it on first use from the
+    same URL as its sync engine.
+    """
+    if db._async_engine is None:
+        url = db._engine.url
+        drivername = db._async_drivername or ASYNC_DRIVERS.get(url.get_backend_name())
+        if drivername is None:
+            raise QueryDbError("No async driver known for %s, specify one with "
+                               "QueryDb(async_drivername=...)." % url.get_backend_name())
+        db._async_engine = create_async_engine(url.set(drivername=drivername))
+    return db._async_engine
+
+
+async def aquery(db, sql_query, return_as="dataframe", cache=True, params=None, limits=None):
+    """
+    Execute a raw SQL query on the QueryDb's async engine and return a
+    DataFrame, see QueryDb.aquery(). limits (QueryLimits) default to the
+    QueryDb's.
+    """
+    limits = limits or db._limits
+    if not isinstance(sql_query, str):
+        raise QueryDbError("aquery() requires a str input.")
+    if return_as.upper() not in ["DF", "DATAFRAME"]:
+        raise QueryDbError("Other return types not implemented.")
+
+    use_cache = db._result_cache is not None and cache
+    if use_cache:
+        # .aquery() converts like the pandas fetch engine, so it shares its entries
+        key = db._cache_key(sql_query, params, "pandas", columns=None)
+        df = db._result_cache.get(key)
+        if df is not None:
+            return db._limit_df(df, limits)
+
+    query = sqlalchemy.sql.text(sql_query)
+    async with get_async_engine(db).connect() as conn:
+        # Reuse the sync DataFrame conversion, so results match .query()
+        df = await conn.run_sync(lambda sync_conn: db._to_df(query, sync_conn, params=params,
+                                                             limits=limits))
+
+    if use_cache and not is_truncated(df, limits):
+        db._result_cache.set(key, df)
+    return df
+
+
+async def dispose(db):
+    """
+    Dispose of the QueryDb's async engine, if any.
+    """
+    if db._async_engine is not None:
+        await db._async_engine.dispose()
+        db._async_engine = None
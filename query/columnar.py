@@ -0,0 +1,154 @@
+"""
+Columnar fetch engine: reads cursor batches straight into preallocated,
+typed NumPy arrays instead of building row tuples for pandas to infer
+dtypes from.
+
+dtypes are picked from reflected sqlalchemy column types. Columns whose
+type is unknown or doesn't map to a NumPy dtype are kept as object arrays.
+"""
+import time
+
+import numpy as np
+import pandas as pd
+import sqlalchemy
+
+
+DEFAULT_BATCH_SIZE = 10000
+
+
+def column_kind(sql_type):
+    """
+    Map a sqlalchemy column type (or None) to a buffer kind: "bool", "int",
+    "float", "datetime" or "object".
+    """
+    if sql_type is None:
+        return "object"
+    if isinstance(sql_type, sqlalchemy.types.Boolean):
+        return "bool"
+    if isinstance(sql_type, sqlalchemy.types.Integer):
+        return "int"
+    if isinstance(sql_type, sqlalchemy.types.Numeric):  # Incl. Float
+        return "float"
+    if isinstance(sql_type, (sqlalchemy.types.DateTime, sqlalchemy.types.Date)):
+        return "datetime"
+    return "object"
+
+
+class ColumnBuffer(object):
+    """
+    Growable typed array for a single result column. Columns with NULLs
+    are converted on .finish() following pandas' conventions: integers
+    become float64 with NaN, booleans become object with None.
+    """
+    DTYPES = {"bool": np.bool_, "int": np.int64, "float": np.float64,
+              "datetime": "datetime64[ns]", "object": object}
+
+    def __init__(self, kind, capacity=DEFAULT_BATCH_SIZE):
+        self.kind = kind
+        self.size = 0
+        self._data = np.empty(capacity, dtype=self.DTYPES[kind])
+        self._nulls = np.zeros(capacity, dtype=np.bool_) if kind in ("bool", "int") else None
+
+    def _reserve(self, n):
+        capacity = len(self._data)
+        if self.size + n <= capacity:
+            return
+        while self.size + n > capacity:
+            capacity *= 2
+        data = np.empty(capacity, dtype=self._data.dtype)
+        data[:self.size] = self._data[:self.size]
+        self._data = data
+        if self._nulls is not None:
+            nulls = np.zeros(capacity, dtype=np.bool_)
+            nulls[:self.size] = self._nulls[:self.size]
+            self._nulls = nulls
+
+    def _to_object(self):
+        # Values that don't fit the reflected type, fall back to object
+        data = np.empty(len(self._data), dtype=object)
+        data[:self.size] = self.finish()
+        self._data = data
+        self._nulls = None
+        self.kind = "object"
+
+    def extend(self, values):
+        n = len(values)
+        self._reserve(n)
+        start, end = self.size, self.size + n
+
+        if self._nulls is not None and None in values:
+            nulls = [v is None for v in values]
+            self._nulls[start:end] = nulls
+            values = [0 if null else v for v, null in zip(values, nulls)]
+
+        try:
+            self._data[start:end] = values
+        except (TypeError, ValueError, OverflowError):
+            self._to_object()
+            self._data[start:end] = values
+        self.size = end
+
+    def finish(self):
+        data = self._data[:self.size]
+        if self._nulls is None:
+            return data
+
+        nulls = self._nulls[:self.size]
+        if not nulls.any():
+            return data
+        if self.kind == "int":
+            data = data.astype(np.float64)
+            data[nulls] = np.nan
+        else:
+            data = data.astype(object)
+            data[nulls] = None
+        return data
+
+
+def read_columnar(result, column_types=None, batch_size=DEFAULT_BATCH_SIZE, timer=None):
+    """
+    Read a sqlalchemy result into a DataFrame column by column.
+
+    Args:
+        result: sqlalchemy result to read from.
+
+    Kwargs:
+        column_types (dict): Column name -> sqlalchemy type, e.g., from a
+        reflected Table. Columns without an entry are read as objects.
+
+        batch_size (int): Number of rows fetched from the cursor at a time.
+
+        timer (callable): Called as timer(phase, seconds) with the time
+        spent fetching ("fetch") and filling arrays ("convert").
+
+    Returns:
+        df (pandas.DataFrame)
+    """
+    column_types = column_types or {}
+    names = list(result.keys())
+    buffers = [ColumnBuffer(column_kind(column_types.get(name)), capacity=batch_size)
+               for name in names]
+
+    fetch_time, convert_time = 0.0, 0.0
+    while True:
+        start = time.time()
+        rows = result.fetchmany(batch_size)
+        fetch_time += time.time() - start
+        if not rows:
+            break
+        start = time.time()
+        for buf, values in zip(buffers, zip(*rows)):
+            buf.extend(values)
+        convert_time += time.time() - start
+
+    # Build by position, so duplicate column names in raw SQL are kept
+    start = time.time()
+    df = pd.DataFrame(dict((i, buf.finish()) for i, buf in enumerate(buffers)),
+                      columns=range(len(buffers)))
+    df.columns = names
+    convert_time += time.time() - start
+
+    if timer is not None:
+        timer("fetch", fetch_time)
+        timer("convert", convert_time)
+    return df
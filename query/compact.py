@@ -0,0 +1,110 @@
+"""
+Schema-aware dtype compaction of result DataFrames: numerics are
+downcast to the smallest dtype that holds their values and repeated
+strings are converted to categoricals.
+"""
+import numpy as np
+import pandas as pd
+import sqlalchemy
+
+from query.columnar import column_kind
+from query.result_cache import df_bytes
+
+
+DEFAULT_CATEGORY_THRESHOLD = 0.5
+
+
+def _smallest_int_dtype(min_value, max_value):
+    for dtype in [np.int8, np.int16, np.int32]:
+        info = np.iinfo(dtype)
+        if info.min <= min_value and max_value <= info.max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+def _compact_numeric(series, kind, nullable):
+    if series.dtype.kind in "iu":
+        if len(series) == 0:
+            return series
+        return series.astype(_smallest_int_dtype(series.min(), series.max()))
+
+    if series.dtype.kind != "f":
+        return series
+
+    values = series.dropna()
+    if kind == "int" and len(values) and (values == np.floor(values)).all():
+        int_dtype = _smallest_int_dtype(values.min(), values.max())
+        if not nullable or len(values) == len(series):
+            return series.astype(int_dtype)
+        if hasattr(pd, "Int64Dtype"):
+            # Nullable integer column with NULLs, e.g., "Int16"
+            return series.astype(int_dtype.name.capitalize())
+
+    # Only downcast floats if no precision is lost
+    as_float32 = series.astype(np.float32)
+    if np.array_equal(as_float32.astype(np.float64).values, series.values, equal_nan=True):
+        return as_float32
+    return series
+
+
+def _compact_object(series, col, category_threshold):
+    if col is not None and not isinstance(col.type, (sqlalchemy.types.String,
+                                                     sqlalchemy.types.Enum)):
+        return series
+    if len(series) == 0:
+        return series
+
+    values = series if col is not None and not col.nullable else series.dropna()
+    if col is None and not all(isinstance(v, str) for v in values):
+        return series  # Unknown type, only compact plain strings
+    if values.nunique() <= category_threshold * len(series):
+        return series.astype("category")
+    return series
+
+
+def compact_df(df, columns=None, category_threshold=DEFAULT_CATEGORY_THRESHOLD):
+    """
+    Downcast the numeric columns of df and convert its repeated string
+    columns to categoricals, in place. The memory usage before and after
+    is recorded in df.attrs["memory_bytes_before"] and
+    df.attrs["memory_bytes_after"] (pandas>=1.0).
+
+    Args:
+        df (pandas.DataFrame): DataFrame to compact.
+
+    Kwargs:
+        columns (dict): Column name -> reflected sqlalchemy Column, e.g., a
+        Table's .columns, used for column types and nullability. Columns
+        without an entry are compacted based on their dtype alone.
+
+        category_threshold (float): Convert string columns with at most this
+        fraction of distinct values to categoricals.
+
+    Returns:
+        df (pandas.DataFrame)
+    """
+    columns = columns if columns is not None else {}
+    bytes_before = df_bytes(df)
+
+    for i, name in enumerate(df.columns):
+        series = df.iloc[:, i]
+        col = columns.get(name) if name in columns else None
+        nullable = col.nullable if col is not None else True
+
+        if series.dtype == object:
+            compacted = _compact_object(series, col, category_threshold)
+        else:
+            kind = column_kind(col.type) if col is not None else None
+            compacted = _compact_numeric(series, kind, nullable)
+
+        if compacted is series:
+            continue
+        if hasattr(df, "isetitem"):
+            df.isetitem(i, compacted)  # By position, in case of duplicate names
+        else:
+            df[name] = compacted
+
+    if hasattr(df, "attrs"):
+        df.attrs["memory_bytes_before"] = bytes_before
+        df.attrs["memory_bytes_after"] = df_bytes(df)
+    return df
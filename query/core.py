@@ -1,14 +1,82 @@
+from concurrent.futures import ThreadPoolExecutor
+import contextlib
+import copy
 import getpass
+import numbers
+import random
+import re
 import sqlalchemy
+import time
 import numpy as np
 import pandas as pd
 import os
 import warnings
 
 import query
+from query.aggregate import bucket_expr, histogram_edges, QueryDbGroupBy
+from query.columnar import column_kind, read_columnar
+from query.compact import compact_df
+from query.explain import explain, PLANNERS
+from query.export import export_query, infer_format, DEFAULT_BATCH_SIZE, FORMATS
+from query.instrumentation import QueryInstrumentation
+from query.limits import is_truncated, LimitedResult, QueryLimits, RunningStatement
+from query.parallel import LazyParts, partition_bounds
+from query.related import (foreign_key_paths, key_values, DEFAULT_PARAMETER_LIMIT,
+                           PARAMETER_LIMITS, TEMP_TABLE_DIALECTS, TEMP_TABLE_NAME,
+                           TEMP_TABLE_THRESHOLD)
+from query.result_cache import ResultCache
+from query.schema_cache import SchemaCache
+from query.snapshot import Snapshot, open_store, snapshot_format
+from query.table_stats import collect_table_stats, TABLE_STATS_TIMEOUT, TABLE_STATS_WORKERS
+from query.helpers import python_value
 from query.html import df_to_html, GETPASS_USE_WARNING, QUERY_DB_ATTR_MSG
 
 
+# Dialects supporting TABLESAMPLE, and its clause for a given percentage
+TABLESAMPLE_CLAUSES = {
+    "postgresql": "TABLESAMPLE SYSTEM (%s)",
+    "mssql": "TABLESAMPLE (%s PERCENT)",
+}
+
+# Random ordering for sampling, per TABLESAMPLE dialect
+RANDOM_FUNCTIONS = {
+    "postgresql": "random()",
+    "mssql": "NEWID()",
+}
+
+# Dialects with an approximate distinct count aggregate
+APPROX_COUNT_DISTINCT = {
+    "mssql": "APPROX_COUNT_DISTINCT(%s)",
+    "snowflake": "APPROX_COUNT_DISTINCT(%s)",
+    "bigquery": "APPROX_COUNT_DISTINCT(%s)",
+    "presto": "approx_distinct(%s)",
+    "trino": "approx_distinct(%s)",
+}
+
+
+def tablesample_sql(dialect, table, col, n=None, fraction=None, row_estimate=None):
+    """
+    SQL sampling a fraction of table, or n of its rows, with TABLESAMPLE.
+    For n, the percentage is 2n over the estimated row count, and the
+    sampled rows are shuffled before the LIMIT. Where the estimate is
+    missing (e.g., -1 or 0 for a never analyzed PostgreSQL table) or the
+    percentage would reach 100, the whole table is shuffled instead, as a
+    LIMIT alone would return the first rows in physical order.
+    """
+    if n is None:
+        clause = TABLESAMPLE_CLAUSES[dialect] % repr(100.0 * min(fraction, 1.0))
+        return "SELECT %s FROM %s %s" % (col, table, clause)
+
+    source = table
+    if row_estimate is not None and 2.0 * n < row_estimate:
+        percent = 100.0 * 2.0 * n / float(row_estimate)
+        source = "%s %s" % (table, TABLESAMPLE_CLAUSES[dialect] % repr(percent))
+    order_by = "ORDER BY %s" % RANDOM_FUNCTIONS[dialect]
+    if dialect == "mssql":
+        return "SELECT TOP %d %s FROM %s %s" % (n, col, source, order_by)
+    return "SELECT %s FROM %s %s LIMIT %d" % (col, source, order_by, n)
+
+
 # Exceptions
 class QueryDbError(Exception):
     pass
@@ -18,8 +86,44 @@ class NoPrimaryKeyException(Exception):
     pass
 
 
+class UnindexedQueryException(Exception):
+    pass
+
+
+class QueryTimeoutException(Exception):
+    pass
+
+
+class QueryCancelledException(Exception):
+    pass
+
+
+class ResultTooLargeException(Exception):
+    pass
+
+
 # Helper classes
 class QueryDbAttributes(object):
+    """
+    Holder for the tables of a QueryDb, exposed as attributes. When the
+    QueryDb is created with lazy=True, tables are only listed up front and
+    reflected the first time they are accessed.
+    """
+    def __init__(self, db=None, lazy_tables=None):
+        self._db = db
+        self._lazy_tables = set(lazy_tables or [])
+
+    def __getattr__(self, name):
+        # Only called if normal attribute lookup fails, i.e., for
+        # tables that have not been reflected yet
+        if name in self.__dict__.get("_lazy_tables", ()):
+            return self._db._reflect_table(name)
+        raise AttributeError("%s is not a table in this database." % name)
+
+    def __dir__(self):
+        return sorted(set(dir(self.__class__)) | set(self.__dict__.keys()) |
+                      self._lazy_tables)
+
     def _repr_html_(self):
         return QUERY_DB_ATTR_MSG
 
@@ -37,30 +141,44 @@ class QueryDbOrm(object):
     """
     def __init__(self, orm_object, db):
         self._db = db
+        self._statements = {}
         if orm_object.__class__ == sqlalchemy.schema.Table:
             self._is_table = True
             self.table = orm_object
             self.column = None
+        else:
+            self._is_table = False
+            self.table = orm_object.table
+            self.column = orm_object
 
-            # Support custom styling of Pandas dataframe by calling .to_html() over _repr_html()
-            # incl. not displaying dimensions, for example
+        # Built on first display, most tables and columns are never displayed
+        self._column_df = None
+        self._html = None
+
+    def _column_info(self):
+        """
+        Internal helper returning the table's columns, types and primary
+        keys as a DataFrame.
+        """
+        if self._column_df is None:
             self._column_df = pd.DataFrame(
                 [(c.name, c.type, c.primary_key) for c in self.table.columns.values()],
                 columns=["Column", "Type", "Primary Key"]
             )
-            self._html = df_to_html(self._column_df, ("Column Information for the %s Table"
-                                                      % self.table.name))
-
-        else:
-            self._is_table = False
-            self.table = orm_object.table
-            self.column = orm_object
-            self._html = ("<em>Inspecting column %s of the %s table. "
-                          "Try the .head(), .tail(), and .where() "
-                          "methods to further explore.<em>" %
-                          (self.column.name, self.table.name))
+        return self._column_df
 
     def _repr_html_(self):
+        if self._html is None:
+            if self._is_table:
+                # Support custom styling of Pandas dataframe by calling .to_html() over
+                # _repr_html() incl. not displaying dimensions, for example
+                self._html = df_to_html(self._column_info(), ("Column Information for the %s "
+                                                              "Table" % self.table.name))
+            else:
+                self._html = ("<em>Inspecting column %s of the %s table. "
+                              "Try the .head(), .tail(), and .where() "
+                              "methods to further explore.<em>" %
+                              (self.column.name, self.table.name))
         return self._html
 
     def __repr__(self):
@@ -69,24 +187,35 @@ class QueryDbOrm(object):
         else:
             return self.column.__repr__()
 
+    def _key_columns(self, by=None):
+        """
+        Internal helper returning the list of key columns to order by: all
+        primary keys of the table, or the by= column(s) if specified.
+        """
+        if by is not None:
+            return list(by) if isinstance(by, (list, tuple)) else [by]
+
+        primary_keys = list(self.table.primary_key.columns.keys())
+        if not primary_keys:
+            raise NoPrimaryKeyException("Table %s needs a primary key for"
+                                        "the .last() method to work properly. "
+                                        "Alternatively, specify an ORDER BY "
+                                        "column with the by= argument. " %
+                                        self.table.name)
+        return primary_keys
+
     def _query_helper(self, by=None):
         """
         Internal helper for preparing queries.
         """
         if by is None:
-            primary_keys = self.table.primary_key.columns.keys()
+            primary_keys = self._key_columns()
 
             if len(primary_keys) > 1:
                 warnings.warn("WARNING: MORE THAN 1 PRIMARY KEY FOR TABLE %s. "
                               "USING THE FIRST KEY %s." %
                               (self.table.name, primary_keys[0]))
 
-            if not primary_keys:
-                raise NoPrimaryKeyException("Table %s needs a primary key for"
-                                            "the .last() method to work properly. "
-                                            "Alternatively, specify an ORDER BY "
-                                            "column with the by= argument. " %
-                                            self.table.name)
             id_col = primary_keys[0]
         else:
             id_col = by
@@ -98,33 +227,189 @@ class QueryDbOrm(object):
 
         return col, id_col
 
-    def head(self, n=10, by=None, **kwargs):
+    def _query(self, helper, select, select_params=None, **kwargs):
         """
-        Get the first n entries for a given Table/Column. Additional keywords
-        passed to QueryDb.query().
+        Internal helper running a query for this Table/Column through
+        QueryDb.query(), passing the reflected columns and the name of the
+        calling helper (for the query stats) along. Any params= are added
+        to the select's own parameters.
+        """
+        params = dict(select_params or {}, **kwargs.pop("params", {})) or None
+        kwargs.setdefault("columns", self.table.columns)
+        if self.column is None:
+            kwargs.setdefault("label", "%s.%s" % (self.table.name, helper))
+        else:
+            kwargs.setdefault("label", "%s.%s.%s" % (self.table.name, self.column.name, helper))
+        return self._db.query(select, params=params, **kwargs)
+
+    def _indexed_columns(self):
+        """
+        Internal helper returning the (lowercased) names of the columns
+        leading an index of the table, incl. its primary key and unique
+        constraints. Indexes are those reflected with the table, i.e., from
+        the inspector's get_indexes().
+        """
+        indexed = set()
+        for index in self.table.indexes:
+            if len(index.columns):
+                indexed.add(list(index.columns)[0].name.lower())
+        for constraint in self.table.constraints:
+            if isinstance(constraint, (sqlalchemy.schema.PrimaryKeyConstraint,
+                                       sqlalchemy.schema.UniqueConstraint)):
+                if len(constraint.columns):
+                    indexed.add(list(constraint.columns)[0].name.lower())
+        return indexed
+
+    def _where_columns(self, where_string):
+        """
+        Internal helper returning the table's columns referenced in a WHERE
+        clause string, ignoring string literals.
+        """
+        where_string = re.sub(r"'(?:[^']|'')*'", "", where_string)
+        names = set(name.lower() for name in re.findall(r"[A-Za-z_][A-Za-z0-9_]*", where_string))
+        return [c.name for c in self.table.columns if c.name.lower() in names]
+
+    def _check_index(self, operation, columns, index_check=None):
+        """
+        Internal helper warning about, or refusing, a sort or filter on
+        columns none of which lead an index, as it scans the whole table.
+        Does nothing if no columns are given.
+        """
+        if index_check is None:
+            index_check = self._db._index_check
+        if not index_check or not columns:
+            return
+
+        indexed = self._indexed_columns()
+        if any(str(c).lower() in indexed for c in columns):
+            return
+        msg = ("%s on %s.%s cannot use an index and may scan the whole table." %
+               (operation, self.table.name, ", ".join(str(c) for c in columns)))
+        if index_check == "refuse":
+            raise UnindexedQueryException(msg + " Pass index_check=False to run it anyway.")
+        warnings.warn(msg)
+
+    def _select(self):
+        """
+        Internal helper returning a select() of this Table/Column.
+        """
+        return sqlalchemy.select([self.table if self.column is None else self.column])
 
-        Requires that the given table has a primary key specified.
+    def _column_expr(self, name):
+        """
+        Internal helper returning the table's column name, or name as a
+        raw SQL expression if it isn't one.
+        """
+        if name in self.table.columns:
+            return self.table.columns[name]
+        return sqlalchemy.sql.literal_column(name)
+
+    def _statement(self, key, build):
+        """
+        Internal helper returning the SQL and default parameters of one of
+        this Table/Column's helper queries. The statement from build() is
+        compiled on first use and cached under key.
+        """
+        if key not in self._statements:
+            self._statements[key] = self._db._compile(build())
+        return self._statements[key]
+
+    def _order_by_sql(self, n, by, direction):
+        """
+        Internal helper building the .head() and .tail() queries, with the
+        limit as a bound parameter. Returns the SQL and its parameters.
         """
         col, id_col = self._query_helper(by=by)
 
-        select = ("SELECT %s FROM %s ORDER BY %s ASC LIMIT %d" %
-                  (col, self.table.name, id_col, n))
+        def _build():
+            order_by = self._column_expr(id_col)
+            order_by = order_by.asc() if direction == "ASC" else order_by.desc()
+            return self._select().order_by(order_by).limit(sqlalchemy.bindparam("n"))
+
+        select, params = self._statement(("order_by", id_col, direction), _build)
+        return select, dict(params, n=int(n))
+
+    @staticmethod
+    def _is_where_clause(where_string):
+        """
+        Internal helper: is where_string a clause, rather than a value to
+        match against the primary key?
+        """
+        where_operators = ["=", ">", "<", "LIKE", "like"]
+        return np.any([where_string.__contains__(w) for w in where_operators])
+
+    def _where_sql(self, where_string):
+        """
+        Internal helper building the .where() query. Values matched against
+        the primary key are bound parameters. Returns the SQL and its
+        parameters.
+        """
+        col, id_col = self._query_helper(by=None)
+
+        if self._is_where_clause(str(where_string)):  # Coerce here, for .__contains___
+            # Arbitrary clauses aren't cached, but may use their own :params
+            return self._db._compile(self._select().where(sqlalchemy.sql.text(str(where_string))))
+
+        value = python_value(where_string)
+        if isinstance(value, str) and len(value) > 1 and value[0] == value[-1] == "'":
+            value = value[1:-1].replace("''", "'")  # A SQL string literal, e.g., "'AC/DC'"
+        elif isinstance(value, str) and id_col in self.table.columns:
+            value = self._coerce(self.table.columns[id_col], value)
+
+        def _build():
+            return self._select().where(self._column_expr(id_col) == sqlalchemy.bindparam("value"))
+
+        select, params = self._statement(("where", id_col), _build)
+        return select, dict(params, value=value)
+
+    def _coerce(self, column, value):
+        """
+        Internal helper converting a str value to a numeric column's Python
+        type (e.g., "6" to 6 for an INTEGER key), so that it binds with the
+        column's type. Other values are returned as is.
+        """
+        try:
+            python_type = column.type.python_type
+        except NotImplementedError:
+            return value
+        if python_type is bool or not issubclass(python_type, numbers.Number):
+            return value
+        try:
+            return python_type(value)
+        except (ValueError, ArithmeticError):
+            return value
+
+    def head(self, n=10, by=None, **kwargs):
+        """
+        Get the first n entries for a given Table/Column. Additional keywords
+        passed to QueryDb.query(), e.g., return_as="chunks".
+
+        Requires that the given table has a primary key specified. Pass
+        index_check= to override the QueryDb's index_check for this call.
+        """
+        local = self._db._snapshot_orm(self)
+        if local is not None:
+            return local.head(n=n, by=by, **kwargs)
 
-        return self._db.query(select, **kwargs)
+        self._check_index("ORDER BY", self._key_columns(by)[:1], kwargs.pop("index_check", None))
+        select, params = self._order_by_sql(n, by, "ASC")
+        return self._query("head", select, params, **kwargs)
 
     def tail(self, n=10, by=None, **kwargs):
         """
         Get the last n entries for a given Table/Column. Additional keywords
-        passed to QueryDb.query().
+        passed to QueryDb.query(), e.g., return_as="chunks".
 
-        Requires that the given table has a primary key specified.
+        Requires that the given table has a primary key specified. Pass
+        index_check= to override the QueryDb's index_check for this call.
         """
-        col, id_col = self._query_helper(by=by)
+        local = self._db._snapshot_orm(self)
+        if local is not None:
+            return local.tail(n=n, by=by, **kwargs)
 
-        select = ("SELECT %s FROM %s ORDER BY %s DESC LIMIT %d" %
-                  (col, self.table.name, id_col, n))
-
-        return self._db.query(select, **kwargs)
+        self._check_index("ORDER BY", self._key_columns(by)[:1], kwargs.pop("index_check", None))
+        select, params = self._order_by_sql(n, by, "DESC")
+        return self._query("tail", select, params, **kwargs)
 
     def first(self, n=10, by=None, **kwargs):
         """
@@ -143,41 +428,882 @@ class QueryDbOrm(object):
         string. Additional keywords are passed to ExploreSqlDB.query(). For
         convenience, if there is no '=', '>', '<', 'like', or 'LIKE' clause
         in the WHERE statement .where() tries to match the input string
-        against the primary key column of the Table.
+        against the primary key column of the Table, as a bound parameter.
+        Values can be bound in clauses too, e.g.,
+        .where("AlbumId = :album", params={"album": 3}).
 
         Args:
             where_string (str): Where clause for the query against the Table
             or Column
 
         Kwars:
-            **kwargs: Optional **kwargs passed to the QueryDb.query() call
+            index_check (str or bool): Override the QueryDb's index_check
+            for this call.
+
+            **kwargs: Optional **kwargs passed to the QueryDb.query() call,
+            e.g., return_as="chunks" and chunksize=
 
         Returns:
-            result (pandas.DataFrame or sqlalchemy ResultProxy): Query result
-            as a DataFrame (default) or sqlalchemy result.
+            result (pandas.DataFrame, sqlalchemy ResultProxy or generator):
+            Query result as a DataFrame (default), sqlalchemy result or
+            generator of DataFrame chunks.
+
+        Raises:
+            UnindexedQueryException
         """
-        col, id_col = self._query_helper(by=None)
+        local = self._db._snapshot_orm(self)
+        if local is not None:
+            return local.where(where_string, **kwargs)
 
-        where_string = str(where_string)  # Coerce here, for .__contains___
-        where_operators = ["=", ">", "<", "LIKE", "like"]
-        if np.any([where_string.__contains__(w) for w in where_operators]):
-            select = ("SELECT %s FROM %s WHERE %s" %
-                      (col, self.table.name, where_string))
+        if self._is_where_clause(str(where_string)):
+            columns = self._where_columns(str(where_string))
         else:
-            select = ("SELECT %s FROM %s WHERE %s = %s" %
-                      (col, self.table.name, id_col, where_string))
+            columns = self._key_columns()[:1]
+        self._check_index("WHERE", columns, kwargs.pop("index_check", None))
+        select, params = self._where_sql(where_string)
+        return self._query("where", select, params, **kwargs)
+
+    def fetch(self, partitions=4, workers=None, by=None, return_as="dataframe", **kwargs):
+        """
+        Fetch the whole Table/Column by splitting the range of its primary
+        key (or by= column) into partitions and fetching them concurrently
+        over the engine's connection pool. Additional keywords passed to
+        QueryDb.query().
+
+        Kwargs:
+            partitions (int): Number of key ranges to split the table into.
 
-        return self._db.query(select, **kwargs)
+            workers (int): Number of concurrent fetches. Defaults to
+            partitions.
+
+            by (str): Numeric column to partition on. Defaults to the first
+            primary key. Rows where it is NULL are not fetched.
+
+            return_as (str): "dataframe" to concatenate the parts in key
+            order, or "parts" for a lazy list of the parts' DataFrames,
+            which blocks on access until that part has been fetched.
+
+        Returns:
+            result (pandas.DataFrame or LazyParts)
+
+        Raises:
+            QueryDbError
+        """
+        if return_as.upper() not in ["DF", "DATAFRAME", "PARTS"]:
+            raise QueryDbError("fetch() can only return a dataframe or parts.")
+
+        col, id_col = self._query_helper(by=by)
+        min_key, max_key = self._db._fetchone("SELECT MIN(%s), MAX(%s) FROM %s" %
+                                              (id_col, id_col, self.table.name))
+
+        if min_key is None:  # Empty table
+            selects = ["SELECT %s FROM %s" % (col, self.table.name)]
+        else:
+            try:
+                bounds = partition_bounds(min_key, max_key, partitions)
+            except TypeError:
+                raise QueryDbError("fetch() requires a numeric key, %s is not. Specify a "
+                                   "numeric column with the by= argument." % id_col)
+            selects = []
+            for i, (lower, upper) in enumerate(bounds):
+                upper_op = "<=" if i == len(bounds) - 1 else "<"
+                lower, upper = [repr(b) if isinstance(b, float) else str(b)
+                                for b in (lower, upper)]
+                selects.append("SELECT %s FROM %s WHERE %s >= %s AND %s %s %s ORDER BY %s ASC" %
+                               (col, self.table.name, id_col, lower, id_col, upper_op,
+                                upper, id_col))
+
+        # Compact the concatenated result, so all parts share dtypes
+        compact = kwargs.pop("compact", False) and return_as.upper() != "PARTS"
+
+        executor = ThreadPoolExecutor(max_workers=workers or len(selects))
+        futures = [executor.submit(self._query, "fetch", select, **kwargs) for select in selects]
+        executor.shutdown(wait=False)  # Already submitted parts still run
+
+        parts = LazyParts(futures)
+        if return_as.upper() == "PARTS":
+            return parts
+        df = pd.concat(list(parts), ignore_index=True)
+        if compact:
+            df = compact_df(df, columns=self.table.columns)
+        return df
+
+    def export(self, path, format=None, **kwargs):
+        """
+        Stream the whole Table/Column to Parquet or CSV files in batches,
+        with bounded memory. Additional keywords passed to
+        QueryDb.export_query(), e.g., compression= or max_rows_per_file=.
+
+        Args:
+            path (str): Output file.
+
+        Kwargs:
+            format (str): "parquet" or "csv". Defaults to the format of
+            path's extension.
+
+        Returns:
+            paths (list): The files written.
+        """
+        select, params = self._statement(("export",), self._select)
+        kwargs.setdefault("columns", self.table.columns)
+        return self._db.export_query(select, path, format=format, params=params, **kwargs)
+
+    def materialize(self, local_path=None, by=None, full=False,
+                    batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Copy the table into a local snapshot, or bring an existing snapshot
+        up to date, see .refresh(). Snapshots in the QueryDb's snapshot
+        database answer .head(), .tail() and .where() locally.
+
+        Kwargs:
+            local_path (str): Local SQLite database (any extension, can hold
+            several tables) or Parquet file (.parquet or .pq). Defaults to
+            the QueryDb's snapshot database.
+
+            by (str): Column whose high-water mark is kept for refreshes.
+            Defaults to the first primary key, which suits append-only
+            tables. Use an updated_at style column to also pick up updated
+            rows.
+
+            full (bool): Copy the whole table, even if a snapshot exists.
+
+            batch_size (int): Number of rows fetched at a time.
+
+        Returns:
+            snapshot (query.snapshot.Snapshot)
+
+        Raises:
+            QueryDbError
+        """
+        local_path = local_path or self._db._snapshot_path
+        if local_path is None:
+            raise QueryDbError("Specify a local_path, or open the QueryDb with snapshot=.")
+
+        key = by
+        if key is None and open_store(local_path).load_meta(self.table.name) is None:
+            key = self._key_columns()[0]
+        snapshot = Snapshot(self.table, self._db._engine, local_path, key=key,
+                            batch_size=batch_size)
+        snapshot.refresh(full=full)
+        self._db._snapshots[(self.table.name, local_path)] = snapshot
+        if local_path == self._db._snapshot_path:
+            self._db._snapshot_db = None  # Reflect the new table on next use
+        return snapshot
+
+    def refresh(self, full=False, local_path=None):
+        """
+        Fetch the rows added (or, for an updated_at style key, updated)
+        since the last .materialize() or .refresh() of the table's snapshot,
+        i.e., past its stored high-water mark.
+
+        Kwargs:
+            full (bool): Copy the whole table again.
+
+            local_path (str): The snapshot to refresh. Defaults to the
+            QueryDb's snapshot database.
+
+        Returns:
+            rows (int): Number of rows fetched.
+
+        Raises:
+            QueryDbError
+        """
+        local_path = local_path or self._db._snapshot_path
+        if local_path is None:
+            raise QueryDbError("Specify a local_path, or open the QueryDb with snapshot=.")
+
+        snapshot = self._db._snapshots.get((self.table.name, local_path))
+        if snapshot is None:
+            if open_store(local_path).load_meta(self.table.name) is None:
+                raise QueryDbError("%s has no snapshot in %s, call .materialize() first." %
+                                   (self.table.name, local_path))
+            snapshot = Snapshot(self.table, self._db._engine, local_path)
+            self._db._snapshots[(self.table.name, local_path)] = snapshot
+        return snapshot.refresh(full=full)
+
+    def iter_pages(self, page_size=1000, by=None, descending=False, **kwargs):
+        """
+        Iterate over the Table/Column in pages of page_size rows using
+        keyset pagination, i.e., each page is selected with
+        `WHERE key > last_seen_key ORDER BY key LIMIT page_size`, so every
+        page costs the same no matter how deep into the table it is.
+        Additional keywords passed to QueryDb.query().
+
+        Kwargs:
+            page_size (int): Number of rows per page.
+
+            by (str or list): Column(s) to paginate on. Must uniquely
+            identify rows. Defaults to all primary keys of the table.
+
+            descending (bool): Walk the table from the last key backwards.
+
+        Returns:
+            generator: Yields a pandas.DataFrame per page.
+        """
+        keys = self._key_columns(by=by)
+        if self.column is None:
+            col = "*"
+        else:
+            col = ", ".join([self.column.name] + [k for k in keys if k != self.column.name])
+
+        direction, op = ("DESC", "<") if descending else ("ASC", ">")
+        order_by = ", ".join("%s %s" % (k, direction) for k in keys)
+
+        last_seen = None
+        while True:
+            if last_seen is None:
+                where, params = "", None
+            else:
+                where, params = self._keyset_clause(keys, last_seen, op)
+                where = " WHERE %s" % where
+            page = self._query("iter_pages",
+                               "SELECT %s FROM %s%s ORDER BY %s LIMIT %d" %
+                               (col, self.table.name, where, order_by, page_size),
+                               params, **kwargs)
+            if len(page) == 0:
+                return
+
+            last_seen = [python_value(page[k].iloc[-1]) for k in keys]
+            if self.column is not None:
+                page = page[[self.column.name]]
+            yield page
+
+            if len(page) < page_size:
+                return
+
+    def follow(self, poll_interval=1.0, by=None, max_interval=60.0, backoff=2.0, since=None,
+               page_size=10000, **kwargs):
+        """
+        Follow an append-only Table/Column, like `tail -f`. Polls for rows
+        whose key is past the highest key seen so far, so rows are never
+        fetched or sorted twice. Additional keywords passed to
+        QueryDb.query(); results are never cached.
+
+        Kwargs:
+            poll_interval (float): Seconds between polls while new rows
+            keep arriving.
+
+            by (str): Increasing column to follow, e.g., an auto-incremented
+            id or an insertion timestamp. Defaults to the first primary key.
+
+            max_interval (float): Polls that find no new rows back off,
+            multiplying the interval by backoff up to this many seconds. The
+            interval is reset once rows arrive.
+
+            backoff (float): Factor the poll interval grows by.
+
+            since: Key to follow from. Defaults to the current maximum key,
+            i.e., only rows added after the call are yielded.
+
+            page_size (int): Maximum number of rows per DataFrame.
+
+        Returns:
+            generator: Yields a pandas.DataFrame of new rows per poll that
+            finds any.
+        """
+        col, id_col = self._query_helper(by=by)
+        self._check_index("ORDER BY", [id_col], kwargs.pop("index_check", None))
+        if since is None:
+            since = self._db._fetchone("SELECT MAX(%s) FROM %s" % (id_col, self.table.name))[0]
+        kwargs["cache"] = False
+        return self._follow(id_col, since, poll_interval, max_interval, backoff, page_size,
+                            kwargs)
+
+    def _follow(self, id_col, last_seen, poll_interval, max_interval, backoff, page_size,
+                kwargs):
+        """
+        Internal generator polling for new rows, see .follow().
+        """
+        key = self._column_expr(id_col)
+        columns = [self.table if self.column is None else self.column]
+        if self.column is not None and self.column.name != id_col:
+            columns.append(key)  # To track the last seen key
+
+        def _build(after):
+            select = sqlalchemy.select(columns)
+            if after:
+                select = select.where(key > sqlalchemy.bindparam("after"))
+            return select.order_by(key.asc()).limit(sqlalchemy.bindparam("n"))
+
+        interval = poll_interval
+        while True:
+            if last_seen is None:  # Empty table so far
+                select, params = self._statement(("follow", id_col, False),
+                                                 lambda: _build(False))
+            else:
+                select, params = self._statement(("follow", id_col, True),
+                                                 lambda: _build(True))
+                params = dict(params, after=last_seen)
+            rows = self._query("follow", select, dict(params, n=int(page_size)), **kwargs)
+
+            if len(rows):
+                last_seen = python_value(rows[id_col].iloc[-1])
+                interval = poll_interval
+                if self.column is not None and self.column.name != id_col:
+                    rows = rows[[self.column.name]]
+                yield rows
+                if len(rows) == page_size:
+                    continue  # More rows may be waiting
+
+            time.sleep(interval)
+            if not len(rows):
+                interval = min(interval * backoff, max_interval)
+
+    def _keyset_clause(self, keys, values, op):
+        """
+        Internal helper for the WHERE clause selecting rows after the given
+        composite key, i.e., (k1, k2, ...) > (v1, v2, ...) expanded as
+        k1 > v1 OR (k1 = v1 AND k2 > v2) OR ... for portability. Returns the
+        clause and its bound parameters, last_seen0, last_seen1, ...
+        """
+        clauses = []
+        for i in range(len(keys)):
+            terms = ["%s = :last_seen%d" % (keys[j], j) for j in range(i)]
+            terms.append("%s %s :last_seen%d" % (keys[i], op, i))
+            clauses.append("(%s)" % " AND ".join(terms))
+        params = dict(("last_seen%d" % i, v) for i, v in enumerate(values))
+        return " OR ".join(clauses), params
+
+    def sample(self, n=None, fraction=None, method=None, by=None, seed=None, **kwargs):
+        """
+        Get a random sample of the Table/Column, with the sampling pushed
+        down to the database so that the work done scales with the sample
+        size rather than the table size. Additional keywords passed to
+        QueryDb.query().
+
+        Kwargs:
+            n (int): Number of rows to sample.
+
+            fraction (float): Fraction of rows to sample, instead of n.
+
+            method (str): How to sample:
+            - "tablesample": TABLESAMPLE clause (PostgreSQL, SQL Server)
+            - "rowid": random rowid lookups (SQLite)
+            - "keys": random probes into the range of a numeric primary key
+              (or by= column), each fetching the next row after the probe.
+              Rows following large key gaps are more likely to be sampled.
+            Defaults to "tablesample" or "rowid" where supported, else "keys".
+
+            by (str): Unique, numeric column to probe with method="keys".
+            Defaults to the first primary key.
+
+            seed (int): Seed for the random probes.
+
+        Returns:
+            result (pandas.DataFrame): At most n rows, in no particular order.
+
+        Raises:
+            QueryDbError
+        """
+        if (n is None) == (fraction is None):
+            raise QueryDbError("sample() requires exactly one of n= or fraction=.")
+
+        dialect = self._db._engine.name
+        if method is None:
+            if dialect in TABLESAMPLE_CLAUSES:
+                method = "tablesample"
+            elif dialect == "sqlite":
+                method = "rowid"
+            else:
+                method = "keys"
+
+        col = "*" if self.column is None else self.column.name
+        rand = random.Random(seed)
+        if method == "tablesample":
+            if dialect not in TABLESAMPLE_CLAUSES:
+                raise QueryDbError("TABLESAMPLE is not supported for %s." % dialect)
+            return self._sample_tablesample(col, n, fraction, **kwargs)
+        elif method == "rowid":
+            if dialect != "sqlite":
+                raise QueryDbError("rowid sampling is only supported for SQLite.")
+            return self._sample_probes(col, "rowid", n, fraction, rand, **kwargs)
+        elif method == "keys":
+            id_col = self._unique_key(by)
+            return self._sample_probes(col, id_col, n, fraction, rand, **kwargs)
+        else:
+            raise QueryDbError("Unknown sampling method %s." % method)
+
+    def _unique_key(self, by=None):
+        """
+        Internal helper returning the single column that uniquely identifies
+        rows, for sampling by keys: by=, or else the primary key. Raises a
+        QueryDbError for composite primary keys, as probing only their first
+        column would sample one row per value of it, and warns if by= isn't
+        known to be unique (from the reflected constraints and indexes).
+        """
+        if by is None:
+            keys = self._key_columns()
+            if len(keys) > 1:
+                raise QueryDbError("Sampling by keys requires a single-column key, the primary "
+                                   "key of %s is (%s). Specify a unique, numeric column with "
+                                   "the by= argument." % (self.table.name, ", ".join(keys)))
+            return keys[0]
+
+        unique = set()
+        if len(self.table.primary_key.columns) == 1:
+            unique.update(self.table.primary_key.columns.keys())
+        unique.update(c.name for c in self.table.columns if c.unique)
+        for index in self.table.indexes:
+            if index.unique and len(index.columns) == 1:
+                unique.update(index.columns.keys())
+        for constraint in self.table.constraints:
+            if isinstance(constraint, sqlalchemy.UniqueConstraint) and len(constraint.columns) == 1:
+                unique.update(constraint.columns.keys())
+        if by not in unique:
+            warnings.warn("%s.%s is not known to be unique. Sampling by a non-unique key "
+                          "returns at most one row per value." % (self.table.name, by))
+        return by
+
+    def _sample_tablesample(self, col, n, fraction, **kwargs):
+        """
+        Internal helper for TABLESAMPLE sampling.
+        """
+        if fraction is None:
+            # Estimated row count from the catalog, oversampling to make up
+            # for the variance of block sampling
+            if self._db._engine.name == "postgresql":
+                row_estimate = self._db._fetchone(
+                    "SELECT reltuples FROM pg_class WHERE relname = %s" %
+                    self._db._sql_literal(self.table.name))[0]
+            else:
+                row_estimate = self._db._fetchone(
+                    "SELECT SUM(row_count) FROM sys.dm_db_partition_stats "
+                    "WHERE object_id = OBJECT_ID(%s) AND index_id < 2" %
+                    self._db._sql_literal(self.table.name))[0]
+        else:
+            row_estimate = None
+        select = tablesample_sql(self._db._engine.name, self.table.name, col, n=n,
+                                 fraction=fraction, row_estimate=row_estimate)
+        return self._query("sample", select, **kwargs)
+
+    def _sample_probes(self, col, key, n, fraction, rand, max_rounds=5, probes_per_query=200,
+                       **kwargs):
+        """
+        Internal helper sampling with random probes into the range of a
+        numeric key (or rowid). Each probe is an index seek for the first
+        row at or after a random key, batched into UNION ALL queries.
+        """
+        min_key, max_key = self._db._fetchone("SELECT MIN(%s), MAX(%s) FROM %s" %
+                                              (key, key, self.table.name))
+        if min_key is None:  # Empty table
+            return self._query("sample", "SELECT %s FROM %s WHERE 1 = 0" %
+                               (col, self.table.name), **kwargs)
+        if not isinstance(min_key, numbers.Number) or not isinstance(max_key, numbers.Number):
+            raise QueryDbError("Sampling by keys requires a numeric key, %s is not. "
+                               "Specify a numeric column with the by= argument." % key)
+        if n is None:
+            # Estimate the row count from the key range
+            n = max(1, int(round(fraction * float(max_key - min_key + 1))))
+
+        # Probes select the first row with key > probe. For integer keys,
+        # probing from min_key - 1 gives every key in a dense range the
+        # same chance of being picked.
+        if isinstance(min_key, numbers.Integral):
+            min_key -= 1
+        min_key, max_key = float(min_key), float(max_key)
+
+        key_alias = "_query_sample_key"
+        probe_sql = ("SELECT * FROM (SELECT %s, %s AS %s FROM %s WHERE %s > %%r "
+                     "ORDER BY %s LIMIT 1) AS p%%d" %
+                     (col, key, key_alias, self.table.name, key, key))
+
+        samples, seen = [], set()
+        for _ in range(max_rounds):
+            # Oversample to make up for probes landing in the same key gap
+            n_probes = int(1.25 * (n - len(seen))) + 1
+            probes = sorted(rand.uniform(min_key, max_key) for _ in range(n_probes))
+            for start in range(0, n_probes, probes_per_query):
+                select = " UNION ALL ".join(
+                    probe_sql % (probe, i)
+                    for i, probe in enumerate(probes[start:start + probes_per_query]))
+                df = self._query("sample", select, **kwargs)
+
+                df = df[~df[key_alias].isin(seen)].drop_duplicates(key_alias)
+                samples.append(df.iloc[:n - len(seen)])
+                seen.update(samples[-1][key_alias])
+            if len(seen) >= n:
+                break
+
+        return pd.concat(samples, ignore_index=True).drop(key_alias, axis=1)
+
+    def describe(self, approx=None):
+        """
+        Profile the Table/Column on the server with a single aggregate
+        query: row count, null count, min/max, mean for numeric columns and
+        distinct count of each column.
+
+        Kwargs:
+            approx (bool): Use an approximate distinct count. Defaults to
+            None, which uses one if the dialect has it (e.g., SQL Server's
+            APPROX_COUNT_DISTINCT) and an exact COUNT(DISTINCT) otherwise.
+
+        Returns:
+            result (pandas.DataFrame): One row per column, extending the
+            Table's column information (Column, Type, Primary Key).
+        """
+        dialect = self._db._engine.name
+        if approx and dialect not in APPROX_COUNT_DISTINCT:
+            raise QueryDbError("No approximate distinct count for %s." % dialect)
+        distinct_sql = (APPROX_COUNT_DISTINCT[dialect] if approx is not False and
+                        dialect in APPROX_COUNT_DISTINCT else "COUNT(DISTINCT %s)")
+
+        if self.column is None:
+            columns = list(self.table.columns.values())
+        else:
+            columns = [self.column]
+
+        # One expression per statistic and column, None if not applicable
+        aggregates = ["COUNT(*)"]
+        for c in columns:
+            kind = column_kind(c.type)
+            comparable = (kind in ["int", "float", "datetime"] or
+                          isinstance(c.type, sqlalchemy.types.String))
+            countable = not isinstance(c.type, (sqlalchemy.types.LargeBinary,
+                                                sqlalchemy.types.JSON))
+            aggregates.extend([
+                "COUNT(%s)" % c.name,
+                "MIN(%s)" % c.name if comparable else None,
+                "MAX(%s)" % c.name if comparable else None,
+                "AVG(%s)" % c.name if kind in ["int", "float"] else None,
+                distinct_sql % c.name if countable else None,
+            ])
+
+        row = self._db._fetchone("SELECT %s FROM %s" %
+                                 (", ".join(a for a in aggregates if a is not None),
+                                  self.table.name))
+        values = iter(row)
+        results = [None if a is None else next(values) for a in aggregates]
+
+        n_rows = results[0]
+        stats = []
+        for i, c in enumerate(columns):
+            count, min_value, max_value, mean, distinct = results[1 + 5 * i:6 + 5 * i]
+            stats.append((c.name, c.type, c.primary_key, count, n_rows - count,
+                          min_value, max_value, mean, distinct))
+
+        return pd.DataFrame(stats, columns=["Column", "Type", "Primary Key", "Count",
+                                            "Nulls", "Min", "Max", "Mean", "Distinct"])
+
+    def _require_column(self, helper):
+        """
+        Internal helper raising a QueryDbError for Column-only helpers.
+        """
+        if self.column is None:
+            raise QueryDbError(".%s() requires a Column, e.g., db.inspect.Track.GenreId."
+                               % helper)
+
+    def value_counts(self, normalize=False, sort=True, ascending=False, dropna=True, n=None,
+                     **kwargs):
+        """
+        Count the rows of each distinct value of a Column with a GROUP BY on
+        the server. Additional keywords passed to QueryDb.query().
+
+        Kwargs:
+            normalize (bool): Return proportions of all (non-NULL with
+            dropna) rows instead of counts.
+
+            sort (bool): Sort by count, else by value.
+
+            ascending (bool): Sort in ascending order.
+
+            dropna (bool): Leave out NULL.
+
+            n (int): Only return the n most (or least) common values.
+
+        Returns:
+            result (pandas.Series): Counts (named "count") or proportions
+            ("proportion") indexed by value, like pandas'
+            Series.value_counts().
+        """
+        self._require_column("value_counts")
+        count = sqlalchemy.func.count().label("count")
+        select = sqlalchemy.select([self.column, count]).group_by(self.column)
+        if dropna:
+            select = select.where(self.column.isnot(None))
+        if sort:
+            select = select.order_by(count.asc() if ascending else count.desc(), self.column)
+        else:
+            select = select.order_by(self.column)
+        if n is not None:
+            select = select.limit(int(n))
+
+        select, params = self._db._compile(select)
+        df = self._query("value_counts", select, params, **kwargs)
+        counts = df.set_index(self.column.name)["count"]
+        if normalize:
+            if n is None:
+                total = counts.sum()
+            else:
+                total = self._db._fetchone(
+                    "SELECT COUNT(%s) FROM %s" % (self.column.name if dropna else "*",
+                                                  self.table.name))[0]
+            counts = (counts / float(total)).rename("proportion")
+        return counts
+
+    def nunique(self, dropna=True, **kwargs):
+        """
+        Number of distinct values of a Column, or of each of a Table's
+        columns, counted on the server. Additional keywords passed to
+        QueryDb.query().
+
+        Kwargs:
+            dropna (bool): Don't count NULL as a value.
+
+        Returns:
+            result (int or pandas.Series): For a Column, or a Table (indexed
+            by column name), like pandas' nunique().
+        """
+        columns = [self.column] if self.column is not None else list(self.table.columns.values())
+        aggregates = []
+        for i, c in enumerate(columns):
+            distinct = sqlalchemy.func.count(sqlalchemy.distinct(c))
+            if not dropna:
+                distinct = distinct + sqlalchemy.func.max(
+                    sqlalchemy.case([(c.is_(None), 1)], else_=0))
+            aggregates.append(distinct.label("_n%d" % i))
+
+        select, params = self._db._compile(sqlalchemy.select(aggregates))
+        df = self._query("nunique", select, params, **kwargs)
+        counts = pd.Series([int(v) for v in df.iloc[0]], index=[c.name for c in columns])
+        return counts.iloc[0] if self.column is not None else counts
+
+    def histogram(self, bins=10, range=None, **kwargs):
+        """
+        Histogram of a numeric Column, with the rows binned and counted on
+        the server. Additional keywords passed to QueryDb.query().
+
+        Kwargs:
+            bins (int or list): Number of equal-width bins, or the bin
+            edges. As for numpy.histogram(), bins include their left edge
+            and the last bin also its right edge.
+
+            range (tuple): (min, max) of the bins. Defaults to the Column's
+            min and max. Values outside the bins are left out.
+
+        Returns:
+            result (pandas.Series): Counts (named "count"), incl. empty
+            bins, indexed by a pandas.IntervalIndex of the bins.
+        """
+        self._require_column("histogram")
+        if range is None and np.isscalar(bins):
+            range = self._db._fetchone("SELECT MIN(%s), MAX(%s) FROM %s" %
+                                       (self.column.name, self.column.name, self.table.name))
+            if range[0] is None:  # No values
+                range = (0.0, 1.0)
+        edges = histogram_edges(bins, *(range or (None, None)))
+
+        bucket = bucket_expr(self.column, edges, equal_width=np.isscalar(bins),
+                             dialect=self._db._engine.name).label("bin")
+        select = (sqlalchemy.select([bucket, sqlalchemy.func.count().label("count")])
+                  .where(self.column >= edges[0]).where(self.column <= edges[-1])
+                  .group_by(bucket))
+
+        select, params = self._db._compile(select)
+        df = self._query("histogram", select, params, **kwargs)
+        counts = np.zeros(len(edges) - 1, dtype=np.int64)
+        # Rounding errors can put values next to the last edge one bin too far
+        bins = np.clip(df["bin"].astype(int).values, 0, len(counts) - 1)
+        np.add.at(counts, bins, df["count"].values)
+        return pd.Series(counts, index=pd.IntervalIndex.from_breaks(edges, closed="left"),
+                         name="count")
+
+    def groupby(self, by, where=None, dropna=True, sort=True):
+        """
+        Group the Table/Column's rows for aggregation on the server, e.g.,
+        db.inspect.Track.groupby("AlbumId").agg({"Milliseconds": "sum"}) or
+        db.inspect.Invoice.Total.groupby("DATE(InvoiceDate)").sum().
+
+        Args:
+            by (str or list): Column name(s) or SQL expression(s) to group by.
+
+        Kwargs:
+            where (str): WHERE clause applied before grouping.
+
+            dropna (bool): Leave out groups whose key is NULL.
+
+            sort (bool): Sort the groups by key.
+
+        Returns:
+            result (QueryDbGroupBy): See query.aggregate.QueryDbGroupBy.
+        """
+        return QueryDbGroupBy(self, by, where=where, dropna=dropna, sort=sort)
+
+    def related(self, df, via=None, method=None, batch_size=None,
+                temp_table_threshold=TEMP_TABLE_THRESHOLD, **kwargs):
+        """
+        Fetch the rows of this Table/Column related to the rows of df through
+        a foreign key, with a few batched queries instead of one .where() per
+        row, e.g., db.inspect.Album.related(tracks) for the albums of some
+        tracks or db.inspect.Track.related(albums) for the tracks of some
+        albums. Additional keywords passed to QueryDb.query().
+
+        Args:
+            df (pandas.DataFrame): Rows of the table on the other side of
+            the foreign key, incl. its key column(s).
+
+        Kwargs:
+            via (str): The table of df, or "Table.column" for its key column,
+            e.g., "Employee.ReportsTo" for the managers of employees.
+            Required if several foreign keys match the columns of df.
+
+            method (str): How keys are sent:
+            - "in": IN lists, chunked to stay under the dialect's bound
+              parameter limit
+            - "temp_table": keys are inserted into a temporary table that
+              is joined (SQLite, PostgreSQL and MySQL)
+            Defaults to "temp_table" for more than temp_table_threshold keys
+            where supported, else "in".
+
+            batch_size (int): Keys per IN list. Defaults to as many as the
+            dialect's parameter limit allows.
+
+        Returns:
+            result (pandas.DataFrame): The related rows, in no particular
+            order.
+
+        Raises:
+            QueryDbError
+        """
+        path = self._foreign_key_path(df, via)
+        keys = key_values(df, path.source_columns)
+        target = [self.table.columns[c] for c in path.target_columns]
+
+        dialect = self._db._engine.name
+        if method is None:
+            method = ("temp_table" if len(keys) > temp_table_threshold and
+                      dialect in TEMP_TABLE_DIALECTS else "in")
+        if method == "temp_table":
+            if dialect not in TEMP_TABLE_DIALECTS:
+                raise QueryDbError("Temporary tables are not supported for %s." % dialect)
+            return self._related_temp_table(target, keys, **kwargs)
+        elif method != "in":
+            raise QueryDbError("Unknown method %s, use \"in\" or \"temp_table\"." % method)
+
+        if not keys:
+            select, params = self._db._compile(self._select().where(sqlalchemy.false()))
+            return self._query("related", select, params, **kwargs)
+
+        batch_size = batch_size or PARAMETER_LIMITS.get(dialect, DEFAULT_PARAMETER_LIMIT)
+        batch_size = max(1, batch_size // len(target))
+        parts = []
+        for start in range(0, len(keys), batch_size):
+            batch = keys[start:start + batch_size]
+            select, params = self._statement(("related", repr(path), len(batch)),
+                                             lambda: self._related_select(target, len(batch)))
+            params = dict(params)
+            for i, key in enumerate(batch):
+                if len(target) == 1:
+                    params["k%d" % i] = key
+                else:
+                    params.update(("k%d_%d" % (i, j), v) for j, v in enumerate(key))
+            parts.append(self._query("related", select, params, **kwargs))
+        return pd.concat(parts, ignore_index=True)
+
+    def _foreign_key_path(self, df, via):
+        """
+        Internal helper picking the ForeignKeyPath for .related(): the one
+        via names or else the only one whose columns are all in df.
+        """
+        if via is not None:
+            try:  # Reflects the table in lazy mode
+                getattr(self._db.inspect, via.partition(".")[0])
+            except AttributeError:
+                raise QueryDbError("%s is not a table in this database." % via.partition(".")[0])
+
+        paths = foreign_key_paths(self.table, list(self._db._meta.tables.values()))
+        if via is not None:
+            matching = [p for p in paths if p.matches(via)]
+        else:
+            matching = [p for p in paths if all(c in df.columns for c in p.source_columns)]
+        if len(matching) != 1:
+            raise QueryDbError("%s foreign keys of %s match, specify one with via= from: %s." %
+                               ("No" if not matching else "Several", self.table.name,
+                                ", ".join(repr(p) for p in (matching or paths)) or "none"))
+        return matching[0]
+
+    def _related_select(self, target, n):
+        """
+        Internal helper building the select of .related() for n keys, as
+        bound parameters k0, k1, ... (k0_0, k0_1, ... for composite keys).
+        """
+        if len(target) == 1:
+            clause = target[0].in_([sqlalchemy.bindparam("k%d" % i) for i in range(n)])
+        else:
+            clause = sqlalchemy.tuple_(*target).in_([
+                sqlalchemy.tuple_(*[sqlalchemy.bindparam("k%d_%d" % (i, j))
+                                    for j in range(len(target))])
+                for i in range(n)])
+        return self._select().where(clause)
+
+    def _related_temp_table(self, target, keys, **kwargs):
+        """
+        Internal helper for .related(method="temp_table"): inserts the keys
+        into a temporary table and joins it, all on one connection. Only
+        the timeout and size limits of the keywords apply.
+        """
+        tmp = sqlalchemy.Table(TEMP_TABLE_NAME, sqlalchemy.MetaData(),
+                               *[sqlalchemy.Column("k%d" % j, c.type)
+                                 for j, c in enumerate(target)],
+                               prefixes=["TEMPORARY"])
+        join = self.table.join(tmp, sqlalchemy.and_(*[c == tmp.c["k%d" % j]
+                                                      for j, c in enumerate(target)]))
+        select, params = self._db._compile(self._select().select_from(join))
+        limits = self._db._limits.merge(**dict((k, v) for k, v in kwargs.items()
+                                               if k in ["timeout", "max_rows", "max_bytes",
+                                                        "on_limit"]))
+
+        rows = [dict(("k%d" % j, v) for j, v in enumerate(key if len(target) > 1 else (key,)))
+                for key in keys]
+        with self._db._engine.begin() as conn:
+            tmp.create(conn)
+            try:
+                for start in range(0, len(rows), DEFAULT_BATCH_SIZE):
+                    conn.execute(tmp.insert(), rows[start:start + DEFAULT_BATCH_SIZE])
+                return self._db._to_df(sqlalchemy.sql.text(select), conn, params=params,
+                                       limits=limits)
+            finally:
+                tmp.drop(conn)
+
+    def ahead(self, n=10, by=None, **kwargs):
+        """
+        Async version of .head(), to be awaited. Additional keywords
+        passed to QueryDb.aquery().
+        """
+        select, params = self._order_by_sql(n, by, "ASC")
+        return self._db.aquery(select, params=params, **kwargs)
+
+    def atail(self, n=10, by=None, **kwargs):
+        """
+        Async version of .tail(), to be awaited. Additional keywords
+        passed to QueryDb.aquery().
+        """
+        select, params = self._order_by_sql(n, by, "DESC")
+        return self._db.aquery(select, params=params, **kwargs)
+
+    def awhere(self, where_string, **kwargs):
+        """
+        Async version of .where(), to be awaited. Additional keywords
+        passed to QueryDb.aquery().
+        """
+        select, params = self._where_sql(where_string)
+        params.update(kwargs.pop("params", {}))
+        return self._db.aquery(select, params=params, **kwargs)
 
 
 class QueryDb(object):
     """
     A database object for interactively exploring a SQL database.
     """
+    _orm_class = QueryDbOrm
+
     def __init__(self, drivername=None, database=None,
                  host=None, port=None,
                  password=None, username=None,
-                 use_env_vars=True, demo=False):
+                 use_env_vars=True, demo=False, lazy=False,
+                 schema_cache=None, result_cache=None, async_drivername=None,
+                 fetch_engine="pandas", show_table_stats=True, table_stats_ttl=3600,
+                 instrumentation=None, index_check="warn", snapshot=None,
+                 timeout=None, max_rows=None, max_bytes=None, on_limit="raise", url=None):
         """
         Initialize and test the connection.
 
@@ -197,12 +1323,85 @@ class QueryDb(object):
 
            use_env_vars (bool): Use environmental variables if specified?
 
+           lazy (bool): Only list table names up front and reflect each
+           table's columns and keys the first time it is accessed on
+           .inspect. Recommended for databases with many tables.
+
+           schema_cache (bool or str): Cache the reflected schema on disk and
+           reuse it on later startups until the schema changes. Pass True to
+           use the default cache directory (~/.query/schema_cache) or a
+           directory path. Defaults to None (no caching). Changes are
+           detected from the file's mtime for SQLite (in-memory databases
+           aren't cached), a catalog query for PostgreSQL and MySQL, and
+           the columns' names, types and nullability for other databases.
+           Changes to keys, indexes or constraints alone are only detected
+           for SQLite; call .refresh_schema() after them.
+
+           result_cache (bool or ResultCache): Cache DataFrame results of
+           .query() (and so .head(), .tail() and .where()). Pass True for an
+           in-memory LRU cache with default settings, or a configured
+           ResultCache, e.g., with a TTL or an on-disk tier. Defaults to None
+           (no caching).
+
+           async_drivername (str): Drivername of the async engine used by
+           .aquery() and the other async methods, e.g., "postgresql+asyncpg".
+           Defaults to None, which picks a driver based on drivername.
+
+           fetch_engine (str): Default fetch engine of .query(), "pandas"
+           or "columnar". See .query().
+
+           show_table_stats (bool): Add row counts and sizes to the database
+           summary. They are computed when the summary is first displayed,
+           see .table_stats().
+
+           table_stats_ttl (float): Seconds before row counts and sizes are
+           recomputed. None caches them indefinitely.
+
+           instrumentation (bool or QueryInstrumentation): Record timings
+           of every query, see .stats(). Pass True for defaults or a
+           configured QueryInstrumentation, e.g., with a slow query
+           threshold or hooks. Defaults to None (no instrumentation).
+
+           index_check (str): What .head(), .tail() and .where() do before
+           running a sort or filter on columns without an index (per the
+           reflected schema): "warn" (default), "refuse" (raise an
+           UnindexedQueryException) or None (nothing). See also .explain().
+
+           snapshot (str): Path of a local SQLite snapshot database. Tables
+           copied into it with .materialize() answer .head(), .tail() and
+           .where() from the local copy, without round trips to the
+           database. Defaults to None (no snapshots).
+
+           timeout (float): Seconds after which a query's statement is
+           interrupted and a QueryTimeoutException raised. Defaults to None
+           (no timeout). Can be overridden per query, see .query().
+
+           max_rows (int): Maximum number of rows fetched by a query.
+
+           max_bytes (int): Maximum in-memory size of a query's result.
+
+           on_limit (str): What happens when a result is larger than
+           max_rows or max_bytes: "raise" (default) a ResultTooLargeException
+           or "truncate" to the rows that fit, with a warning.
+
+           url (str or URL): Full sqlalchemy URL of the database, e.g., with
+           driver options such as "sqlite:///db.sqlite?timeout=30". Replaces
+           drivername, database, host, port, username, password and the
+           environment variables.
+
         Returns:
            engine: The sqlalchemy database engine.
 
         Raises:
-            OperationalError
+            OperationalError, QueryDbError
         """
+        if index_check not in [None, False, "warn", "refuse"]:
+            raise QueryDbError("Unknown index_check %s." % index_check)
+        if on_limit not in ["raise", "truncate"]:
+            raise QueryDbError("Unknown on_limit %s." % on_limit)
+        if snapshot is not None and snapshot_format(snapshot) != "sqlite":
+            raise QueryDbError("The snapshot database must be a SQLite file, not Parquet.")
+
         # Demo mode w/ included dummy database
         if demo:
             drivername = "sqlite"
@@ -211,45 +1410,49 @@ class QueryDb(object):
                 "sample_data/Chinook_Sqlite.sqlite")
             use_env_vars = False
 
-        # Check if the host, port. or database name options are overwritten
-        # by environmental variables
-        environ_driver = os.environ.get('QUERY_DB_DRIVER')
-        environ_host = os.environ.get('QUERY_DB_HOST')
-        environ_port = os.environ.get('QUERY_DB_PORT')
-        environ_name = os.environ.get('QUERY_DB_NAME')
-        if environ_driver is not None and use_env_vars:
-            drivername = environ_driver
-        if environ_host is not None and use_env_vars:
-            host = environ_host
-        if environ_port is not None and use_env_vars:
-            port = environ_port
-        if environ_name is not None and use_env_vars:
-            database = environ_name
-
-        # Note: This will require the user's terminal to be open. In the
-        # case of IPython QtConsole or Notebook, this will be the terminal
-        # from which the kernel was launched
-        if password is None and drivername != "sqlite":  # sqlite does not support pwds
-            password = os.environ.get('QUERY_DB_PASS')
-            if password is None:
-                if pd.core.common.in_ipnb():
-                    # Display a somewhat obnoxious warning to the user
-                    try:
-                        from IPython.display import display, HTML
-                        display(HTML(GETPASS_USE_WARNING))
-                    except ImportError:
-                        pass
-                password = getpass.getpass(
-                    "Please enter the %s server password:" % drivername)
-
-        # Connection
-        url = sqlalchemy.engine.url.URL(
-            drivername=drivername,
-            username=username,
-            password=password,
-            host=host,
-            port=port,
-            database=database)
+        if url is not None:
+            url = sqlalchemy.engine.url.make_url(url)
+            database = url.database or ""
+        else:
+            # Check if the host, port. or database name options are overwritten
+            # by environmental variables
+            environ_driver = os.environ.get('QUERY_DB_DRIVER')
+            environ_host = os.environ.get('QUERY_DB_HOST')
+            environ_port = os.environ.get('QUERY_DB_PORT')
+            environ_name = os.environ.get('QUERY_DB_NAME')
+            if environ_driver is not None and use_env_vars:
+                drivername = environ_driver
+            if environ_host is not None and use_env_vars:
+                host = environ_host
+            if environ_port is not None and use_env_vars:
+                port = environ_port
+            if environ_name is not None and use_env_vars:
+                database = environ_name
+
+            # Note: This will require the user's terminal to be open. In the
+            # case of IPython QtConsole or Notebook, this will be the terminal
+            # from which the kernel was launched
+            if password is None and drivername != "sqlite":  # sqlite does not support pwds
+                password = os.environ.get('QUERY_DB_PASS')
+                if password is None:
+                    if pd.core.common.in_ipnb():
+                        # Display a somewhat obnoxious warning to the user
+                        try:
+                            from IPython.display import display, HTML
+                            display(HTML(GETPASS_USE_WARNING))
+                        except ImportError:
+                            pass
+                    password = getpass.getpass(
+                        "Please enter the %s server password:" % drivername)
+
+            # Connection
+            url = sqlalchemy.engine.url.URL(
+                drivername=drivername,
+                username=username,
+                password=password,
+                host=host,
+                port=port,
+                database=database)
         engine = sqlalchemy.create_engine(url)
 
         # Tests the connection
@@ -258,21 +1461,55 @@ class QueryDb(object):
 
         # Set the engine ane metadata
         self._engine = engine
-        self._summary_info = []
+        self._lazy = lazy
+        if schema_cache:
+            self._schema_cache = SchemaCache(None if schema_cache is True else schema_cache)
+        else:
+            self._schema_cache = None
+        if result_cache is True:
+            result_cache = ResultCache()
+        self._result_cache = result_cache or None
+        self._async_drivername = async_drivername
+        self._fetch_engine = fetch_engine
+        self._show_table_stats = show_table_stats
+        self._table_stats_ttl = table_stats_ttl
+        self._table_stats = None
+        self._table_stats_time = None
+        if instrumentation is True:
+            instrumentation = QueryInstrumentation()
+        self._instrumentation = instrumentation or None
+        if self._instrumentation is not None:
+            self._instrumentation.attach(engine)
+        self._async_engine = None
+        self._compile_dialect = None
+        self._snapshot_path = snapshot
+        self._snapshot_db = None
+        self._snapshot_tables = None
+        self._snapshots = {}
+        self._index_check = index_check
+        self._limits = QueryLimits(timeout=timeout, max_rows=max_rows, max_bytes=max_bytes,
+                                   on_limit=on_limit)
+        self._running = {}
         self._set_metadata()
 
         # Finally, set some pretty printing params
         # (schema diagram setup to go here)
         self._db_name = database.split("/")[-1].split(":")[0]
-        self._summary_info = pd.DataFrame(self._summary_info,
-                                          columns=["Table", "Primary Key(s)",
-                                                   "# of Columns", "# of Column Types"])
-        self._html = df_to_html(self._summary_info, "%s Database Summary" % self._db_name,
-                                bold=True)
 
     def _repr_html_(self):
+        stats_expired = (self._table_stats is not None and self._table_stats_ttl is not None and
+                         time.time() - self._table_stats_time > self._table_stats_ttl)
+        if self._html is None or stats_expired:
+            summary = self._summary_info
+            if self._show_table_stats:
+                stats = self.table_stats()
+                summary = summary.merge(stats, on="Table", how="left")
+            self._html = df_to_html(summary, self._summary_title(), bold=True)
         return self._html
 
+    def _summary_title(self):
+        return "%s Database Summary" % self._db_name
+
     def __repr__(self):
         if self.test_connection():
             c = "Working connection"
@@ -281,6 +1518,44 @@ class QueryDb(object):
         return ("%s to a remote %s DB: %s" %
                 (c, self._engine.name.upper(), self._db_name))
 
+    def table_stats(self, refresh=False, workers=TABLE_STATS_WORKERS,
+                    timeout=TABLE_STATS_TIMEOUT):
+        """
+        Row counts and on-disk sizes of all tables, from catalog statistics
+        where available (so possibly estimates) and otherwise from COUNT(*)
+        queries run concurrently. Cached for the QueryDb's table_stats_ttl.
+
+        Kwargs:
+            refresh (bool): Recompute, even if cached statistics are fresh.
+
+            workers (int): Number of concurrent COUNT(*) queries.
+
+            timeout (float): Seconds after which a table's COUNT(*) is given
+            up on, and its row count reported as missing.
+
+        Returns:
+            stats (pandas.DataFrame): Table, Rows and Size (bytes) columns.
+        """
+        fresh = (self._table_stats is not None and
+                 (self._table_stats_ttl is None or
+                  time.time() - self._table_stats_time <= self._table_stats_ttl))
+        if refresh or not fresh:
+            tables = list(self._summary_info["Table"])
+            stats = self._collect_table_stats(tables, workers, timeout)
+            self._table_stats = pd.DataFrame(
+                [(t, stats[t][0], stats[t][1]) for t in tables],
+                columns=["Table", "Rows", "Size (bytes)"])
+            self._table_stats_time = time.time()
+            self._html = None
+        return self._table_stats
+
+    def _collect_table_stats(self, tables, workers, timeout):
+        """
+        Internal helper returning table name -> (rows, bytes), see
+        .table_stats().
+        """
+        return collect_table_stats(self._engine, tables, workers=workers, timeout=timeout)
+
     def test_connection(self):
         """
         Test the connection to the QueryDb. Returns True if working.
@@ -295,7 +1570,9 @@ class QueryDb(object):
         except sqlalchemy.exc.OperationalError:
             return False
 
-    def query(self, sql_query, return_as="dataframe"):
+    def query(self, sql_query, return_as="dataframe", chunksize=10000, cache=True,
+              fetch_engine=None, columns=None, compact=False, label=None, params=None,
+              timeout=None, max_rows=None, max_bytes=None, on_limit=None):
         """
         Execute a raw SQL query against the the SQL DB.
 
@@ -307,14 +1584,55 @@ class QueryDb(object):
             returned. The following are acceptable types:
             - "dataframe": pandas.DataFrame or None if no matching query
             - "result": sqlalchemy.engine.result.ResultProxy
+            - "chunks": generator of pandas.DataFrames, each with at most
+              chunksize rows, streamed with a server-side cursor
+
+            chunksize (int): Number of rows per DataFrame when
+            return_as="chunks".
+
+            cache (bool): Use the QueryDb's result cache, if one is
+            configured. Only applies to DataFrame results.
+
+            fetch_engine (str): How DataFrame results are built:
+            - "pandas": pandas.read_sql(), with dtypes inferred from the rows
+            - "columnar": cursor batches are read straight into typed NumPy
+              arrays, with dtypes taken from the reflected columns
+            Defaults to the QueryDb's fetch_engine.
+
+            columns (dict): Column name -> reflected sqlalchemy Column, e.g.,
+            db.inspect.Track.table.columns, used for the "columnar" fetch
+            engine and compaction. The QueryDbOrm helpers pass their table's
+            columns. With the "columnar" engine, other columns are read as
+            objects.
+
+            compact (bool): Downcast numeric columns and convert repeated
+            strings to categoricals, see query.compact.compact_df(). The
+            memory saved is reported in df.attrs. Only applies to DataFrame
+            results.
+
+            label (str): Name recorded with the query's stats, see .stats().
+            The QueryDbOrm helpers pass their own, e.g., "Track.head".
+
+            params (dict): Values of the query's bound parameters, e.g.,
+            db.query("SELECT * FROM Track WHERE AlbumId = :album",
+            params={"album": 3}). Repeated queries with different values
+            share the same statement, and so the database's cached plan.
+
+            timeout, max_rows, max_bytes, on_limit: Override the QueryDb's
+            statement timeout and result size limits for this query. Pass
+            False to lift a limit. A timeout covers executing and fetching;
+            with return_as="chunks", until the last chunk is read. The size
+            limits don't apply to return_as="result". See also .cancel().
 
         Returns:
-            result (pandas.DataFrame or sqlalchemy ResultProxy): Query result
-            as a DataFrame (default) or sqlalchemy result (specified with
-            return_as="result")
+            result (pandas.DataFrame, sqlalchemy ResultProxy or generator):
+            Query result as a DataFrame (default), sqlalchemy result
+            (specified with return_as="result") or generator of DataFrames
+            (specified with return_as="chunks")
 
         Raises:
-            QueryDbError
+            QueryDbError, QueryTimeoutException, QueryCancelledException,
+            ResultTooLargeException
         """
         if isinstance(sql_query, str):
             pass
@@ -322,61 +1640,655 @@ class QueryDb(object):
             sql_query = str(sql_query)
         else:
             raise QueryDbError("query() requires a str or unicode input.")
+        if on_limit not in [None, "raise", "truncate"]:
+            raise QueryDbError("Unknown on_limit %s." % on_limit)
+        limits = self._limits.merge(timeout=timeout, max_rows=max_rows, max_bytes=max_bytes,
+                                    on_limit=on_limit)
+
+        if self._instrumentation is None:
+            return self._run_query(sql_query, return_as, chunksize, cache, fetch_engine,
+                                   columns, compact, params, limits)
 
+        record = self._instrumentation.start(sql_query, label=label, return_as=return_as)
+        try:
+            result = self._run_query(sql_query, return_as, chunksize, cache, fetch_engine,
+                                     columns, compact, params, limits)
+        except Exception as e:
+            self._instrumentation.finish(record, error=e)
+            raise
+
+        if isinstance(result, pd.DataFrame):
+            self._instrumentation.finish(record, rows=len(result),
+                                         nbytes=int(result.memory_usage().sum()))
+        elif return_as.upper() in ["CHUNKS", "ITER"]:
+            self._instrumentation.activate(None)
+            return self._instrumented_chunks(result, record)
+        else:
+            self._instrumentation.finish(record)
+        return result
+
+    def _instrumented_chunks(self, chunks, record):
+        """
+        Internal generator passing on DataFrame chunks, recording the query
+        once all chunks have been read.
+        """
+        rows, nbytes = 0, 0
+        try:
+            while True:
+                self._instrumentation.activate(record)
+                try:
+                    chunk = next(chunks)
+                except StopIteration:
+                    break
+                finally:
+                    self._instrumentation.activate(None)
+                rows += len(chunk)
+                nbytes += int(chunk.memory_usage().sum())
+                yield chunk
+        except Exception as e:
+            self._instrumentation.finish(record, rows=rows, nbytes=nbytes, error=e)
+            raise
+        self._instrumentation.finish(record, rows=rows, nbytes=nbytes)
+
+    def _run_query(self, sql_query, return_as, chunksize, cache, fetch_engine, columns,
+                   compact, params=None, limits=None):
+        """
+        Internal helper executing a query, see .query().
+        """
         query = sqlalchemy.sql.text(sql_query)
+        limits = limits or self._limits
 
         if return_as.upper() in ["DF", "DATAFRAME"]:
-            return self._to_df(query, self._engine)
+            fetch_engine = (fetch_engine or self._fetch_engine).lower()
+            if fetch_engine not in ["pandas", "columnar"]:
+                raise QueryDbError("Unknown fetch engine %s." % fetch_engine)
+
+            if self._result_cache is None or not cache:
+                df = self._fetch_df(query, fetch_engine, columns, params, limits=limits)
+            else:
+                key = self._cache_key(sql_query, params, fetch_engine, columns)
+                df = self._result_cache.get(key)
+                if df is not None:
+                    df = self._limit_df(df, limits)
+                else:
+                    df = self._fetch_df(query, fetch_engine, columns, params, limits=limits)
+                    if not is_truncated(df, limits):
+                        self._result_cache.set(key, df)
+
+            if compact:
+                df = compact_df(df, columns=columns)
+            return df
         elif return_as.upper() in ["RESULT", "RESULTPROXY"]:
             with self._engine.connect() as conn:
-                result = conn.execute(query)
+                with self._guard(conn, limits):
+                    result = conn.execute(query, params or {})
                 return result
+        elif return_as.upper() in ["CHUNKS", "ITER"]:
+            return self._to_df_chunks(query, self._engine, chunksize, params=params,
+                                      limits=limits)
         else:
             raise QueryDbError("Other return types not implemented.")
 
+    def query_many(self, queries, max_workers=None, errors="capture", **kwargs):
+        """
+        Execute several independent SQL queries concurrently over the
+        engine's connection pool. Additional keywords are passed to each
+        .query() call.
+
+        Args:
+            queries (list or dict): SQL queries to execute. With a dict, each
+            query's key is also its label in the query stats.
+
+        Kwargs:
+            max_workers (int): Number of concurrent queries. Defaults to the
+            size of the engine's connection pool.
+
+            errors (str): "capture" to return a failed query's exception in
+            place of its result, so that other results are kept, or "raise"
+            to raise the first failure (in input order).
+
+        Returns:
+            results (list or dict): Results in the same order, or under the
+            same keys, as queries.
+
+        Raises:
+            QueryDbError
+        """
+        if errors not in ["capture", "raise"]:
+            raise QueryDbError("Unknown errors option %s." % errors)
+
+        if isinstance(queries, dict):
+            keys = list(queries.keys())
+            sql_queries = [queries[k] for k in keys]
+        else:
+            keys = None
+            sql_queries = list(queries)
+        if not sql_queries:
+            return {} if keys is not None else []
+
+        if max_workers is None:
+            pool_size = getattr(self._engine.pool, "size", None)
+            max_workers = pool_size() if callable(pool_size) else 5
+
+        executor = ThreadPoolExecutor(max_workers=min(max_workers, len(sql_queries)))
+        futures = []
+        for i, sql_query in enumerate(sql_queries):
+            query_kwargs = dict(kwargs)
+            if keys is not None:
+                query_kwargs.setdefault("label", str(keys[i]))
+            futures.append(executor.submit(self.query, sql_query, **query_kwargs))
+        executor.shutdown(wait=True)
+
+        results = []
+        for future in futures:
+            error = future.exception()
+            if error is not None and errors == "raise":
+                raise error
+            results.append(future.result() if error is None else error)
+
+        if keys is not None:
+            return dict(zip(keys, results))
+        return results
+
+    def export_query(self, sql_query, path, format=None, params=None,
+                     batch_size=DEFAULT_BATCH_SIZE, max_batch_bytes=None,
+                     max_rows_per_file=None, compression=None, progress=None, columns=None):
+        """
+        Stream the result of a SQL query to Parquet or CSV files. Rows are
+        fetched in batches from a server-side cursor and each batch is
+        written out (as a Parquet row group or CSV chunk) before the next is
+        fetched, so memory use is bounded by the batch size.
+
+        Args:
+            sql_query (str): A raw SQL query to export.
+
+            path (str): Output file. With max_rows_per_file, one file per
+            part is written instead, e.g., tracks-00000.parquet,
+            tracks-00001.parquet and so on for tracks.parquet.
+
+        Kwargs:
+            format (str): "parquet" (requires pyarrow) or "csv". Defaults to
+            the format of path's extension.
+
+            params (dict): Values of the query's bound parameters.
+
+            batch_size (int): Maximum number of rows per batch.
+
+            max_batch_bytes (int): Memory ceiling of a batch in bytes. Rows
+            per batch are lowered to fit, based on the rows seen so far.
+
+            max_rows_per_file (int): Split the output into files of at most
+            this many rows.
+
+            compression (str): Parquet codec ("snappy" by default, "gzip",
+            "zstd", ...) or CSV compression ("gzip" or "bz2", by default
+            inferred from a .gz or .bz2 extension).
+
+            progress (callable): Called as progress(rows, path) after each
+            batch, with the number of rows written so far and the current
+            file.
+
+            columns (dict): Column name -> reflected sqlalchemy Column, e.g.,
+            db.inspect.Track.table.columns. Their types define the Parquet
+            schema; other columns' types are inferred from the first batch.
+
+        Returns:
+            paths (list): The files written.
+
+        Raises:
+            QueryDbError
+        """
+        format = format or infer_format(path)
+        if format not in FORMATS:
+            raise QueryDbError("Unknown export format %s, specify format=\"parquet\" or "
+                               "\"csv\"." % format)
+        return export_query(self._engine, sql_query, path, format=format, params=params,
+                            batch_size=batch_size, max_batch_bytes=max_batch_bytes,
+                            max_rows_per_file=max_rows_per_file, compression=compression,
+                            progress=progress, column_types=dict(
+                                (name, col.type) for name, col in (columns or {}).items()))
+
+    def explain(self, sql_query):
+        """
+        Query plan of a SQL query, without running it. Supported for SQLite
+        (EXPLAIN QUERY PLAN), PostgreSQL (EXPLAIN (FORMAT JSON)) and MySQL.
+
+        Args:
+            sql_query (str): A raw SQL query to explain.
+
+        Returns:
+            plan (pandas.DataFrame): One row per plan node, with the columns
+            id, parent, operation, table, index (used by the node, if any),
+            rows and cost (the planner's estimates, where reported),
+            full_scan and sort (does the node scan a whole table or sort
+            without an index?) and detail (the raw plan node).
+
+        Raises:
+            QueryDbError
+        """
+        if self._engine.name not in PLANNERS:
+            raise QueryDbError("explain() is not supported for %s databases." %
+                               self._engine.name)
+        return explain(self._engine, sql_query)
+
+    def aquery(self, sql_query, return_as="dataframe", cache=True, params=None,
+               timeout=None, max_rows=None, max_bytes=None, on_limit=None):
+        """
+        Async version of .query(), backed by a sqlalchemy async engine,
+        e.g., `df = await db.aquery("SELECT * FROM Track")`. Requires
+        sqlalchemy>=1.4 and an async driver such as aiosqlite or asyncpg.
+
+        Args:
+            sql_query (str): A raw SQL query to execute.
+
+        Kwargs:
+            return_as (str): Only "dataframe" is supported.
+
+            cache (bool): Use the QueryDb's result cache, if one is
+            configured.
+
+            params (dict): Values of the query's bound parameters.
+
+            timeout, max_rows, max_bytes, on_limit: Override the QueryDb's
+            statement timeout and result size limits, as for .query().
+
+        Returns:
+            coroutine: Awaitable returning a pandas.DataFrame.
+
+        Raises:
+            QueryDbError
+        """
+        from query.aio import aquery  # Async syntax requires Python 3
+        if on_limit not in [None, "raise", "truncate"]:
+            raise QueryDbError("Unknown on_limit %s." % on_limit)
+        limits = self._limits.merge(timeout=timeout, max_rows=max_rows, max_bytes=max_bytes,
+                                    on_limit=on_limit)
+        return aquery(self, sql_query, return_as=return_as, cache=cache, params=params,
+                      limits=limits)
+
+    def adispose(self):
+        """
+        Async: close the connections of the async engine, if one was created.
+        """
+        from query.aio import dispose
+        return dispose(self)
+
+    def stats(self, by=None):
+        """
+        Timing percentiles of the queries run so far, for each of the
+        execute, fetch, convert and total phases. Requires the QueryDb to
+        be created with instrumentation=True.
+
+        Kwargs:
+            by (str): Break the stats down by a record key, e.g., "label"
+            for the calling QueryDbOrm helper.
+
+        Returns:
+            stats (pandas.DataFrame)
+
+        Raises:
+            QueryDbError
+        """
+        return self._get_instrumentation().stats(by=by)
+
+    def slow_queries(self):
+        """
+        Records of the queries slower than the instrumentation's
+        slow_query_threshold.
+        """
+        return self._get_instrumentation().slow_queries()
+
+    def add_query_hook(self, hook):
+        """
+        Call hook(record) with the stats record of every finished query,
+        e.g., to export them to a metrics pipeline.
+        """
+        self._get_instrumentation().add_hook(hook)
+
+    def _get_instrumentation(self):
+        if self._instrumentation is None:
+            raise QueryDbError("Query stats require QueryDb(instrumentation=True).")
+        return self._instrumentation
+
+    def invalidate_cache(self, sql_query=None, params=None):
+        """
+        Drop the cached results for sql_query, or all cached results if
+        sql_query is None. No-op without a result cache.
+
+        Kwargs:
+            params (dict): Only drop the result for these bound parameters.
+            Defaults to None, dropping the results for all parameters
+            (e.g., every .head(n) of a Table).
+        """
+        if self._result_cache is None:
+            return
+        if sql_query is None:
+            self._result_cache.invalidate()
+        else:
+            self._result_cache.invalidate_sql(sql_query, params=params)
+
+    def cache_info(self):
+        """
+        Result cache hit/miss counters and memory usage, or None without
+        a result cache.
+        """
+        if self._result_cache is None:
+            return None
+        return self._result_cache.info()
+
+    def refresh_schema(self):
+        """
+        Reflect the database schema again, discarding any cached schema
+        metadata, e.g., after tables have been added or altered.
+        """
+        if self._schema_cache is not None:
+            self._schema_cache.invalidate(self._engine)
+        self._set_metadata()
+
     def _set_metadata(self):
         """
         Internal helper to set metadata attributes.
         """
-        meta = QueryDbMeta()
+        cached = None
+        if self._schema_cache is not None:
+            cached = self._schema_cache.load(self._engine)
+
+        summary_info = []
+        if cached is not None:
+            # Warm start, no reflection required
+            self._meta, summary_info = cached
+            self.inspect = QueryDbAttributes(self)
+            for table in self._meta.tables:
+                self._add_table(table)
+
+        elif self._lazy:
+            # Only list the tables, reflection happens in _reflect_table()
+            with self._engine.connect() as conn:
+                table_names = sqlalchemy.inspect(conn).get_table_names()
+            self._meta = QueryDbMeta()
+            self.inspect = QueryDbAttributes(self, lazy_tables=table_names)
+            summary_info = [(table, None, None, None) for table in table_names]
+
+        else:
+            meta = QueryDbMeta()
+            with self._engine.connect() as conn:
+                meta.bind = conn
+                meta.reflect()
+                self._meta = meta
+
+            # Set an inspect attribute, whose subattributes
+            # return individual tables / columns. Tables and columns
+            # are special classes with .last() and other convenience methods
+            self.inspect = QueryDbAttributes(self)
+            for table in self._meta.tables:
+                summary_info.append(self._add_table(table))
+
+        if not isinstance(summary_info, pd.DataFrame):
+            summary_info = pd.DataFrame(summary_info,
+                                        columns=["Table", "Primary Key(s)",
+                                                 "# of Columns", "# of Column Types"])
+            # Only fully reflected schemas are worth caching
+            if self._schema_cache is not None and not self._lazy:
+                self._schema_cache.save(self._engine, self._meta, summary_info)
+
+        self._summary_info = summary_info
+        self._html = None
+
+    def _reflect_table(self, table):
+        """
+        Internal helper to reflect a single table on first access in lazy mode.
+        """
+        if table not in self._meta.tables:
+            with self._engine.connect() as conn:
+                self._meta.reflect(bind=conn, only=[table])
+
+        summary_row = self._add_table(table)
+        self.inspect._lazy_tables.discard(table)
+
+        # Fill in the summary row and re-render the summary on next display
+        row_ix = list(self._summary_info["Table"]).index(table)
+        for col_ix, value in enumerate(summary_row[1:], start=1):
+            self._summary_info.iat[row_ix, col_ix] = value
+        self._html = None
+
+        return getattr(self.inspect, table)
+
+    def _add_table(self, table):
+        """
+        Internal helper to attach a reflected table and its columns to
+        .inspect. Returns the table's row for the database summary.
+        """
+        setattr(self.inspect, table,
+                self._orm_class(self._meta.tables[table], self))
+
+        table_attr = getattr(self.inspect, table)
+        table_cols = table_attr.table.columns
+
+        for col in table_cols.keys():
+            setattr(table_attr, col,
+                    self._orm_class(table_cols[col], self))
+
+        # Finally add some summary info:
+        #   Table name
+        #   Primary Key item or list
+        #   N of Cols
+        #   Distinct Col Values (class so NVARCHAR(20) and NVARCHAR(30) are not different)
+        primary_keys = table_attr.table.primary_key.columns.keys()
+        return (
+            table,
+            primary_keys[0] if len(primary_keys) == 1 else primary_keys,
+            len(table_cols),
+            len(set([x.type.__class__ for x in table_cols.values()])),
+            )
+
+    def _sql_literal(self, value):
+        """
+        Internal helper rendering a Python value as a SQL literal for this
+        database's dialect.
+        """
+        if hasattr(value, "item"):  # numpy scalars
+            value = value.item()
+        return str(sqlalchemy.literal(value).compile(
+            dialect=self._engine.dialect, compile_kwargs={"literal_binds": True}))
+
+    def _fetchone(self, sql_query):
+        """
+        Internal helper returning the first row of a small query as a tuple.
+        """
         with self._engine.connect() as conn:
-            meta.bind = conn
-            meta.reflect()
-            self._meta = meta
-
-        # Set an inspect attribute, whose subattributes
-        # return individual tables / columns. Tables and columns
-        # are special classes with .last() and other convenience methods
-        self.inspect = QueryDbAttributes()
-        for table in self._meta.tables:
-            setattr(self.inspect, table,
-                    QueryDbOrm(self._meta.tables[table], self))
-
-            table_attr = getattr(self.inspect, table)
-            table_cols = table_attr.table.columns
-
-            for col in table_cols.keys():
-                setattr(table_attr, col,
-                        QueryDbOrm(table_cols[col], self))
-
-            # Finally add some summary info:
-            #   Table name
-            #   Primary Key item or list
-            #   N of Cols
-            #   Distinct Col Values (class so NVARCHAR(20) and NVARCHAR(30) are not different)
-            primary_keys = table_attr.table.primary_key.columns.keys()
-            self._summary_info.append((
-                table,
-                primary_keys[0] if len(primary_keys) == 1 else primary_keys,
-                len(table_cols),
-                len(set([x.type.__class__ for x in table_cols.values()])),
-                ))
+            return tuple(conn.execute(sqlalchemy.sql.text(sql_query)).fetchone())
+
+    def _snapshot_orm(self, orm):
+        """
+        Internal helper returning the QueryDbOrm of the snapshot database for
+        the same Table/Column as orm, if the table has been materialized
+        there, else None.
+        """
+        if self._snapshot_path is None:
+            return None
+        if self._snapshot_db is None:
+            self._snapshot_db = QueryDb(drivername="sqlite", database=self._snapshot_path,
+                                        use_env_vars=False, show_table_stats=False,
+                                        instrumentation=self._instrumentation,
+                                        index_check=None)
+            self._snapshot_tables = set(open_store(self._snapshot_path).tables())
+
+        if orm.table.name not in self._snapshot_tables:
+            return None
+        local = getattr(self._snapshot_db.inspect, orm.table.name)
+        return local if orm.column is None else getattr(local, orm.column.name)
+
+    def _compile(self, statement):
+        """
+        Internal helper compiling a sqlalchemy statement to SQL for .query(),
+        with named bound parameters (e.g., ":n"). Returns the SQL and the
+        statement's default parameter values.
+        """
+        if self._compile_dialect is None:
+            # The engine's dialect, but rendering the paramstyle of text()
+            self._compile_dialect = copy.copy(self._engine.dialect)
+            self._compile_dialect.paramstyle = "named"
+            self._compile_dialect.positional = False
+        compiled = statement.compile(dialect=self._compile_dialect)
+        return str(compiled), dict((k, v) for k, v in compiled.params.items() if v is not None)
+
+    def _cache_key(self, sql_query, params, fetch_engine, columns=None):
+        """
+        Internal helper building the result cache key of a query, shared by
+        .query() and .aquery(). The columnar fetch engine's dtypes depend on
+        the reflected types of columns, so they are part of its key.
+        """
+        options = {"fetch_engine": fetch_engine}
+        if fetch_engine == "columnar" and columns:
+            options["columns"] = sorted((name, repr(col.type)) for name, col in columns.items())
+        return self._result_cache.key(sql_query, params=params, options=options)
+
+    def _fetch_df(self, query, fetch_engine, columns=None, params=None, engine=None,
+                  limits=None):
+        """
+        Internal helper fetching a DataFrame with the given fetch engine,
+        from the QueryDb's engine unless another one is given.
+        """
+        engine = engine or self._engine
+        if fetch_engine == "columnar":
+            limits = limits or self._limits
+            column_types = dict((name, col.type) for name, col in (columns or {}).items())
+            with engine.connect() as conn:
+                with self._guard(conn, limits) as statement:
+                    result = LimitedResult(conn.execute(query, params or {}), limits, statement)
+                    df = read_columnar(result, column_types, timer=self._add_time)
+            return self._check_limit(result.exceeded, limits, df)
+        return self._to_df(query, engine, params=params, limits=limits)
+
+    def _add_time(self, phase, seconds):
+        """
+        Internal helper adding time spent in a phase of the current query
+        to its stats, if the QueryDb is instrumented.
+        """
+        if self._instrumentation is not None:
+            self._instrumentation.add_time(phase, seconds)
 
     def _to_df(self, query, conn, index_col=None, coerce_float=True, params=None,
-               parse_dates=None, columns=None):
+               parse_dates=None, limits=None):
         """
-        Internal convert-to-DataFrame convenience wrapper.
+        Internal convert-to-DataFrame convenience wrapper. Equivalent to
+        pandas.read_sql() for a query, but times fetching and conversion
+        separately, and applies the statement timeout and size limits.
+        """
+        if isinstance(conn, sqlalchemy.engine.Engine):
+            with conn.connect() as engine_conn:
+                return self._to_df(query, engine_conn, index_col=index_col,
+                                   coerce_float=coerce_float, params=params,
+                                   parse_dates=parse_dates, limits=limits)
+
+        limits = limits or self._limits
+        with self._guard(conn, limits) as statement:
+            result = LimitedResult(conn.execute(query, params or {}), limits, statement)
+            columns = list(result.keys())
+            start = time.time()
+            rows = result.fetchall()
+            self._add_time("fetch", time.time() - start)
+        self._check_limit(result.exceeded, limits)  # Raise before converting
+
+        start = time.time()
+        df = pd.DataFrame.from_records(rows, columns=columns, coerce_float=coerce_float)
+        for col in parse_dates or []:
+            df[col] = pd.to_datetime(df[col])
+        if index_col is not None:
+            df = df.set_index(index_col)
+        self._add_time("convert", time.time() - start)
+        return self._check_limit(result.exceeded, limits, df)
+
+    def _to_df_chunks(self, query, engine, chunksize, coerce_float=True, params=None,
+                      parse_dates=None, limits=None):
+        """
+        Internal generator of DataFrame chunks. Uses a server-side cursor
+        (where the driver supports one), so that peak memory depends on
+        chunksize rather than on the size of the result.
+        """
+        limits = limits or self._limits
+        with engine.connect() as conn:
+            conn = conn.execution_options(stream_results=True)
+            with self._guard(conn, limits) as statement:
+                result = LimitedResult(conn.execute(query, params or {}), limits, statement)
+                columns, chunks = list(result.keys()), 0
+                while True:
+                    rows = result.fetchmany(chunksize)
+                    if not rows and chunks:
+                        break
+                    chunk = pd.DataFrame.from_records(rows, columns=columns,
+                                                      coerce_float=coerce_float)
+                    for col in parse_dates or []:
+                        chunk[col] = pd.to_datetime(chunk[col])
+                    chunk = self._check_limit(result.exceeded, limits, chunk)
+                    chunks += 1
+                    yield chunk
+                    if not rows:  # Empty result, still yield the columns
+                        break
+
+    @contextlib.contextmanager
+    def _guard(self, conn, limits):
+        """
+        Internal context manager running a statement on conn that .cancel()
+        and the timeout of limits can interrupt. Raises the matching
+        exception if the statement was interrupted.
+        """
+        # Connections of the async engine are interrupted through the sync one
+        engine = self._engine if getattr(conn.dialect, "is_async", False) else None
+        statement = RunningStatement(conn, timeout=limits.timeout, running=self._running,
+                                     engine=engine)
+        try:
+            with statement:
+                yield statement
+        except Exception:
+            if statement.reason is None:
+                raise
+        if statement.reason == "timeout":
+            raise QueryTimeoutException("Query timed out after %s seconds." % limits.timeout)
+        elif statement.reason is not None:
+            raise QueryCancelledException("Query cancelled.")
+
+    def _check_limit(self, exceeded, limits, df=None):
+        """
+        Internal helper raising a ResultTooLargeException if a result
+        exceeded its size limits or, with on_limit="truncate", warning and
+        marking the truncated df in df.attrs["truncated"] (pandas>=1.0).
+        """
+        if not exceeded:
+            return df
+        if limits.on_limit == "raise":
+            raise ResultTooLargeException(
+                "Query result exceeds max_rows=%s or max_bytes=%s. Pass on_limit=\"truncate\" "
+                "to keep the rows that fit." % (limits.max_rows, limits.max_bytes))
+        if df is not None:
+            warnings.warn("Query result truncated at max_rows=%s, max_bytes=%s." %
+                          (limits.max_rows, limits.max_bytes))
+            if hasattr(df, "attrs"):  # pandas>=1.0
+                df.attrs["truncated"] = True
+        return df
+
+    def _limit_df(self, df, limits):
+        """
+        Internal helper applying the size limits to an already fetched
+        DataFrame, e.g., a cached result.
+        """
+        keep = limits.fit(df)
+        if keep is None:
+            return df
+        return self._check_limit(True, limits, df.iloc[:keep].copy())
+
+    def cancel(self):
+        """
+        Interrupt all statements this QueryDb is running. They raise a
+        QueryCancelledException. Can be called from another thread or a
+        signal handler, e.g., for SIGINT; a handler only runs in the main
+        thread between fetched batches, so cancel long statements from
+        another thread.
+
+        Returns:
+            n (int): Number of statements interrupted.
         """
-        return pd.io.sql.read_sql(str(query), conn, index_col=index_col,
-                                  coerce_float=coerce_float, params=params,
-                                  parse_dates=parse_dates, columns=columns)
+        statements = list(self._running.values())
+        for statement in statements:
+            statement.interrupt("cancel")
+        return len(statements)
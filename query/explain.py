@@ -0,0 +1,92 @@
+"""
+EXPLAIN support: runs a dialect's EXPLAIN for a query and normalizes the
+plan into one DataFrame layout across SQLite, PostgreSQL and MySQL.
+"""
+import json
+
+import pandas as pd
+import sqlalchemy
+
+
+PLAN_COLUMNS = ["id", "parent", "operation", "table", "index", "rows", "cost",
+                "full_scan", "sort", "detail"]
+
+
+def _sqlite_plan(conn, sql_query):
+    rows = conn.execute(sqlalchemy.sql.text("EXPLAIN QUERY PLAN %s" % sql_query)).fetchall()
+    plan = []
+    for row in rows:
+        node_id, parent, detail = row[0], row[1], row[-1]
+        words = detail.split()
+        operation = words[0] if words else None
+        table = words[1] if operation in ["SCAN", "SEARCH"] and len(words) > 1 else None
+        index = None
+        if " USING " in detail:
+            using = detail.split(" USING ", 1)[1]
+            if using.startswith("INTEGER PRIMARY KEY"):
+                index = "PRIMARY KEY"
+            else:
+                index = using.replace("COVERING ", "").split()[1]
+        full_scan = operation == "SCAN" and index is None and table is not None
+        plan.append((node_id, parent, operation, table, index, None, None, full_scan,
+                     "TEMP B-TREE" in detail, detail))
+    return plan
+
+
+def _postgresql_plan(conn, sql_query):
+    result = conn.execute(sqlalchemy.sql.text("EXPLAIN (FORMAT JSON) %s" % sql_query)).scalar()
+    if not isinstance(result, list):  # Depending on the driver, a string
+        result = json.loads(result)
+
+    plan = []
+
+    def _walk(node, parent):
+        node_id = len(plan)
+        operation = node.get("Node Type")
+        plan.append((node_id, parent, operation, node.get("Relation Name"),
+                     node.get("Index Name"), node.get("Plan Rows"), node.get("Total Cost"),
+                     operation == "Seq Scan", operation in ["Sort", "Incremental Sort"],
+                     json.dumps(dict((k, v) for k, v in node.items() if k != "Plans"))))
+        for child in node.get("Plans", []):
+            _walk(child, node_id)
+
+    _walk(result[0]["Plan"], None)
+    return plan
+
+
+def _mysql_plan(conn, sql_query):
+    result = conn.execute(sqlalchemy.sql.text("EXPLAIN %s" % sql_query))
+    keys = [k.lower() for k in result.keys()]
+    plan = []
+    for row in result.fetchall():
+        row = dict(zip(keys, row))
+        extra = row.get("extra") or ""
+        plan.append((row.get("id"), None, row.get("select_type"), row.get("table"),
+                     row.get("key"), row.get("rows"), None, row.get("type") == "ALL",
+                     "filesort" in extra, extra))
+    return plan
+
+
+PLANNERS = {
+    "sqlite": _sqlite_plan,
+    "postgresql": _postgresql_plan,
+    "mysql": _mysql_plan,
+}
+
+
+def explain(engine, sql_query):
+    """
+    Normalized query plan of sql_query, one row per plan node, with the
+    columns id, parent, operation, table, index (used, if any), rows and
+    cost (estimates, where the dialect reports them), full_scan and sort
+    (does the node scan a whole table or sort without an index?) and
+    detail (the dialect's raw description of the node).
+
+    Raises:
+        ValueError: For dialects without a planner in PLANNERS.
+    """
+    if engine.name not in PLANNERS:
+        raise ValueError("EXPLAIN is not supported for %s." % engine.name)
+    with engine.connect() as conn:
+        plan = PLANNERS[engine.name](conn, sql_query)
+    return pd.DataFrame(plan, columns=PLAN_COLUMNS)
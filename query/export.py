@@ -0,0 +1,270 @@
+"""
+Streaming export of query results to Parquet or CSV files. Rows are read
+in batches from a server-side cursor and each batch is written out (as a
+Parquet row group or a CSV chunk) before the next one is fetched, so that
+peak memory is bounded by the batch size rather than the result size.
+"""
+import bz2
+import gzip
+import os
+
+import pandas as pd
+import sqlalchemy
+
+from query.columnar import column_kind
+from query.result_cache import df_bytes
+
+
+DEFAULT_BATCH_SIZE = 10000
+FORMATS = ["parquet", "csv"]
+CSV_COMPRESSION = {"gzip": gzip.open, "bz2": bz2.open}
+
+
+def infer_format(path):
+    """
+    Export format ("parquet" or "csv") from a file extension, or None.
+    """
+    name = path.lower()
+    if name.endswith(".parquet") or name.endswith(".pq"):
+        return "parquet"
+    if name.endswith(".csv") or name.endswith(".csv.gz") or name.endswith(".csv.bz2"):
+        return "csv"
+    return None
+
+
+def iter_batches(engine, query, params=None, batch_size=DEFAULT_BATCH_SIZE,
+                 max_batch_bytes=None):
+    """
+    Generator of DataFrame batches of a query's result, streamed with a
+    server-side cursor (where the driver supports one).
+
+    Kwargs:
+        batch_size (int): Maximum number of rows per batch.
+
+        max_batch_bytes (int): Memory ceiling of a batch. The number of rows
+        per batch is lowered to fit, based on the size of the rows seen
+        so far.
+    """
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True).execute(query, params or {})
+        columns = list(result.keys())
+        rows_per_batch = batch_size
+        if max_batch_bytes is not None:
+            rows_per_batch = min(batch_size, 1000)  # Until the row size is known
+
+        total_rows, total_bytes = 0, 0
+        while True:
+            rows = result.fetchmany(rows_per_batch)
+            if not rows:
+                if not total_rows:
+                    yield pd.DataFrame([], columns=columns)
+                break
+            df = pd.DataFrame.from_records(rows, columns=columns)
+            yield df
+
+            total_rows += len(df)
+            if max_batch_bytes is not None:
+                total_bytes += df_bytes(df)
+                row_bytes = max(1, total_bytes // total_rows)
+                rows_per_batch = max(1, min(batch_size, max_batch_bytes // row_bytes))
+
+
+class _CsvWriter(object):
+    def __init__(self, path, compression=None):
+        opener = CSV_COMPRESSION[compression] if compression is not None else open
+        self._file = opener(path, "wt")
+        self._header = True
+
+    def write(self, df):
+        df.to_csv(self._file, header=self._header, index=False)
+        self._header = False
+
+    def close(self):
+        self._file.close()
+
+
+def arrow_type(pa, sql_type):
+    """
+    Arrow type of a reflected sqlalchemy column type, or None if it is
+    unknown (or, for non-float numerics, depends on the driver's values).
+    """
+    kind = column_kind(sql_type)
+    if kind == "bool":
+        return pa.bool_()
+    if kind == "int":
+        return pa.int64()
+    if isinstance(sql_type, sqlalchemy.types.Float):
+        return pa.float64()
+    if isinstance(sql_type, sqlalchemy.types.DateTime):
+        return pa.timestamp("us")
+    if isinstance(sql_type, sqlalchemy.types.Date):
+        return pa.date32()
+    if isinstance(sql_type, sqlalchemy.types.String):
+        return pa.string()
+    if isinstance(sql_type, sqlalchemy.types._Binary):
+        return pa.binary()
+    return None
+
+
+def arrow_schema(pa, df, column_types=None):
+    """
+    Arrow schema of a result: from the reflected types in column_types
+    (column name -> sqlalchemy type) where known, otherwise inferred from
+    df, the first batch. Columns that are all NULL in df and have no known
+    type are written as strings.
+    """
+    column_types = column_types or {}
+    fields = []
+    for field in pa.Schema.from_pandas(df, preserve_index=False):
+        field_type = arrow_type(pa, column_types.get(field.name))
+        if field_type is None:
+            field_type = pa.string() if pa.types.is_null(field.type) else field.type
+        fields.append(pa.field(field.name, field_type))
+    return pa.schema(fields)
+
+
+class _ParquetWriter(object):
+    def __init__(self, path, compression="snappy", column_types=None):
+        try:
+            import pyarrow  # noqa
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("Parquet export requires pyarrow.")
+        self._pa = pyarrow
+        self._pq = pyarrow.parquet
+        self._path = path
+        self._compression = compression
+        self._column_types = column_types
+        self._schema = None
+        self._writer = None
+
+    def _dates(self, df):
+        # Drivers without native dates (e.g., SQLite's) return them as strings
+        parsed = {}
+        for field in self._schema:
+            is_date = self._pa.types.is_date(field.type)
+            if ((is_date or self._pa.types.is_timestamp(field.type)) and
+                    df[field.name].dtype == object):
+                values = pd.to_datetime(df[field.name])
+                parsed[field.name] = values.dt.date if is_date else values
+        return df.assign(**parsed) if parsed else df
+
+    def write(self, df):
+        # Every batch gets the same schema, so that a column that is all NULL
+        # (or has no NULLs) in some batches doesn't change type
+        if self._schema is None:
+            self._schema = arrow_schema(self._pa, df, self._column_types)
+        table = self._pa.Table.from_pandas(self._dates(df), schema=self._schema,
+                                           preserve_index=False)
+        if self._writer is None:
+            self._writer = self._pq.ParquetWriter(self._path, table.schema,
+                                                  compression=self._compression or "none")
+        self._writer.write_table(table)  # One row group per batch
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+def part_path(path, part):
+    """
+    Path of the part-th file of a split export, e.g., "tracks-00001.csv.gz"
+    for "tracks.csv.gz".
+    """
+    directory, name = os.path.split(path)
+    stem, dot, ext = name.partition(".")
+    return os.path.join(directory, "%s-%05d%s%s" % (stem, part, dot, ext))
+
+
+def export_batches(batches, path, format, compression=None, max_rows_per_file=None,
+                   progress=None, column_types=None):
+    """
+    Write DataFrame batches to one or more Parquet or CSV files.
+
+    Args:
+        batches (iterable): DataFrames with the same columns.
+
+        path (str): Output file. With max_rows_per_file, files are numbered,
+        see part_path().
+
+        format (str): "parquet" or "csv".
+
+    Kwargs:
+        compression (str): Parquet codec (e.g., "snappy", the default,
+        "gzip", "zstd") or CSV compression ("gzip" or "bz2", inferred from
+        a .gz or .bz2 extension by default).
+
+        max_rows_per_file (int): Start a new file after this many rows.
+
+        progress (callable): Called as progress(rows, path) after each
+        batch is written, with the total rows written so far and the file
+        written to.
+
+        column_types (dict): Column name -> reflected sqlalchemy type, for
+        the Parquet schema. Types of other columns are inferred from the
+        first batch.
+
+    Returns:
+        paths (list): The files written.
+    """
+    if format not in FORMATS:
+        raise ValueError("Unknown export format %s." % format)
+    if format == "csv" and compression is None:
+        compression = {".gz": "gzip", ".bz2": "bz2"}.get(os.path.splitext(path)[1])
+    if format == "parquet" and compression is None:
+        compression = "snappy"
+
+    def _open(file_path):
+        if format == "csv":
+            return _CsvWriter(file_path, compression)
+        return _ParquetWriter(file_path, compression, column_types)
+
+    paths, writer, file_rows, rows, empty = [], None, 0, 0, None
+    try:
+        for df in batches:
+            if not len(df):
+                empty = df
+            while len(df):
+                if writer is None:
+                    paths.append(path if max_rows_per_file is None else
+                                 part_path(path, len(paths)))
+                    writer = _open(paths[-1])
+                    file_rows = 0
+
+                n = len(df) if max_rows_per_file is None else max_rows_per_file - file_rows
+                writer.write(df.iloc[:n])
+                file_rows += min(n, len(df))
+                rows += min(n, len(df))
+                df = df.iloc[n:]
+
+                if max_rows_per_file is not None and file_rows >= max_rows_per_file:
+                    writer.close()
+                    writer = None
+                if progress is not None:
+                    progress(rows, paths[-1])
+
+        if not paths:  # Empty result, still write the columns
+            paths.append(path)
+            writer = _open(path)
+            if empty is not None:
+                writer.write(empty)
+    finally:
+        if writer is not None:
+            writer.close()
+    return paths
+
+
+def export_query(engine, sql_query, path, format=None, params=None,
+                 batch_size=DEFAULT_BATCH_SIZE, max_batch_bytes=None, **kwargs):
+    """
+    Stream a SQL query's result to Parquet or CSV files, see
+    QueryDb.export_query().
+    """
+    format = format or infer_format(path)
+    if format not in FORMATS:
+        raise ValueError("Unknown export format %s, pass format=\"parquet\" or \"csv\"."
+                         % format)
+    query = sqlalchemy.sql.text(sql_query)
+    batches = iter_batches(engine, query, params=params, batch_size=batch_size,
+                           max_batch_bytes=max_batch_bytes)
+    return export_batches(batches, path, format, **kwargs)
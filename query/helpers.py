@@ -1,5 +1,7 @@
 import query
+import numpy as np
 import os
+import pandas as pd
 
 
 def setup_demo_env():
@@ -12,3 +14,15 @@ def setup_demo_env():
         os.environ.pop("QUERY_DB_HOST")
     if os.environ.get("QUERY_DB_PORT") is not None:
         os.environ.pop("QUERY_DB_PORT")
+
+
+def python_value(value):
+    """
+    Convert a value read from a DataFrame (a pandas.Timestamp or a numpy
+    scalar) into the Python value DBAPI drivers accept as a parameter.
+    """
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
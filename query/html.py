@@ -17,13 +17,25 @@ QUERY_DB_ATTR_MSG = ("<em>You're using a rich interactive terminal. "
                      "of this database.<em>")
 
 
+# Rows shown by df_to_html() before truncating to the first and last rows
+HTML_MAX_ROWS = 60
+
+
 # Functions
-def df_to_html(df, title, bold=False):
+def df_to_html(df, title, bold=False, max_rows=HTML_MAX_ROWS):
     if bold:
         style = 'font-weight: bold;'
     else:
         style = 'font-style: italic;'
+
+    # pandas only formats the first and last max_rows / 2 rows of larger
+    # frames, so these stay cheap to render
+    html = df.to_html(show_dimensions=False, max_rows=max_rows, max_cols=None)
+    if max_rows is not None and len(df) > max_rows:
+        html += ('<p style="padding-left: 30px; font-style: italic;">'
+                 'Showing the first and last %d of %d rows.</p>' % (max_rows // 2, len(df)))
+
     return ('<div style="max-height:500px; max-width: 750px; overflow: auto;">\n' +
             ('<p style="padding-left: 30px; %s">' % style) + title + '</p>' +
-            df.to_html(show_dimensions=False, max_rows=None, max_cols=None) +
+            html +
             '\n</div>')
@@ -0,0 +1,188 @@
+"""
+Query instrumentation for QueryDb: per-query timings of statement
+execution (via sqlalchemy engine events), fetching and DataFrame
+conversion, plus row counts, result sizes and the QueryDbOrm helper that
+issued the query.
+"""
+from collections import deque
+import logging
+import threading
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+import sqlalchemy
+
+
+DEFAULT_MAX_RECORDS = 10000
+PHASES = ["execute", "fetch", "convert", "total"]
+
+slow_query_logger = logging.getLogger("query.slow")
+
+
+class QueryInstrumentation(object):
+    """
+    Collects a record for every QueryDb.query() call. Records are dicts
+    with the keys sql, label, return_as, started_at, execute, fetch,
+    convert, total (all in seconds), rows, bytes and error.
+    """
+    def __init__(self, slow_query_threshold=None, max_records=DEFAULT_MAX_RECORDS,
+                 hooks=None):
+        """
+        Kwargs:
+            slow_query_threshold (float): Queries taking longer than this
+            many seconds in total are logged to the "query.slow" logger
+            and kept in .slow_queries(). Defaults to None (no slow log).
+
+            max_records (int): Number of most recent records kept.
+
+            hooks (list): Callables called with each finished record, e.g.,
+            to export timings to a metrics pipeline. See .add_hook().
+        """
+        self.slow_query_threshold = slow_query_threshold
+        self._records = deque(maxlen=max_records)
+        self._slow_records = deque(maxlen=max_records)
+        self._hooks = list(hooks or [])
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    # Engine events
+    def attach(self, engine):
+        """
+        Listen to the engine's cursor execution events.
+        """
+        sqlalchemy.event.listen(engine, "before_cursor_execute", self._before_execute)
+        sqlalchemy.event.listen(engine, "after_cursor_execute", self._after_execute)
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_execute_start", []).append(time.time())
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("query_execute_start")
+        if starts:
+            self.add_time("execute", time.time() - starts.pop())
+
+    # Records
+    def start(self, sql, label=None, return_as=None):
+        """
+        Start a record for a query and make it the active record of the
+        current thread.
+        """
+        record = {"sql": sql, "label": label or "query", "return_as": return_as,
+                  "started_at": time.time(), "execute": 0.0, "fetch": 0.0,
+                  "convert": 0.0, "total": None, "rows": None, "bytes": None,
+                  "error": None}
+        self.activate(record)
+        return record
+
+    def activate(self, record):
+        """
+        Make record the active record of the current thread, or clear it
+        if record is None.
+        """
+        self._local.record = record
+
+    def add_time(self, phase, seconds):
+        """
+        Add seconds to a phase of the current thread's active record.
+        """
+        record = getattr(self._local, "record", None)
+        if record is not None:
+            record[phase] += seconds
+
+    def finish(self, record, rows=None, nbytes=None, error=None):
+        """
+        Complete a record, logging it if slow and passing it to any hooks.
+        """
+        self.activate(None)
+        record["total"] = time.time() - record["started_at"]
+        record["rows"] = rows
+        record["bytes"] = nbytes
+        record["error"] = None if error is None else repr(error)
+
+        with self._lock:
+            self._records.append(record)
+            slow = (self.slow_query_threshold is not None and
+                    record["total"] > self.slow_query_threshold)
+            if slow:
+                self._slow_records.append(record)
+            hooks = list(self._hooks)
+
+        if slow:
+            slow_query_logger.warning("Slow query (%.3fs, %s): %s", record["total"],
+                                      record["label"], record["sql"])
+        for hook in hooks:
+            try:
+                hook(record)
+            except Exception as e:
+                warnings.warn("Query stats hook %r failed: %r" % (hook, e))
+
+    def add_hook(self, hook):
+        """
+        Call hook(record) for every finished query.
+        """
+        with self._lock:
+            self._hooks.append(hook)
+
+    def remove_hook(self, hook):
+        """
+        Stop calling a hook added with .add_hook().
+        """
+        with self._lock:
+            self._hooks.remove(hook)
+
+    def reset(self):
+        """
+        Drop all records.
+        """
+        with self._lock:
+            self._records.clear()
+            self._slow_records.clear()
+
+    # Reporting
+    def records(self):
+        """
+        All kept records as a DataFrame, oldest first.
+        """
+        with self._lock:
+            records = list(self._records)
+        return pd.DataFrame(records, columns=["sql", "label", "return_as", "started_at"] +
+                            PHASES + ["rows", "bytes", "error"])
+
+    def slow_queries(self):
+        """
+        Records of queries slower than slow_query_threshold, oldest first.
+        """
+        with self._lock:
+            records = list(self._slow_records)
+        return pd.DataFrame(records, columns=self.records().columns)
+
+    def stats(self, by=None):
+        """
+        Count, mean, percentiles and max of each phase's timings.
+
+        Kwargs:
+            by (str): Record key to break the stats down by, e.g., "label".
+
+        Returns:
+            stats (pandas.DataFrame): Indexed by phase (and by, if given).
+        """
+        records = self.records()
+        groups = [(None, records)] if by is None else list(records.groupby(by))
+
+        rows, index = [], []
+        for key, group in groups:
+            for phase in PHASES:
+                times = group[phase].dropna().values.astype(np.float64)
+                if len(times):
+                    p50, p90, p95, p99 = np.percentile(times, [50, 90, 95, 99])
+                    rows.append((len(times), times.mean(), p50, p90, p95, p99, times.max()))
+                else:
+                    rows.append((0,) + (np.nan,) * 6)
+                index.append(phase if by is None else (key, phase))
+
+        if by is not None and index:
+            index = pd.MultiIndex.from_tuples(index, names=[by, "phase"])
+        return pd.DataFrame(rows, index=index,
+                            columns=["count", "mean", "p50", "p90", "p95", "p99", "max"])
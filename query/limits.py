@@ -0,0 +1,209 @@
+"""
+Statement timeouts, cancellation and result size limits. Running
+statements are interrupted through their DBAPI connection with the
+dialect's own mechanism: sqlite3's interrupt(), psycopg's cancel() or a
+KILL QUERY from a second MySQL connection.
+"""
+import threading
+
+import pandas as pd
+import sqlalchemy
+
+from query.result_cache import df_bytes
+
+
+FETCH_BATCH_SIZE = 10000
+ON_LIMIT = ["raise", "truncate"]
+
+# Rows of each fetched batch converted to estimate its in-memory size
+SIZE_SAMPLE_ROWS = 100
+
+
+def _dbapi_connection(conn):
+    fairy = conn.connection
+    dbapi_conn = getattr(fairy, "dbapi_connection", None) or fairy.connection  # <1.4.24
+    # Async dialects wrap the driver's connection in an adapter, and aiosqlite
+    # wraps a sqlite3 connection used from its worker thread
+    dbapi_conn = getattr(dbapi_conn, "driver_connection", dbapi_conn)
+    if type(dbapi_conn).__module__.startswith("aiosqlite"):
+        dbapi_conn = dbapi_conn._conn
+    return dbapi_conn
+
+
+def _sqlite_interrupt(engine, dbapi_conn):
+    dbapi_conn.interrupt()
+
+
+def _postgresql_interrupt(engine, dbapi_conn):
+    if hasattr(dbapi_conn, "cancel"):
+        dbapi_conn.cancel()
+        return
+    # asyncpg only cancels through its own (async) API
+    with engine.connect() as conn:
+        conn.execute(sqlalchemy.sql.text("SELECT pg_cancel_backend(%d)" %
+                                         int(dbapi_conn.get_server_pid())))
+
+
+def _mysql_interrupt(engine, dbapi_conn):
+    thread_id = int(dbapi_conn.thread_id())
+    with engine.connect() as conn:
+        conn.execute(sqlalchemy.sql.text("KILL QUERY %d" % thread_id))
+
+
+INTERRUPTERS = {
+    "sqlite": _sqlite_interrupt,
+    "postgresql": _postgresql_interrupt,
+    "mysql": _mysql_interrupt,
+}
+
+
+class QueryLimits(object):
+    """
+    Statement timeout (seconds) and result size limits of a query. When
+    the result is larger than max_rows rows or max_bytes bytes (in
+    memory), on_limit="raise" aborts the query and "truncate" keeps the
+    rows that fit.
+    """
+    def __init__(self, timeout=None, max_rows=None, max_bytes=None, on_limit="raise"):
+        if on_limit not in ON_LIMIT:
+            raise ValueError("Unknown on_limit %s, use \"raise\" or \"truncate\"." % on_limit)
+        self.timeout = timeout or None
+        self.max_rows = max_rows if max_rows is not False else None
+        self.max_bytes = max_bytes if max_bytes is not False else None
+        self.on_limit = on_limit
+
+    def merge(self, timeout=None, max_rows=None, max_bytes=None, on_limit=None):
+        """
+        Copy with per-call overrides. None keeps this object's setting,
+        False removes it.
+        """
+        def _pick(value, default):
+            return default if value is None else value
+
+        return QueryLimits(timeout=_pick(timeout, self.timeout),
+                           max_rows=_pick(max_rows, self.max_rows),
+                           max_bytes=_pick(max_bytes, self.max_bytes),
+                           on_limit=_pick(on_limit, self.on_limit))
+
+    def fit(self, df, rows=0, nbytes=0):
+        """
+        Number of leading rows of df within the limits, after rows rows and
+        nbytes bytes were already fetched, or None if all of df fits.
+        """
+        keep = len(df)
+        if self.max_rows is not None:
+            keep = min(keep, max(0, self.max_rows - rows))
+        if self.max_bytes is not None and len(df):
+            size = df_bytes(df)
+            if nbytes + size > self.max_bytes:
+                keep = min(keep, int(max(0, self.max_bytes - nbytes) * len(df) // size))
+        return keep if keep < len(df) else None
+
+
+class RunningStatement(object):
+    """
+    A statement running on a connection, registered in running (a dict)
+    while it runs, so that it can be interrupted with .interrupt(). With a
+    timeout, a timer interrupts it once the timeout has passed. Dialects
+    interrupting from a second connection open it on engine (defaulting
+    to conn's, which must be a sync engine).
+    """
+    def __init__(self, conn, timeout=None, running=None, engine=None):
+        self.reason = None
+        self._engine = engine or conn.engine
+        self._dbapi_conn = _dbapi_connection(conn)
+        self._timeout = timeout
+        self._running = running if running is not None else {}
+        self._timer = None
+
+    def __enter__(self):
+        self._running[id(self)] = self
+        if self._timeout is not None:
+            self._timer = threading.Timer(self._timeout, self.interrupt, args=("timeout",))
+            self._timer.daemon = True
+            self._timer.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._running.pop(id(self), None)
+
+    def interrupt(self, reason="cancel"):
+        """
+        Interrupt the statement. Safe to call from any thread. Fetching
+        stops at the next batch on dialects without an interrupter.
+        """
+        if self.reason is None:
+            self.reason = reason
+        interrupter = INTERRUPTERS.get(self._engine.name)
+        if interrupter is not None:
+            try:
+                interrupter(self._engine, self._dbapi_conn)
+            except Exception:  # E.g., the statement already finished
+                pass
+
+
+def is_truncated(df, limits):
+    """
+    Was df truncated to the size limits? Without DataFrame.attrs (before
+    pandas 1.0) any result that could have been is assumed to be.
+    """
+    if hasattr(df, "attrs"):
+        return bool(df.attrs.get("truncated"))
+    return limits.on_limit == "truncate" and (limits.max_rows is not None or
+                                              limits.max_bytes is not None)
+
+
+class LimitedResult(object):
+    """
+    Wraps a sqlalchemy result, stopping fetches once the limits are
+    reached (setting .exceeded) or the statement was interrupted.
+    """
+    def __init__(self, result, limits, statement=None):
+        self.exceeded = False
+        self.rows, self.nbytes = 0, 0
+        self._result = result
+        self._limits = limits
+        self._statement = statement
+        self._keys = list(result.keys())
+
+    def keys(self):
+        return self._keys
+
+    def fetchmany(self, size):
+        if self.exceeded or (self._statement is not None and self._statement.reason):
+            return []
+        if self._limits.max_rows is not None:
+            size = min(size, self._limits.max_rows - self.rows + 1)
+        rows = self._result.fetchmany(size)
+
+        keep = len(rows)
+        if self._limits.max_rows is not None:
+            keep = min(keep, self._limits.max_rows - self.rows)
+        if self._limits.max_bytes is not None and rows:
+            row_bytes = self._row_bytes(rows)
+            keep = min(keep, int(max(0, self._limits.max_bytes - self.nbytes) // row_bytes))
+            self.nbytes += int(row_bytes * keep)
+        if keep < len(rows):
+            self.exceeded = True
+            rows = rows[:keep]
+        self.rows += len(rows)
+        return rows
+
+    def _row_bytes(self, rows):
+        """
+        Estimated in-memory size of a row of rows, as a DataFrame, from an
+        evenly spaced sample of them.
+        """
+        sample = rows[::max(1, len(rows) // SIZE_SAMPLE_ROWS)]
+        df = pd.DataFrame.from_records(sample, columns=self._keys)
+        return max(1.0, df_bytes(df) / float(len(sample)))
+
+    def fetchall(self):
+        rows = []
+        while True:
+            batch = self.fetchmany(FETCH_BATCH_SIZE)
+            if not batch:
+                return rows
+            rows.extend(batch)
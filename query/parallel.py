@@ -0,0 +1,62 @@
+"""
+Helpers for fetching the parts of a query concurrently over a thread pool.
+"""
+import numbers
+
+
+def partition_bounds(min_key, max_key, partitions):
+    """
+    Split the closed key range [min_key, max_key] into at most `partitions`
+    contiguous (lower, upper) ranges. All but the last range are half-open
+    ([lower, upper)), the last one includes max_key. Integer keys are split
+    on integer boundaries.
+    """
+    if not isinstance(min_key, numbers.Number) or not isinstance(max_key, numbers.Number):
+        raise TypeError("Key range bounds must be numeric.")
+    partitions = max(1, int(partitions))
+
+    integral = isinstance(min_key, numbers.Integral) and isinstance(max_key, numbers.Integral)
+    if integral:
+        partitions = min(partitions, max_key - min_key + 1)
+
+    bounds = [min_key]
+    for i in range(1, partitions):
+        if integral:
+            bounds.append(min_key + (max_key - min_key + 1) * i // partitions)
+        else:
+            # float() so that Decimal keys can be split too
+            bounds.append(float(min_key) + float(max_key - min_key) * i / partitions)
+    bounds.append(max_key)
+
+    return [(bounds[i], bounds[i + 1]) for i in range(partitions)]
+
+
+class LazyParts(object):
+    """
+    A list-like of the parts of a partitioned fetch. Each part is being
+    fetched in the background and blocks on first access until ready.
+    """
+    def __init__(self, futures):
+        self._futures = futures
+
+    def __len__(self):
+        return len(self._futures)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [f.result() for f in self._futures[i]]
+        return self._futures[i].result()
+
+    def __iter__(self):
+        for f in self._futures:
+            yield f.result()
+
+    def done(self):
+        """
+        Have all parts been fetched?
+        """
+        return all(f.done() for f in self._futures)
+
+    def __repr__(self):
+        return "<LazyParts: %d of %d parts fetched>" % (
+            sum(f.done() for f in self._futures), len(self._futures))
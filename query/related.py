@@ -0,0 +1,76 @@
+"""
+Helpers for fetching the rows related to a DataFrame through a foreign
+key, in batches rather than one query per row.
+"""
+from query.helpers import python_value
+
+
+# Bound parameters per statement (or IN list items, for Oracle) to stay under
+PARAMETER_LIMITS = {
+    "sqlite": 999,  # Before SQLite 3.32, 32766 since
+    "postgresql": 32767,
+    "mysql": 65535,
+    "mssql": 2000,  # Of 2100
+    "oracle": 1000,
+}
+DEFAULT_PARAMETER_LIMIT = 999
+
+# Dialects supporting CREATE TEMPORARY TABLE, and the number of keys above
+# which a temporary table is joined instead of sending IN lists
+TEMP_TABLE_DIALECTS = ["sqlite", "postgresql", "mysql"]
+TEMP_TABLE_THRESHOLD = 20000
+TEMP_TABLE_NAME = "_query_related_keys"
+
+
+class ForeignKeyPath(object):
+    """
+    One direction of a foreign key between a table and the target table
+    whose rows are fetched: target rows match where their target_columns
+    equal the source table's source_columns.
+    """
+    def __init__(self, source_table, source_columns, target_columns):
+        self.source_table = source_table
+        self.source_columns = source_columns
+        self.target_columns = target_columns
+
+    def __repr__(self):
+        return "%s.%s" % (self.source_table, ",".join(self.source_columns))
+
+    def matches(self, via):
+        """
+        Does via ("Table" or "Table.column") name this path's source?
+        """
+        table, _, columns = via.partition(".")
+        if table != self.source_table:
+            return False
+        return not columns or columns.split(",") == self.source_columns
+
+
+def foreign_key_paths(table, tables):
+    """
+    All ForeignKeyPaths to table: through its own foreign keys (fetching
+    the rows that reference a parent) and through the foreign keys of the
+    (reflected) tables referencing it (fetching the referenced parents).
+    """
+    paths = []
+    for fk in table.foreign_key_constraints:
+        paths.append(ForeignKeyPath(fk.referred_table.name,
+                                    [e.column.name for e in fk.elements],
+                                    [c.name for c in fk.columns]))
+    for other in tables:
+        for fk in other.foreign_key_constraints:
+            if fk.referred_table is table:
+                paths.append(ForeignKeyPath(other.name, [c.name for c in fk.columns],
+                                            [e.column.name for e in fk.elements]))
+    return paths
+
+
+def key_values(df, columns):
+    """
+    Distinct, non-NULL keys of df's columns as Python values: scalars for
+    a single column, tuples for several.
+    """
+    keys = df[columns].dropna().drop_duplicates()
+    if len(columns) == 1:
+        return [python_value(v) for v in keys[columns[0]]]
+    return [tuple(python_value(v) for v in row) for row in keys.itertuples(index=False)]
@@ -0,0 +1,216 @@
+"""
+Opt-in cache of QueryDb.query() results, so that re-running the same
+.head(), .tail() or .where() cell does not need a round trip to the DB.
+
+Entries are keyed by the normalized SQL text and any bound parameters and
+are kept in a bounded in-memory LRU (by DataFrame bytes), with an optional
+on-disk tier and a per-entry time-to-live.
+"""
+from collections import OrderedDict
+import hashlib
+import os
+import pickle
+import re
+import threading
+import time
+
+
+DEFAULT_MAX_BYTES = 256 * 1024 ** 2
+
+
+# Quoted strings and identifiers (kept as they are), or a run of whitespace
+SQL_TOKENS = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|`[^`]*`|\[[^\]]*\])|\s+")
+
+
+def normalize_sql(sql_query):
+    """
+    Collapse whitespace outside of quotes and strip any trailing semicolon,
+    so trivially different spellings of the same query share a cache
+    entry.
+    """
+    sql_query = SQL_TOKENS.sub(lambda m: m.group(1) or " ", sql_query)
+    return sql_query.strip().rstrip(";").strip()
+
+
+def df_bytes(df):
+    """
+    Approximate in-memory size of a DataFrame in bytes.
+    """
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+class ResultCache(object):
+    """
+    LRU cache of query result DataFrames with a byte budget, TTL and an
+    optional on-disk tier.
+    """
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, ttl=None, cache_dir=None):
+        """
+        Kwargs:
+            max_bytes (int): Budget for DataFrames held in memory. Least
+            recently used entries are evicted once it is exceeded.
+
+            ttl (float): Default number of seconds an entry stays valid.
+            Defaults to None (no expiry).
+
+            cache_dir (str): Directory for the on-disk tier. Entries evicted
+            from memory can still be served from disk. Defaults to None
+            (memory only).
+        """
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (expires_at, nbytes, df)
+        self._nbytes = 0
+        self._lock = threading.Lock()
+
+        if cache_dir is not None and not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    def key(self, sql_query, params=None, options=None):
+        """
+        Cache key for a SQL query, its bound parameters and any options
+        that change the resulting DataFrame. Keys start with the digests of
+        the normalized SQL and of the parameters, see .invalidate_sql().
+        """
+        options_repr = repr(sorted(options.items())) if options else ""
+        key = "%s\n%s\n%s" % (normalize_sql(sql_query), self._params_repr(params), options_repr)
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return "%s%s" % (self._prefix(sql_query, params), digest)
+
+    def get(self, key):
+        """
+        Return a copy of the cached DataFrame for key, or None on a miss.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] is not None and entry[0] < now:
+                    self._remove(key)
+                    entry = None
+                else:
+                    # Mark as most recently used
+                    self._entries[key] = self._entries.pop(key)
+
+            if entry is None and self.cache_dir is not None:
+                entry = self._load(key, now)
+                if entry is not None:
+                    self._insert(key, entry)
+
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[2].copy()
+
+    def set(self, key, df, ttl=None):
+        """
+        Cache a copy of df under key. ttl overrides the cache's default.
+        """
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = None if ttl is None else time.time() + ttl
+        entry = (expires_at, df_bytes(df), df.copy())
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._insert(key, entry)
+            if self.cache_dir is not None:
+                self._dump(key, entry)
+
+    def invalidate(self, key=None):
+        """
+        Drop the entry for key, or every entry if key is None.
+        """
+        with self._lock:
+            keys = list(self._entries.keys()) if key is None else [key]
+            for k in keys:
+                if k in self._entries:
+                    self._remove(k)
+
+            if self.cache_dir is not None:
+                if key is None:
+                    paths = [os.path.join(self.cache_dir, f) for f in os.listdir(self.cache_dir)
+                             if f.endswith(".pickle")]
+                else:
+                    paths = [self._path(key)]
+                for path in paths:
+                    if os.path.exists(path):
+                        os.remove(path)
+
+    def invalidate_sql(self, sql_query, params=None):
+        """
+        Drop every entry for sql_query and params, whatever its options, or
+        for all parameters if params is None.
+        """
+        prefix = self._prefix(sql_query, params)
+        with self._lock:
+            for k in [k for k in self._entries if k.startswith(prefix)]:
+                self._remove(k)
+
+            if self.cache_dir is not None:
+                for f in os.listdir(self.cache_dir):
+                    if f.startswith(prefix) and f.endswith(".pickle"):
+                        os.remove(os.path.join(self.cache_dir, f))
+
+    def info(self):
+        """
+        Hit and miss counters and current memory usage.
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses,
+                    "entries": len(self._entries), "bytes": self._nbytes,
+                    "max_bytes": self.max_bytes}
+
+    def _insert(self, key, entry):
+        # Entries larger than the whole budget are only kept on disk
+        if entry[1] > self.max_bytes:
+            return
+        self._entries[key] = entry
+        self._nbytes += entry[1]
+        while self._nbytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+
+    def _params_repr(self, params):
+        if params is None:
+            return ""
+        elif isinstance(params, dict):
+            return repr(sorted(params.items()))
+        return repr(params)
+
+    def _prefix(self, sql_query, params=None):
+        prefix = "%s-" % hashlib.sha1(normalize_sql(sql_query).encode("utf-8")).hexdigest()[:16]
+        if params is not None:
+            params_repr = self._params_repr(params).encode("utf-8")
+            prefix += "%s-" % hashlib.sha1(params_repr).hexdigest()[:16]
+        return prefix
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._nbytes -= entry[1]
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, "%s.pickle" % key)
+
+    def _load(self, key, now):
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "rb") as f:
+                entry = pickle.load(f)
+        except Exception:
+            return None
+        if entry[0] is not None and entry[0] < now:
+            os.remove(path)
+            return None
+        return entry
+
+    def _dump(self, key, entry):
+        path = self._path(key)
+        tmp_path = "%s.%d.tmp" % (path, os.getpid())
+        with open(tmp_path, "wb") as f:
+            pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_path, path)
@@ -0,0 +1,128 @@
+"""
+On-disk cache of reflected schema metadata, so that warm QueryDb
+startups can skip reflection entirely.
+
+Entries are keyed by the engine URL (without the password) and are
+invalidated by a cheap schema fingerprint: the file's mtime and size for
+SQLite, a catalog query for PostgreSQL and MySQL, or the column names and
+types from sqlalchemy's inspector for other databases.
+"""
+import hashlib
+import os
+import pickle
+
+import sqlalchemy
+
+
+DEFAULT_SCHEMA_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".query", "schema_cache")
+
+# Catalog queries returning a single row that changes whenever a table or
+# column is added, dropped or altered
+FINGERPRINT_QUERIES = {
+    "postgresql": ("SELECT md5(string_agg(table_name || '.' || column_name || ':' || "
+                   "data_type, ',' ORDER BY table_name, ordinal_position)) "
+                   "FROM information_schema.columns "
+                   "WHERE table_schema = current_schema()"),
+    "mysql": ("SELECT COUNT(*), SUM(CRC32(CONCAT_WS('.', TABLE_NAME, COLUMN_NAME, "
+              "COLUMN_TYPE))) FROM information_schema.COLUMNS "
+              "WHERE TABLE_SCHEMA = DATABASE()"),
+}
+
+
+def schema_fingerprint(engine):
+    """
+    Compute a cheap fingerprint of the database schema. Returns None if
+    the schema cannot be fingerprinted (e.g., an in-memory SQLite DB).
+    """
+    if engine.name == "sqlite":
+        database = engine.url.database
+        if not database or database == ":memory:" or not os.path.exists(database):
+            return None
+        stat = os.stat(database)
+        return "%r:%d" % (stat.st_mtime, stat.st_size)
+
+    with engine.connect() as conn:
+        if engine.name in FINGERPRINT_QUERIES:
+            row = conn.execute(sqlalchemy.sql.text(FINGERPRINT_QUERIES[engine.name])).fetchone()
+            return repr(tuple(row))
+
+        return inspector_fingerprint(conn)
+
+
+def inspector_fingerprint(conn):
+    """
+    Fingerprint of the tables' column names and types through
+    sqlalchemy's inspector, for dialects without a fingerprint query. Still
+    cheaper than a full reflection, which also loads keys and indexes.
+    """
+    inspector = sqlalchemy.inspect(conn)
+    tables = []
+    for table in sorted(inspector.get_table_names()):
+        columns = ["%s:%r:%s" % (c["name"], c["type"], c.get("nullable"))
+                   for c in inspector.get_columns(table)]
+        tables.append("%s(%s)" % (table, ",".join(columns)))
+    return hashlib.sha1(";".join(tables).encode("utf-8")).hexdigest()
+
+
+class SchemaCache(object):
+    """
+    Pickles a QueryDb's reflected QueryDbMeta and summary DataFrame to
+    a cache directory, one file per engine URL.
+    """
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir or DEFAULT_SCHEMA_CACHE_DIR
+
+    def _path(self, engine):
+        # repr() of a sqlalchemy URL masks the password
+        key = hashlib.sha1(repr(engine.url).encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, "%s.pickle" % key)
+
+    def load(self, engine):
+        """
+        Return the cached (meta, summary_info) for the engine, or None if
+        there is no entry or its fingerprint is stale.
+        """
+        path = self._path(engine)
+        if not os.path.exists(path):
+            return None
+
+        try:
+            with open(path, "rb") as f:
+                entry = pickle.load(f)
+        except Exception:
+            # Unreadable or written by an incompatible version, treat as a miss
+            return None
+
+        fingerprint = schema_fingerprint(engine)
+        if fingerprint is None or entry.get("fingerprint") != fingerprint:
+            return None
+        return entry["meta"], entry["summary_info"]
+
+    def save(self, engine, meta, summary_info):
+        """
+        Write the reflected metadata and summary for the engine to disk.
+        """
+        fingerprint = schema_fingerprint(engine)
+        if fingerprint is None:
+            return
+
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+        # Write to a temporary file and rename, so concurrent sessions
+        # never read a partially written entry
+        path = self._path(engine)
+        tmp_path = "%s.%d.tmp" % (path, os.getpid())
+        with open(tmp_path, "wb") as f:
+            pickle.dump({"url": repr(engine.url), "fingerprint": fingerprint,
+                         "meta": meta, "summary_info": summary_info},
+                        f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_path, path)
+
+    def invalidate(self, engine):
+        """
+        Remove the cache entry for the engine, if any.
+        """
+        path = self._path(engine)
+        if os.path.exists(path):
+            os.remove(path)
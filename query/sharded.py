@@ -0,0 +1,274 @@
+"""
+Scatter-gather over a dataset split across several databases (shards)
+sharing one schema: queries run on all shards concurrently and their
+results are merged.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import heapq
+
+import pandas as pd
+import sqlalchemy
+
+from query.compact import compact_df
+from query.core import QueryDb, QueryDbError, QueryDbOrm
+from query.table_stats import collect_table_stats
+
+
+MERGE_KEY = "_query_merge_key"
+
+# Dialects sorting NULLs before other values in ascending order (the others
+# sort them after, e.g., PostgreSQL and Oracle)
+NULLS_FIRST_DIALECTS = ["sqlite", "mysql", "mssql"]
+
+
+class _Descending(object):
+    """
+    Sort key wrapper inverting the order of a value, for heapq.
+    """
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+
+def _null_key(nulls_first):
+    """
+    Sort key of a value with NULLs (None or NaN) before or after all other
+    values, without comparing them to the other values.
+    """
+    def _key(value):
+        if pd.isnull(value):
+            return (0, None) if nulls_first else (1, None)
+        return (1, value) if nulls_first else (0, value)
+    return _key
+
+
+def merge_sorted(dfs, key, n, descending=False, nulls_first=True):
+    """
+    k-way merge of DataFrames that are each sorted by their key column,
+    returning the first n rows of the merged order. Ties are broken by the
+    position of the DataFrame in dfs.
+
+    Kwargs:
+        nulls_first (bool): Do NULLs sort before other values in ascending
+        order (and so after them in descending order)? As the database
+        sorted each DataFrame.
+    """
+    offsets, total = [], 0
+    for df in dfs:
+        offsets.append(total)
+        total += len(df)
+
+    null_key = _null_key(nulls_first)
+    if descending:
+        def wrap(value):
+            return _Descending(null_key(value))
+    else:
+        wrap = null_key
+    keys = [df[key].values for df in dfs]
+    heap = [(wrap(k[0]), i, 0) for i, k in enumerate(keys) if len(k)]
+    heapq.heapify(heap)
+
+    positions = []
+    while heap and len(positions) < n:
+        _, i, j = heapq.heappop(heap)
+        positions.append(offsets[i] + j)
+        if j + 1 < len(keys[i]):
+            heapq.heappush(heap, (wrap(keys[i][j + 1]), i, j + 1))
+
+    return pd.concat(dfs, ignore_index=True).iloc[positions].reset_index(drop=True)
+
+
+class ShardedQueryDbOrm(QueryDbOrm):
+    """
+    A Table/Column of a ShardedQueryDb. .where() concatenates the matching
+    rows of all shards, .head() and .tail() merge each shard's first (last)
+    n rows into the global first (last) n.
+    """
+    def _order_by_sql(self, n, by, direction):
+        """
+        Internal helper building the .head() and .tail() queries. Unlike
+        QueryDbOrm's, they also select the sort key (a column or SQL
+        expression) as MERGE_KEY, for merging.
+        """
+        col, id_col = self._query_helper(by=by)
+
+        def _build():
+            key = self._column_expr(id_col)
+            select = self._select().column(key.label(MERGE_KEY))
+            order_by = key.asc() if direction == "ASC" else key.desc()
+            return select.order_by(order_by).limit(sqlalchemy.bindparam("n"))
+
+        select, params = self._statement(("sharded_order_by", id_col, direction), _build)
+        return select, dict(params, n=int(n))
+
+    def _merged(self, helper, n, by, direction, **kwargs):
+        """
+        Internal helper running a .head() or .tail() query on all shards and
+        merging the results.
+        """
+        self._check_index("ORDER BY", self._key_columns(by)[:1], kwargs.pop("index_check", None))
+        select, params = self._order_by_sql(n, by, direction)
+        kwargs["return_as"] = "shards"
+        parts = self._query(helper, select, params, **kwargs)
+
+        nulls_first = self._db._engine.name in NULLS_FIRST_DIALECTS
+        df = merge_sorted(parts, MERGE_KEY, n, descending=direction == "DESC",
+                          nulls_first=nulls_first)
+        return df.drop(columns=[MERGE_KEY])
+
+    def head(self, n=10, by=None, **kwargs):
+        """
+        Get the first n entries for a given Table/Column across all shards.
+        Additional keywords passed to ShardedQueryDb.query().
+        """
+        return self._merged("head", n, by, "ASC", **kwargs)
+
+    def tail(self, n=10, by=None, **kwargs):
+        """
+        Get the last n entries for a given Table/Column across all shards.
+        Additional keywords passed to ShardedQueryDb.query().
+        """
+        return self._merged("tail", n, by, "DESC", **kwargs)
+
+    def last(self, n=10, by=None, **kwargs):
+        """
+        Alias for .tail().
+        """
+        return self.tail(n=n, by=by, **kwargs)
+
+    def _unsupported(self, *args, **kwargs):
+        raise QueryDbError("Only .head(), .tail() and .where() are supported for sharded "
+                           "tables. Use ShardedQueryDb.query() for other queries.")
+
+    fetch = iter_pages = sample = describe = follow = _unsupported
+    export = materialize = refresh = ahead = atail = awhere = _unsupported
+    value_counts = nunique = histogram = groupby = related = _unsupported
+
+
+class ShardedQueryDb(QueryDb):
+    """
+    A QueryDb over several databases (shards) with the same schema. The
+    schema is reflected once, from the first shard, and queries run on all
+    shards concurrently.
+    """
+    _orm_class = ShardedQueryDbOrm
+
+    def __init__(self, urls, max_workers=None, **kwargs):
+        """
+        Connect to all shards and reflect the schema of the first one.
+
+        Args:
+            urls (list): sqlalchemy URLs (str or URL) of the shards, e.g.,
+            ["sqlite:///shard0.sqlite", "sqlite:///shard1.sqlite"].
+
+        Kwargs:
+            max_workers (int): Number of shards queried at the same time.
+            Defaults to all.
+
+            **kwargs: Passed to QueryDb(), e.g., lazy=True.
+
+        Raises:
+            OperationalError, QueryDbError
+        """
+        urls = [sqlalchemy.engine.url.make_url(url) for url in urls]
+        if not urls:
+            raise QueryDbError("ShardedQueryDb requires at least one shard URL.")
+
+        super(ShardedQueryDb, self).__init__(url=urls[0], **kwargs)
+
+        engines = [self._engine]
+        for url in urls[1:]:
+            engine = sqlalchemy.create_engine(url)
+            with engine.begin():  # Tests the connection
+                pass
+            if self._instrumentation is not None:
+                self._instrumentation.attach(engine)
+            engines.append(engine)
+        self._engines = engines
+        self._max_workers = max_workers or len(engines)
+
+    def _summary_title(self):
+        return "%s Database Summary (%d shards)" % (self._db_name, len(self._engines))
+
+    def _collect_table_stats(self, tables, workers, timeout):
+        """
+        Internal helper summing the row counts and sizes of all shards. A
+        table's total is None if any shard's is missing.
+        """
+        totals = dict((t, (0, 0)) for t in tables)
+        for engine in self._engines:
+            stats = collect_table_stats(engine, tables, workers=workers, timeout=timeout)
+            for t in tables:
+                totals[t] = tuple(None if a is None or b is None else a + b
+                                  for a, b in zip(totals[t], stats[t]))
+        return totals
+
+    def __repr__(self):
+        return "Sharded %s DB over %d shards" % (self._engine.name.upper(), len(self._engines))
+
+    def query(self, sql_query, return_as="dataframe", chunksize=10000, cache=True,
+              fetch_engine=None, columns=None, compact=False, label=None, params=None,
+              timeout=None, max_rows=None, max_bytes=None, on_limit=None):
+        """
+        Execute a raw SQL query on all shards concurrently and concatenate
+        the results in shard order. The result cache and chunked results
+        are not supported; cache and chunksize are ignored. The size limits
+        apply to each shard's result and to the concatenated result.
+
+        Args:
+            sql_query (str): A raw SQL query to execute.
+
+        Kwargs:
+            return_as (str): "dataframe" for the concatenated results, or
+            "shards" for a list of each shard's DataFrame.
+
+            See QueryDb.query() for the other keywords.
+
+        Returns:
+            result (pandas.DataFrame or list)
+
+        Raises:
+            QueryDbError
+        """
+        if not isinstance(sql_query, str):
+            raise QueryDbError("query() requires a str input.")
+        if return_as.upper() not in ["DF", "DATAFRAME", "SHARDS"]:
+            raise QueryDbError("Sharded queries can only return a dataframe or shards.")
+        if on_limit not in [None, "raise", "truncate"]:
+            raise QueryDbError("Unknown on_limit %s." % on_limit)
+        limits = self._limits.merge(timeout=timeout, max_rows=max_rows, max_bytes=max_bytes,
+                                    on_limit=on_limit)
+        fetch_engine = (fetch_engine or self._fetch_engine).lower()
+        if fetch_engine not in ["pandas", "columnar"]:
+            raise QueryDbError("Unknown fetch engine %s." % fetch_engine)
+
+        record = None
+        if self._instrumentation is not None:
+            record = self._instrumentation.start(sql_query, label=label, return_as=return_as)
+
+        query = sqlalchemy.sql.text(sql_query)
+        executor = ThreadPoolExecutor(max_workers=self._max_workers)
+        futures = [executor.submit(self._fetch_df, query, fetch_engine, columns, params, engine,
+                                   limits) for engine in self._engines]
+        executor.shutdown(wait=True)
+        try:
+            parts = [future.result() for future in futures]
+        except Exception as e:
+            if record is not None:
+                self._instrumentation.finish(record, error=e)
+            raise
+
+        if return_as.upper() == "SHARDS":
+            result = parts
+        else:
+            result = self._limit_df(pd.concat(parts, ignore_index=True), limits)
+        if compact and isinstance(result, pd.DataFrame):
+            result = compact_df(result, columns=columns)
+        if record is not None:
+            self._instrumentation.finish(record, rows=sum(len(p) for p in parts))
+        return result
@@ -0,0 +1,258 @@
+"""
+Local snapshots of remote tables, kept in a SQLite database or a Parquet
+file. A snapshot remembers the high-water mark of a key column (the
+primary key or, e.g., an updated_at column), so that refreshing it only
+fetches rows past that mark.
+"""
+import os
+import pickle
+import time
+
+import pandas as pd
+import sqlalchemy
+
+from query.columnar import column_kind
+from query.export import DEFAULT_BATCH_SIZE
+
+
+SNAPSHOT_META_TABLE = "_query_snapshots"
+DELETE_CHUNK_SIZE = 500  # Below SQLite's bound parameter limit
+
+# Local column types by buffer kind, for types without a generic equivalent
+LOCAL_TYPES = {"bool": sqlalchemy.types.Boolean, "int": sqlalchemy.types.Integer,
+               "float": sqlalchemy.types.Float, "datetime": sqlalchemy.types.DateTime,
+               "object": sqlalchemy.types.Text}
+
+
+def snapshot_format(path):
+    """
+    Snapshot format of a local path: "parquet" for .parquet and .pq files,
+    "sqlite" otherwise.
+    """
+    if path.lower().endswith(".parquet") or path.lower().endswith(".pq"):
+        return "parquet"
+    return "sqlite"
+
+
+def _local_type(sql_type):
+    try:
+        return sql_type.as_generic()  # sqlalchemy>=1.4
+    except (AttributeError, NotImplementedError):
+        return LOCAL_TYPES[column_kind(sql_type)]()
+
+
+def _meta_table(metadata):
+    return sqlalchemy.Table(
+        SNAPSHOT_META_TABLE, metadata,
+        sqlalchemy.Column("table_name", sqlalchemy.types.String, primary_key=True),
+        sqlalchemy.Column("meta", sqlalchemy.types.PickleType))
+
+
+class SqliteStore(object):
+    """
+    Snapshots as tables of a local SQLite database, with their metadata in
+    the _query_snapshots table.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.engine = sqlalchemy.create_engine("sqlite:///%s" % path)
+        self._meta_table = _meta_table(sqlalchemy.MetaData())
+
+    def tables(self):
+        """
+        Names of the tables with a snapshot.
+        """
+        with self.engine.connect() as conn:
+            if not self.engine.dialect.has_table(conn, SNAPSHOT_META_TABLE):
+                return []
+            select = sqlalchemy.select([self._meta_table.c.table_name])
+            return [row[0] for row in conn.execute(select).fetchall()]
+
+    def load_meta(self, name):
+        with self.engine.connect() as conn:
+            if not self.engine.dialect.has_table(conn, SNAPSHOT_META_TABLE):
+                return None
+            select = (sqlalchemy.select([self._meta_table.c.meta])
+                      .where(self._meta_table.c.table_name == name))
+            return conn.execute(select).scalar()
+
+    def write(self, table, batches, replace, upsert_keys, get_meta):
+        """
+        Write batches (lists of row dicts) of the remote table, replacing
+        the snapshot or adding to it, and then the metadata returned by
+        get_meta(), all in one transaction.
+        """
+        local = sqlalchemy.Table(
+            table.name, sqlalchemy.MetaData(),
+            *[sqlalchemy.Column(c.name, _local_type(c.type), primary_key=c.primary_key)
+              for c in table.columns])
+        with self.engine.begin() as conn:
+            self._meta_table.create(conn, checkfirst=True)
+            if replace:
+                local.drop(conn, checkfirst=True)
+            local.create(conn, checkfirst=True)
+
+            for rows in batches:
+                if upsert_keys:
+                    # Replace earlier versions of updated rows
+                    if len(upsert_keys) == 1:
+                        keys = local.c[upsert_keys[0]]
+                        values = [row[upsert_keys[0]] for row in rows]
+                    else:
+                        keys = sqlalchemy.tuple_(*[local.c[k] for k in upsert_keys])
+                        values = [tuple(row[k] for k in upsert_keys) for row in rows]
+                    for i in range(0, len(values), DELETE_CHUNK_SIZE):
+                        chunk = values[i:i + DELETE_CHUNK_SIZE]
+                        conn.execute(local.delete().where(keys.in_(chunk)))
+                conn.execute(local.insert(), rows)
+
+            conn.execute(self._meta_table.delete().where(
+                self._meta_table.c.table_name == table.name))
+            conn.execute(self._meta_table.insert(), [{"table_name": table.name,
+                                                      "meta": get_meta()}])
+
+
+class ParquetStore(object):
+    """
+    A snapshot of a single table as a Parquet file, with its metadata in a
+    pickled <path>.meta file. Refreshes rewrite the file.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._meta_path = path + ".meta"
+
+    def tables(self):
+        meta = self._load()
+        return [] if meta is None else [meta["table"]]
+
+    def _load(self):
+        if not os.path.exists(self._meta_path):
+            return None
+        with open(self._meta_path, "rb") as f:
+            return pickle.load(f)
+
+    def load_meta(self, name):
+        meta = self._load()
+        return meta if meta is not None and meta["table"] == name else None
+
+    def write(self, table, batches, replace, upsert_keys, get_meta):
+        columns = list(table.columns.keys())
+        df = pd.DataFrame.from_records([row for rows in batches for row in rows],
+                                       columns=columns)
+        if not replace and os.path.exists(self.path):
+            existing = pd.read_parquet(self.path)
+            if upsert_keys and len(df):
+                updated = existing.set_index(upsert_keys).index.isin(
+                    df.set_index(upsert_keys).index)
+                existing = existing[~updated]
+            df = pd.concat([existing, df], ignore_index=True)
+
+        tmp_path = "%s.%d.tmp" % (self.path, os.getpid())
+        df.to_parquet(tmp_path, index=False)
+        os.rename(tmp_path, self.path)
+        with open(tmp_path, "wb") as f:
+            pickle.dump(get_meta(), f)
+        os.rename(tmp_path, self._meta_path)
+
+
+def open_store(path):
+    """
+    The SqliteStore or ParquetStore for a local path.
+    """
+    if snapshot_format(path) == "parquet":
+        return ParquetStore(path)
+    return SqliteStore(path)
+
+
+class Snapshot(object):
+    """
+    A local copy of a remote table, refreshed incrementally from the
+    high-water mark of its key column.
+    """
+    def __init__(self, table, engine, path, key=None, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Args:
+            table (sqlalchemy.Table): The reflected remote table.
+
+            engine: The remote database's engine.
+
+            path (str): Local SQLite database (any extension) or Parquet file
+            (.parquet or .pq).
+
+        Kwargs:
+            key (str): Column whose high-water mark is kept, e.g., the primary
+            key for append-only tables or an updated_at column. Defaults to
+            the key of an existing snapshot at path.
+
+            batch_size (int): Number of rows fetched at a time.
+        """
+        self.table = table
+        self.path = path
+        self._engine = engine
+        self._store = open_store(path)
+        self._batch_size = batch_size
+
+        meta = self.info()
+        self.key = key if key is not None else (meta or {}).get("key")
+        if self.key is None:
+            raise ValueError("No key column for the snapshot of %s." % table.name)
+
+    def info(self):
+        """
+        The snapshot's metadata (table, key, high_water_mark, rows fetched
+        by the last refresh and refreshed_at), or None before its first
+        refresh.
+        """
+        return self._store.load_meta(self.table.name)
+
+    def refresh(self, full=False):
+        """
+        Fetch rows whose key is past the stored high-water mark (all rows on
+        the first refresh, with full=True or if the key changed). Rows
+        fetched by an updated_at style key, i.e., not the primary key,
+        replace their earlier versions.
+
+        Returns:
+            rows (int): Number of rows fetched.
+        """
+        meta = self.info()
+        replace = full or meta is None or meta["key"] != self.key
+        high_water_mark = None if replace else meta["high_water_mark"]
+
+        key_col = self.table.columns[self.key]
+        primary_keys = list(self.table.primary_key.columns.keys())
+        upsert = not replace and self.key not in primary_keys and len(primary_keys) > 0
+
+        select = sqlalchemy.select([self.table])
+        if high_water_mark is not None:
+            # Rows updated at the mark itself may have been committed after the last refresh
+            select = select.where(key_col >= high_water_mark if upsert else
+                                  key_col > high_water_mark)
+
+        state = {"rows": 0, "high_water_mark": high_water_mark}
+
+        def _batches():
+            with self._engine.connect() as conn:
+                result = conn.execution_options(stream_results=True).execute(select)
+                names = list(result.keys())
+                while True:
+                    rows = result.fetchmany(self._batch_size)
+                    if not rows:
+                        break
+                    rows = [dict(zip(names, row)) for row in rows]
+                    keys = [row[self.key] for row in rows if row[self.key] is not None]
+                    if state["high_water_mark"] is not None:
+                        keys.append(state["high_water_mark"])
+                    if keys:
+                        state["high_water_mark"] = max(keys)
+                    state["rows"] += len(rows)
+                    yield rows
+
+        def _meta():
+            return {"table": self.table.name, "key": self.key,
+                    "high_water_mark": state["high_water_mark"], "rows": state["rows"],
+                    "refreshed_at": time.time()}
+
+        self._store.write(self.table, _batches(), replace,
+                          primary_keys if upsert else None, _meta)
+        return state["rows"]
@@ -0,0 +1,111 @@
+"""
+Row counts and on-disk sizes of tables, for the QueryDb summary.
+
+Statistics come from the database catalog where it has them, and from
+COUNT(*) queries run concurrently over a worker pool otherwise.
+"""
+from concurrent.futures import ThreadPoolExecutor, wait
+import threading
+
+import sqlalchemy
+
+from query.limits import RunningStatement
+
+
+TABLE_STATS_WORKERS = 8
+TABLE_STATS_TIMEOUT = 10.0
+
+# Catalog queries returning (table, estimated rows, bytes) for all tables
+CATALOG_QUERIES = {
+    "postgresql": ("SELECT c.relname, c.reltuples, pg_total_relation_size(c.oid) "
+                   "FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+                   "WHERE c.relkind = 'r' AND n.nspname = current_schema()"),
+    "mysql": ("SELECT TABLE_NAME, TABLE_ROWS, DATA_LENGTH + INDEX_LENGTH "
+              "FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE()"),
+    # Sizes only, if SQLite is compiled with the dbstat virtual table
+    "sqlite": "SELECT name, NULL, SUM(pgsize) FROM dbstat GROUP BY name",
+}
+
+
+def catalog_stats(engine):
+    """
+    Table name -> (rows, bytes) from the catalog, either of which may be
+    None if the catalog doesn't have it. Returns an empty dict if the
+    dialect has no supported catalog.
+    """
+    if engine.name not in CATALOG_QUERIES:
+        return {}
+    try:
+        with engine.connect() as conn:
+            rows = conn.execute(sqlalchemy.sql.text(CATALOG_QUERIES[engine.name])).fetchall()
+    except sqlalchemy.exc.DBAPIError:
+        return {}
+
+    stats = {}
+    for table, n_rows, n_bytes in rows:
+        # PostgreSQL reports -1 rows for never analyzed tables
+        if n_rows is not None and n_rows < 0:
+            n_rows = None
+        stats[table] = (None if n_rows is None else int(n_rows),
+                        None if n_bytes is None else int(n_bytes))
+    return stats
+
+
+def count_rows(engine, tables, workers=TABLE_STATS_WORKERS, timeout=TABLE_STATS_TIMEOUT):
+    """
+    Count the rows of each table concurrently with COUNT(*) queries.
+    Tables whose count fails or doesn't finish within timeout seconds (for
+    all tables together) are reported as None. Counts still running then
+    are interrupted, see query.limits, and waited for, so that no worker
+    threads are left behind.
+
+    Returns:
+        counts (dict): Table name -> row count or None.
+    """
+    counts = dict((table, None) for table in tables)
+    if not tables:
+        return counts
+
+    running, stopped, lock = {}, [], threading.Lock()
+
+    def _count(table):
+        with engine.connect() as conn:
+            with RunningStatement(conn, running=running):
+                with lock:  # Registered before the check, so it can't be missed
+                    if stopped:
+                        return None
+                return conn.execute(sqlalchemy.sql.text("SELECT COUNT(*) FROM %s" % table)).scalar()
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    futures = dict((executor.submit(_count, table), table) for table in tables)
+    _, pending = wait(list(futures), timeout=timeout)
+    with lock:
+        stopped.append(True)
+    for future in pending:
+        future.cancel()  # Only cancels counts that haven't started
+
+    # Statements that haven't reached the database yet can miss an interrupt
+    while pending:
+        for statement in list(running.values()):
+            statement.interrupt("timeout")
+        _, pending = wait(pending, timeout=0.1)
+    executor.shutdown(wait=True)
+
+    for future, table in futures.items():
+        if not future.cancelled() and future.exception() is None:
+            counts[table] = future.result()
+    return counts
+
+
+def collect_table_stats(engine, tables, workers=TABLE_STATS_WORKERS,
+                        timeout=TABLE_STATS_TIMEOUT):
+    """
+    Table name -> (rows, bytes) for the given tables, from the catalog
+    where available and COUNT(*) queries for any missing row counts.
+    """
+    stats = catalog_stats(engine)
+    missing_rows = [t for t in tables if stats.get(t, (None, None))[0] is None]
+    counts = count_rows(engine, missing_rows, workers=workers, timeout=timeout)
+    return dict((t, (counts[t] if t in counts else stats[t][0],
+                     stats.get(t, (None, None))[1]))
+                for t in tables)
@@ -65,6 +65,7 @@ setup(
     zip_safe=True,
     platforms='any',
     install_requires=[
+        'futures; python_version < "3"',
         'pandas>=0.16',
         'sqlalchemy>=1.3.0'
     ],
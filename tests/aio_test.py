@@ -0,0 +1,81 @@
+from nose.tools import *  # noqa
+from nose.plugins.skip import SkipTest
+from query.core import (QueryDb, QueryDbError, QueryTimeoutException, QueryCancelledException,
+                        ResultTooLargeException)
+import threading
+import time
+
+
+def _run(make_awaitable):
+    import asyncio
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(make_awaitable())
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+
+def test_aquery():
+    try:
+        import aiosqlite  # noqa
+        import asyncio
+    except ImportError:
+        raise SkipTest("aiosqlite is required for the async API")
+
+    db = QueryDb(demo=True)
+    track = db.inspect.Track
+
+    def _gather():
+        return asyncio.gather(track.ahead(5), db.inspect.Genre.atail(3),
+                              track.awhere("TrackId > 3500"),
+                              db.aquery("SELECT * FROM Genre"))
+    head, tail, where, genres = _run(_gather)
+    _run(db.adispose)
+
+    # Same shapes and values as the sync API
+    assert (head.values == track.head(5).values).all()
+    assert (head.dtypes == track.head(5).dtypes).all()
+    assert (tail.Name.values == db.inspect.Genre.tail(3).Name.values).all()
+    assert where.shape == (3, 9)
+    assert genres.shape == (25, 2)
+
+    # The result cache is shared with .query()
+    db = QueryDb(demo=True, result_cache=True)
+    sync = db.query("SELECT * FROM Genre", fetch_engine="pandas")
+    assert (_run(lambda: db.aquery("SELECT * FROM Genre")).values == sync.values).all()
+    assert db.cache_info()["hits"] == 1
+    db.invalidate_cache("SELECT * FROM Genre")
+    _run(lambda: db.aquery("SELECT * FROM Genre"))
+    assert db.cache_info()["misses"] == 2
+    _run(db.adispose)
+
+    with assert_raises(QueryDbError):
+        _run(lambda: db.aquery("SELECT * FROM Genre", return_as="result"))
+
+
+def test_aquery_limits():
+    try:
+        import aiosqlite  # noqa
+    except ImportError:
+        raise SkipTest("aiosqlite is required for the async API")
+
+    slow = ("WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c "
+            "LIMIT 1000000000) SELECT COUNT(*) AS n FROM c")
+    db = QueryDb(demo=True, timeout=60)
+    start = time.time()
+    assert_raises(QueryTimeoutException, _run, lambda: db.aquery(slow, timeout=0.2))
+    assert time.time() - start < 30
+
+    threading.Timer(0.2, db.cancel).start()
+    assert_raises(QueryCancelledException, _run, lambda: db.aquery(slow))
+    assert db._running == {}
+
+    track = db.inspect.Track
+    assert_raises(ResultTooLargeException, _run, lambda: track.awhere("AlbumId < 50",
+                                                                     max_rows=100))
+    df = _run(lambda: track.ahead(50, max_rows=10, on_limit="truncate"))
+    assert len(df) == 10 and df.attrs["truncated"]
+    assert len(_run(lambda: db.inspect.Genre.atail(5))) == 5  # Connections are still usable
+    _run(db.adispose)
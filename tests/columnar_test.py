@@ -0,0 +1,42 @@
+from nose.tools import *  # noqa
+from query.columnar import ColumnBuffer, column_kind
+import numpy as np
+import sqlalchemy
+
+
+def test_column_kind():
+    assert column_kind(sqlalchemy.types.INTEGER()) == "int"
+    assert column_kind(sqlalchemy.types.NUMERIC(10, 2)) == "float"
+    assert column_kind(sqlalchemy.types.Float()) == "float"
+    assert column_kind(sqlalchemy.types.DATETIME()) == "datetime"
+    assert column_kind(sqlalchemy.types.Boolean()) == "bool"
+    assert column_kind(sqlalchemy.types.NVARCHAR(20)) == "object"
+    assert column_kind(None) == "object"
+
+
+def test_column_buffer():
+    # Grows past its initial capacity
+    buf = ColumnBuffer("int", capacity=2)
+    buf.extend((1, 2, 3))
+    buf.extend((4,))
+    assert buf.finish().dtype == np.int64
+    assert list(buf.finish()) == [1, 2, 3, 4]
+
+    # NULL integers become float NaNs, NULL booleans objects
+    buf = ColumnBuffer("int")
+    buf.extend((1, None))
+    assert buf.finish().dtype == np.float64
+    assert np.isnan(buf.finish()[1])
+    buf = ColumnBuffer("bool")
+    buf.extend((True, None))
+    assert list(buf.finish()) == [True, None]
+
+    buf = ColumnBuffer("datetime")
+    buf.extend(("2009-01-01 00:00:00", None))
+    assert buf.finish().dtype == np.dtype("datetime64[ns]")
+
+    # Values that don't fit fall back to object
+    buf = ColumnBuffer("float")
+    buf.extend((1.5,))
+    buf.extend(("not a float",))
+    assert list(buf.finish()) == [1.5, "not a float"]
@@ -0,0 +1,32 @@
+from nose.tools import *  # noqa
+from query.compact import compact_df
+import numpy as np
+import pandas as pd
+import sqlalchemy
+
+
+def test_compact_df():
+    df = pd.DataFrame({"small": [1, 2, 3, 4], "big": [1, 2, 3, 2 ** 40],
+                       "exact": [0.5, 0.25, 1.0, 2.0], "inexact": [0.1, 0.2, 0.3, 0.4],
+                       "repeated": ["a", "b", "a", "a"], "unique": ["a", "b", "c", "d"]})
+    compact_df(df)
+    assert df.small.dtype == np.int8
+    assert df.big.dtype == np.int64
+    assert df.exact.dtype == np.float32
+    assert df.inexact.dtype == np.float64  # Would lose precision
+    assert str(df.repeated.dtype) == "category"
+    assert df.unique.dtype == object
+    assert df.attrs["memory_bytes_after"] < df.attrs["memory_bytes_before"]
+
+
+def test_compact_df_reflected_columns():
+    table = sqlalchemy.Table("t", sqlalchemy.MetaData(),
+                             sqlalchemy.Column("id", sqlalchemy.Integer, nullable=False),
+                             sqlalchemy.Column("parent", sqlalchemy.Integer, nullable=True),
+                             sqlalchemy.Column("blob", sqlalchemy.LargeBinary))
+    df = pd.DataFrame({"id": [1.0, 2.0, 3.0], "parent": [1.0, None, 1.0],
+                       "blob": [b"a", b"a", b"a"]})
+    compact_df(df, columns=table.columns)
+    assert df.id.dtype == np.int8
+    assert str(df.parent.dtype) == "Int8"  # Nullable integer
+    assert df.blob.dtype == object  # Not a string type
@@ -2,9 +2,19 @@ from nose.tools import *  # noqa
 from query.core import *  # noqa
 from query.helpers import setup_demo_env
 import query
+import query.aggregate
+import query.explain
+import query.instrumentation
+import query.schema_cache
+import numpy as np
 import os
 import pandas as pd
+import shutil
 import sqlalchemy
+import sqlalchemy.dialects.postgresql
+import tempfile
+import threading
+import time
 import warnings
 
 
@@ -74,7 +84,9 @@ def test_querydborm():
     assert db.inspect._repr_html_() == query.html.QUERY_DB_ATTR_MSG
     assert db._meta.__class__ is QueryDbMeta
     assert db.inspect.Track.__class__ is QueryDbOrm
+    assert db.inspect.Track._html is None  # Rendered on first display
     assert db.inspect.Track._repr_html_() == db.inspect.Track._html
+    assert "Inspecting column Composer" in db.inspect.Track.Composer._repr_html_()
 
     # Track is a sqlalchemy Table obj.
     assert db.inspect.Track.__repr__() == db.inspect.Track.table.__repr__()
@@ -155,3 +167,629 @@ def test_query_db_attr_methods():
 
     # Test where
     assert len(db.inspect.Track.where("composer == 'Philip Glass'")) == 1  # :(
+
+
+@with_setup(my_setup)
+def test_querydb_lazy():
+    db = QueryDb(lazy=True)
+    assert len(db._meta.tables) == 0
+    assert "Track" in dir(db.inspect)
+    assert db._summary_info.shape == (11, 4)
+
+    # First access reflects the table and fills in its summary row
+    assert db.inspect.Track.__class__ is QueryDbOrm
+    assert "Track" in db._meta.tables
+    assert db.inspect.Track.Composer.column.name == "Composer"
+    assert db.inspect.Track.head(n=3).shape == (3, 9)
+    track_row = db._summary_info[db._summary_info.Table == "Track"]
+    assert track_row["# of Columns"].values[0] == 9
+    assert "Track" in db._repr_html_()
+
+    with assert_raises(AttributeError):
+        db.inspect.Tracks
+
+
+def test_querydb_schema_cache():
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        db_path = os.path.join(tmp_dir, "Chinook_Sqlite.sqlite")
+        cache_dir = os.path.join(tmp_dir, "cache")
+        shutil.copy(os.path.join(os.path.dirname(query.__file__),
+                                 "sample_data/Chinook_Sqlite.sqlite"), db_path)
+
+        db = QueryDb(drivername="sqlite", database=db_path, use_env_vars=False,
+                     schema_cache=cache_dir)
+        assert len(os.listdir(cache_dir)) == 1
+
+        # Warm start loads the schema without reflecting
+        cached = db._schema_cache.load(db._engine)
+        assert cached is not None
+        assert sorted(cached[0].tables.keys()) == sorted(db._meta.tables.keys())
+        warm_db = QueryDb(drivername="sqlite", database=db_path, use_env_vars=False,
+                          schema_cache=cache_dir)
+        assert warm_db.inspect.Genre.head().Name.values[0] == 'Rock'
+        assert (warm_db._summary_info.values == db._summary_info.values).all()
+
+        # Changing the file invalidates the entry
+        os.utime(db_path, (0, 0))
+        assert db._schema_cache.load(db._engine) is None
+
+        db.refresh_schema()
+        assert db._schema_cache.load(db._engine) is not None
+        assert db.inspect.Track.Composer.column.name == "Composer"
+
+        # Without a fingerprint query, added columns change the inspector's fingerprint
+        with db._engine.begin() as conn:
+            before = query.schema_cache.inspector_fingerprint(conn)
+            conn.execute(sqlalchemy.sql.text("ALTER TABLE Genre ADD COLUMN Notes TEXT"))
+        with db._engine.connect() as conn:
+            assert query.schema_cache.inspector_fingerprint(conn) != before
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+@with_setup(my_setup)
+def test_querydb_query_chunks():
+    db = QueryDb()
+    chunks = db.query("SELECT * FROM Track", return_as="chunks", chunksize=1000)
+    assert not isinstance(chunks, pd.DataFrame)
+    chunks = list(chunks)
+    assert [len(c) for c in chunks] == [1000, 1000, 1000, 503]
+    full = db.query("SELECT * FROM Track")
+    assert (pd.concat(chunks).TrackId.values == full.TrackId.values).all()
+
+    # And via the helpers
+    chunks = db.inspect.Genre.head(n=25, return_as="chunks", chunksize=10)
+    assert [len(c) for c in chunks] == [10, 10, 5]
+    assert sum(len(c) for c in db.inspect.Track.where("TrackId > 3400", return_as="chunks",
+                                                      chunksize=50)) == 103
+
+
+@with_setup(my_setup)
+def test_querydb_result_cache():
+    db = QueryDb()
+    assert db.cache_info() is None
+
+    db = QueryDb(result_cache=True)
+    head = db.inspect.Genre.head()
+    head["Name"] = None  # Mutating a result does not affect the cache
+    assert db.inspect.Genre.head().Name.values[0] == 'Rock'
+    assert db.cache_info()["hits"] == 1 and db.cache_info()["misses"] == 1
+
+    # Whitespace differences share an entry, cache=False bypasses it
+    db.query("SELECT * FROM Genre WHERE GenreId < 5")
+    db.query("SELECT *\n  FROM Genre WHERE GenreId < 5;")
+    db.query("SELECT * FROM Genre", cache=False)
+    assert db.cache_info()["hits"] == 2 and db.cache_info()["misses"] == 2
+
+    # Raw queries share the helpers' entries, bound parameters are part of the key
+    select, params = db.inspect.Genre._order_by_sql(10, None, "ASC")
+    db.query(select, params=params)
+    assert db.cache_info()["hits"] == 3
+    assert len(db.inspect.Genre.head(3)) == 3
+    assert db.cache_info()["misses"] == 3
+
+    # Helper results are dropped for one set of parameters or all of them
+    db.invalidate_cache(select, params=params)
+    db.inspect.Genre.head(3)
+    db.inspect.Genre.head()
+    assert db.cache_info()["hits"] == 4 and db.cache_info()["misses"] == 4
+    db.invalidate_cache(select)
+    db.inspect.Genre.head(3)
+    db.inspect.Genre.head()
+    assert db.cache_info()["hits"] == 4 and db.cache_info()["misses"] == 6
+
+    db.invalidate_cache()
+    db.inspect.Genre.head()
+    assert db.cache_info()["misses"] == 7
+
+    # Whitespace inside quotes is significant, and columnar results depend on the columns
+    assert db.query("SELECT 'a  b' AS x").x[0] == "a  b"
+    assert db.query("SELECT 'a b' AS x").x[0] == "a b"
+    db.query("SELECT * FROM Genre", fetch_engine="columnar")
+    db.query("SELECT * FROM Genre", fetch_engine="columnar",
+             columns=db.inspect.Genre.table.columns)
+    assert db.cache_info()["hits"] == 4 and db.cache_info()["misses"] == 11
+
+
+@with_setup(my_setup)
+def test_querydborm_fetch():
+    db = QueryDb()
+    full = db.query("SELECT * FROM Track")
+    assert db.inspect.Track.fetch(partitions=7, workers=3).equals(full)
+
+    parts = db.inspect.Track.Name.fetch(partitions=3, return_as="parts")
+    assert len(parts) == 3
+    assert sum(len(p) for p in parts) == len(full)
+    assert (parts[0].Name.values == full.Name.values[:len(parts[0])]).all()
+
+    # Non-integer keys
+    assert len(db.inspect.Invoice.fetch(by="Total")) == 412
+    with assert_raises(QueryDbError):
+        db.inspect.Genre.fetch(by="Name")
+    with assert_raises(QueryDbError):
+        db.inspect.Genre.fetch(return_as="result")
+
+
+@with_setup(my_setup)
+def test_querydborm_iter_pages():
+    db = QueryDb()
+
+    # Composite primary key
+    pages = list(db.inspect.PlaylistTrack.iter_pages(1000))
+    assert [len(p) for p in pages] == [1000] * 8 + [715]
+    assert pd.concat(pages, ignore_index=True).equals(
+        db.query("SELECT * FROM PlaylistTrack ORDER BY PlaylistId, TrackId"))
+
+    # Columns, descending
+    pages = list(db.inspect.Track.Name.iter_pages(1500, descending=True))
+    assert [p.shape for p in pages] == [(1500, 1), (1500, 1), (503, 1)]
+    assert pages[0].Name.values[0] == db.inspect.Track.Name.last(1).Name.values[0]
+
+    # String keys with by=
+    pages = list(db.inspect.Artist.iter_pages(100, by="Name"))
+    assert sum(len(p) for p in pages) == 275
+    assert pages[0].Name.values[-1] < pages[1].Name.values[0]
+
+    # Datetime keys, read as Timestamps, are bound as parameters
+    pages = list(db.inspect.Invoice.iter_pages(100, by=["InvoiceDate", "InvoiceId"],
+                                               fetch_engine="columnar"))
+    assert [len(p) for p in pages] == [100] * 4 + [12]
+    assert sorted(pd.concat(pages).InvoiceId) == list(range(1, 413))
+
+
+@with_setup(my_setup)
+def test_querydb_columnar_fetch_engine():
+    db = QueryDb()
+    df = db.inspect.Invoice.head(500)
+    columnar = db.inspect.Invoice.head(500, fetch_engine="columnar")
+    assert columnar.shape == df.shape
+    assert (columnar.Total.values == df.Total.values).all()
+    assert columnar.InvoiceId.dtype == df.InvoiceId.dtype
+    assert str(columnar.InvoiceDate.dtype) == "datetime64[ns]"  # From the reflected DATETIME
+
+    # Raw SQL without column types is read as objects
+    assert (db.query("SELECT * FROM Genre", fetch_engine="columnar").dtypes == object).all()
+    db = QueryDb(fetch_engine="columnar")
+    assert db.inspect.Track.fetch().Milliseconds.dtype == df.InvoiceId.dtype
+
+    with assert_raises(QueryDbError):
+        db.query("SELECT * FROM Genre", fetch_engine="junk")
+
+
+@with_setup(my_setup)
+def test_querydb_compact():
+    db = QueryDb()
+    df = db.inspect.InvoiceLine.head(1000, compact=True)
+    assert df.InvoiceLineId.dtype == np.int16
+    assert df.Quantity.dtype == np.int8
+    assert df.attrs["memory_bytes_after"] < df.attrs["memory_bytes_before"]
+
+    df = db.inspect.Track.fetch(partitions=3, compact=True)
+    assert df.TrackId.dtype == np.int16
+    assert str(df.Composer.dtype) == "category"
+
+    df = db.query("SELECT * FROM Customer", compact=True)
+    assert str(df.Country.dtype) == "category"
+
+
+@with_setup(my_setup)
+def test_querydborm_sample():
+    db = QueryDb()
+
+    # SQLite defaults to rowid sampling
+    sample = db.inspect.Track.sample(10, seed=1)
+    assert sample.shape == (10, 9)
+    assert sample.TrackId.nunique() == 10
+    assert (sample.values == db.inspect.Track.sample(10, seed=1).values).all()
+
+    assert len(db.inspect.Track.sample(fraction=0.1)) == 350
+    assert db.inspect.Genre.sample(100).shape == (25, 2)  # Can't sample more than all rows
+    assert list(db.inspect.Track.Name.sample(500, method="keys").columns) == ["Name"]
+    assert len(db.inspect.PlaylistTrack.sample(50)) == 50
+
+    with assert_raises(QueryDbError):
+        db.inspect.Genre.sample()
+    with assert_raises(QueryDbError):
+        db.inspect.Genre.sample(n=1, fraction=0.5)
+    with assert_raises(QueryDbError):
+        db.inspect.Genre.sample(n=1, method="tablesample")  # Not supported by SQLite
+    with assert_raises(QueryDbError):
+        db.inspect.Genre.sample(n=1, method="keys", by="Name")
+
+    # Probing the first column of a composite key would return one row per playlist
+    with assert_raises(QueryDbError):
+        db.inspect.PlaylistTrack.sample(50, method="keys")
+    assert len(db.inspect.PlaylistTrack.sample(50, method="rowid")) == 50
+    with warnings.catch_warnings(record=True) as w:
+        warnings.simplefilter("always")
+        sample = db.inspect.Track.sample(50, method="keys", by="AlbumId")
+        assert any("not known to be unique" in str(x.message) for x in w)
+    assert sample.AlbumId.is_unique
+
+    # TABLESAMPLE shuffles the whole table without a usable row estimate
+    sql = query.core.tablesample_sql("postgresql", "Track", "*", n=10, row_estimate=-1)
+    assert sql == "SELECT * FROM Track ORDER BY random() LIMIT 10"
+    assert "TABLESAMPLE" not in query.core.tablesample_sql("mssql", "Track", "*", n=10,
+                                                           row_estimate=15)
+    sql = query.core.tablesample_sql("postgresql", "Track", "*", n=10, row_estimate=1000)
+    assert sql == "SELECT * FROM Track TABLESAMPLE SYSTEM (2.0) ORDER BY random() LIMIT 10"
+
+
+@with_setup(my_setup)
+def test_querydborm_describe():
+    db = QueryDb()
+    desc = db.inspect.Customer.describe()
+    assert list(desc.columns[:3]) == list(db.inspect.Customer._column_info().columns)
+    assert len(desc) == 13
+
+    company = desc[desc.Column == "Company"].iloc[0]
+    assert company.Count + company.Nulls == 59
+    assert company.Nulls == 49
+    assert company.Distinct == 10
+
+    desc = db.inspect.Track.Milliseconds.describe()
+    assert len(desc) == 1
+    df = db.query("SELECT Milliseconds FROM Track")
+    assert desc.Min.values[0] == df.Milliseconds.min()
+    assert desc.Max.values[0] == df.Milliseconds.max()
+    assert abs(desc.Mean.values[0] - df.Milliseconds.mean()) < 1e-6
+    assert desc.Distinct.values[0] == df.Milliseconds.nunique()
+
+    with assert_raises(QueryDbError):
+        db.inspect.Track.describe(approx=True)  # No approximate count in SQLite
+
+
+@with_setup(my_setup)
+def test_querydb_table_stats():
+    db = QueryDb(table_stats_ttl=None)
+    assert db._table_stats is None  # Only computed on display
+
+    html = db._repr_html_()
+    stats = db.table_stats()
+    assert list(stats.columns) == ["Table", "Rows", "Size (bytes)"]
+    assert stats[stats.Table == "Track"].Rows.values[0] == 3503
+    assert "Size (bytes)" in html
+    assert db._repr_html_() is html  # Cached
+
+    db.table_stats(refresh=True)
+    assert db._repr_html_() is not html
+
+    db = QueryDb(show_table_stats=False)
+    assert "Rows" not in db._repr_html_()
+    assert db._table_stats is None
+
+
+@with_setup(my_setup)
+def test_querydb_instrumentation():
+    db = QueryDb()
+    with assert_raises(QueryDbError):
+        db.stats()
+
+    records = []
+    instrumentation = query.instrumentation.QueryInstrumentation(slow_query_threshold=0,
+                                                                 hooks=[records.append])
+    db = QueryDb(instrumentation=instrumentation)
+    db.inspect.Track.head()
+    db.inspect.Track.Name.where("TrackId > 3400", fetch_engine="columnar")
+    assert sum(len(c) for c in db.query("SELECT * FROM Genre", return_as="chunks",
+                                        chunksize=10)) == 25
+    with assert_raises(sqlalchemy.exc.OperationalError):
+        db.query("SELECT * FROM Genres")
+
+    assert len(records) == 4
+    assert [r["label"] for r in records] == ["Track.head", "Track.Name.where", "query", "query"]
+    assert [r["rows"] for r in records] == [10, 103, 25, None]
+    assert records[0]["execute"] > 0 and records[0]["fetch"] > 0 and records[0]["convert"] > 0
+    assert records[0]["total"] >= records[0]["execute"] + records[0]["fetch"]
+    assert records[3]["error"] is not None
+
+    stats = db.stats()
+    assert list(stats.index) == ["execute", "fetch", "convert", "total"]
+    assert stats.loc["total", "count"] == 4
+    assert stats.loc["total", "p50"] <= stats.loc["total", "p99"] <= stats.loc["total", "max"]
+    assert db.stats(by="label").loc[("Track.head", "total"), "count"] == 1
+    assert len(db.slow_queries()) == 4
+
+
+@with_setup(my_setup)
+def test_querydb_explain():
+    db = QueryDb()
+    plan = db.explain("SELECT * FROM Track WHERE AlbumId = 3")
+    assert list(plan.columns) == query.explain.PLAN_COLUMNS
+    assert plan.loc[0, "table"] == "Track" and plan.loc[0, "index"] == "IFK_TrackAlbumId"
+    assert not plan.full_scan.any()
+
+    plan = db.explain("SELECT * FROM Track ORDER BY Milliseconds LIMIT 10")
+    assert plan.full_scan.any() and plan.sort.any()
+
+    with assert_raises(ValueError):
+        query.explain.explain(sqlalchemy.create_mock_engine("oracle://", None), "SELECT 1")
+
+
+@with_setup(my_setup)
+def test_querydborm_index_check():
+    db = QueryDb()
+    assert {"trackid", "albumid", "genreid"} <= db.inspect.Track._indexed_columns()
+    with warnings.catch_warnings(record=True) as w:
+        warnings.simplefilter("always")
+        db.inspect.Track.head(by="AlbumId")
+        db.inspect.Track.where("AlbumId = 3 AND Composer = 'Milliseconds'")
+        db.inspect.Track.where(5)
+        assert len(w) == 0
+        db.inspect.Track.tail(by="Milliseconds")
+        db.inspect.Track.Name.where("composer LIKE 'AC%'")
+        assert len(w) == 2
+        assert "Track.Composer" in str(w[1].message)
+
+    with assert_raises(QueryDbError):
+        QueryDb(index_check="junk")
+
+    db = QueryDb(index_check="refuse")
+    with assert_raises(UnindexedQueryException):
+        db.inspect.Track.head(by="Bytes")
+    assert len(db.inspect.Track.head(by="Bytes", index_check=False)) == 10
+
+
+@with_setup(my_setup)
+def test_querydborm_bound_params():
+    db = QueryDb()
+    df = db.query("SELECT * FROM Track WHERE AlbumId = :album", params={"album": 3})
+    assert len(df) == 3
+
+    # The helpers' statements are compiled once, with limits and values bound
+    track = db.inspect.Track
+    assert len(track.head(5)) == 5 and len(track.head(7)) == 7
+    assert len(track._statements) == 1
+    select, params = track._order_by_sql(5, None, "ASC")
+    assert params["n"] == 5 and "5" not in select
+
+    assert track.where(5).TrackId.values[0] == 5
+    assert track.Name.where(6).Name.values[0] == track.where("6").Name.values[0]
+
+    # Numeric keys given as str bind with the key column's type
+    select, params = track._where_sql("6")
+    assert params["value"] == 6 and isinstance(params["value"], int)
+    assert track._where_sql(np.int64(6))[1]["value"] == 6
+    assert track._where_sql("'6'")[1]["value"] == "6"
+    db = QueryDb(result_cache=True)
+    db.inspect.Track.where("6")
+    db.invalidate_cache(select, params={"value": 6})
+    db.inspect.Track.where(6)
+    assert db.cache_info()["hits"] == 0 and db.cache_info()["misses"] == 2
+    assert len(track.where("AlbumId = :album", params={"album": 3})) == 3
+    assert (db.inspect.Artist.where("'AC/DC'", index_check=False).empty and
+            db.inspect.Genre.where("Name = 'Rock'").GenreId.values[0] == 1)
+
+
+@with_setup(my_setup)
+def test_querydb_query_many():
+    db = QueryDb(instrumentation=True)
+    results = db.query_many(["SELECT * FROM Genre", "SELECT * FROM Genres",
+                             "SELECT * FROM Track WHERE AlbumId = 3"], max_workers=2)
+    assert len(results) == 3
+    assert results[0].shape == (25, 2) and len(results[2]) == 3
+    assert isinstance(results[1], sqlalchemy.exc.OperationalError)
+
+    results = db.query_many({"genres": "SELECT * FROM Genre", "artists": "SELECT * FROM Artist"})
+    assert sorted(results.keys()) == ["artists", "genres"]
+    assert results["genres"].equals(db.query("SELECT * FROM Genre"))
+    assert db.stats(by="label").loc[("artists", "total"), "count"] == 1
+
+    with assert_raises(sqlalchemy.exc.OperationalError):
+        db.query_many(["SELECT * FROM Genre", "SELECT * FROM Genres"], errors="raise")
+    assert db.query_many([]) == []
+
+
+@with_setup(my_setup)
+def test_querydb_export():
+    db = QueryDb()
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        paths = db.inspect.Track.export(os.path.join(tmp_dir, "tracks.csv"), batch_size=1000)
+        assert len(paths) == 1
+        assert pd.read_csv(paths[0]).shape == db.query("SELECT * FROM Track").shape
+
+        paths = db.inspect.Track.Name.export(os.path.join(tmp_dir, "names.csv.bz2"),
+                                              max_rows_per_file=2000)
+        assert len(paths) == 2
+        assert list(pd.read_csv(paths[1]).columns) == ["Name"]
+
+        paths = db.export_query("SELECT * FROM Genre WHERE GenreId < :n",
+                                os.path.join(tmp_dir, "genres"), format="csv",
+                                params={"n": 6})
+        assert len(pd.read_csv(paths[0])) == 5
+
+        with assert_raises(QueryDbError):
+            db.export_query("SELECT * FROM Genre", os.path.join(tmp_dir, "genres.json"))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+@with_setup(my_setup)
+def test_querydborm_materialize():
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        remote_path = os.path.join(tmp_dir, "remote.sqlite")
+        shutil.copy(os.environ.get("QUERY_DB_NAME"), remote_path)
+        local_path = os.path.join(tmp_dir, "local.sqlite")
+        db = QueryDb(drivername="sqlite", database=remote_path, use_env_vars=False,
+                     snapshot=local_path)
+
+        with assert_raises(QueryDbError):
+            db.inspect.Genre.refresh()
+        snapshot = db.inspect.Genre.materialize()
+        assert snapshot.info()["high_water_mark"] == 25
+        assert db._snapshot_orm(db.inspect.Genre) is not None
+        assert db._snapshot_orm(db.inspect.Track) is None
+
+        # Local reads don't see new remote rows until refreshed
+        with db._engine.begin() as conn:
+            conn.execute(sqlalchemy.sql.text("INSERT INTO Genre VALUES (26, 'Polka')"))
+        assert db.inspect.Genre.tail(1).GenreId.values[0] == 25
+        assert db.inspect.Genre.refresh() == 1
+        assert db.inspect.Genre.Name.where(26).Name.values[0] == "Polka"
+
+        # A new session picks the snapshot up again
+        db = QueryDb(drivername="sqlite", database=remote_path, use_env_vars=False,
+                     snapshot=local_path)
+        assert db.inspect.Genre.refresh() == 0
+        assert len(db.inspect.Genre.head(30)) == 26
+
+        with assert_raises(QueryDbError):
+            QueryDb(drivername="sqlite", database=remote_path, use_env_vars=False,
+                    snapshot="genres.parquet")
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+@with_setup(my_setup)
+def test_querydborm_follow():
+    tmp_dir = tempfile.mkdtemp()
+    sleep = query.core.time.sleep
+    try:
+        db_path = os.path.join(tmp_dir, "follow.sqlite")
+        shutil.copy(os.environ.get("QUERY_DB_NAME"), db_path)
+        db = QueryDb(drivername="sqlite", database=db_path, use_env_vars=False,
+                     result_cache=True)
+
+        def _insert(genre_id):
+            with db._engine.begin() as conn:
+                conn.execute(sqlalchemy.sql.text("INSERT INTO Genre VALUES (%d, 'Genre %d')" %
+                                                 (genre_id, genre_id)))
+
+        sleeps = []
+
+        def _sleep(seconds):
+            sleeps.append(seconds)
+            if len(sleeps) == 4:
+                _insert(27)
+
+        query.core.time.sleep = _sleep
+        follow = db.inspect.Genre.Name.follow(poll_interval=0.01, max_interval=0.03,
+                                              page_size=2)
+        _insert(26)
+        assert list(next(follow).Name.values) == ["Genre 26"]
+        assert list(next(follow).Name.values) == ["Genre 27"]
+        assert sleeps == [0.01, 0.01, 0.02, 0.03]  # Backs off while no rows arrive
+
+        for genre_id in [28, 29, 30]:
+            _insert(genre_id)
+        assert len(next(follow)) == 2 and len(next(follow)) == 1
+        assert sleeps[4:] == [0.01]  # Reset after new rows, no wait after a full page
+    finally:
+        query.core.time.sleep = sleep
+        shutil.rmtree(tmp_dir)
+
+
+@with_setup(my_setup)
+def test_querydb_timeout_and_cancel():
+    slow = ("WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c "
+            "LIMIT 1000000000) SELECT COUNT(*) AS n FROM c")
+    db = QueryDb(timeout=60)
+    start = time.time()
+    assert_raises(QueryTimeoutException, db.query, slow, timeout=0.2)
+    assert time.time() - start < 30
+
+    threading.Timer(0.2, db.cancel).start()
+    assert_raises(QueryCancelledException, db.query, slow, fetch_engine="columnar")
+    assert db._running == {} and db.cancel() == 0
+    assert len(db.query("SELECT * FROM Genre")) == 25  # Connections are still usable
+
+
+@with_setup(my_setup)
+def test_querydb_result_limits():
+    db = QueryDb(max_rows=100)
+    assert_raises(ResultTooLargeException, db.query, "SELECT * FROM Track")
+    assert_raises(ResultTooLargeException, db.inspect.Track.where, "AlbumId < 50")
+    assert len(db.query("SELECT * FROM Track", max_rows=False)) == 3503
+    assert len(db.query("SELECT * FROM Genre")) == 25
+
+    with warnings.catch_warnings(record=True) as w:
+        warnings.simplefilter("always")
+        df = db.query("SELECT * FROM Track", max_rows=10, on_limit="truncate")
+        assert len(df) == 10 and df.attrs["truncated"]
+        df = db.query("SELECT * FROM Track", max_rows=10, on_limit="truncate",
+                      fetch_engine="columnar", columns=db.inspect.Track.table.columns)
+        assert list(df.TrackId) == list(range(1, 11))
+        chunks = list(db.query("SELECT * FROM Track", return_as="chunks", chunksize=40,
+                               max_rows=100, on_limit="truncate"))
+        assert [len(c) for c in chunks] == [40, 40, 20]
+        df = db.query("SELECT * FROM Track", max_rows=False, max_bytes=20000,
+                      on_limit="truncate")
+        assert 0 < len(df) < 3503
+        assert len([x for x in w if "truncated" in str(x.message)]) == 4
+    assert_raises(QueryDbError, db.query, "SELECT * FROM Track", on_limit="ignore")
+
+    # Cached results obey the limits of later calls
+    db = QueryDb(result_cache=True)
+    assert len(db.query("SELECT * FROM Track")) == 3503
+    assert_raises(ResultTooLargeException, db.query, "SELECT * FROM Track", max_rows=10)
+
+
+@with_setup(my_setup)
+def test_querydborm_aggregations():
+    db = QueryDb()
+    track = db.inspect.Track
+    raw = db.query("SELECT * FROM Track")
+
+    counts = track.GenreId.value_counts()
+    assert counts.is_monotonic_decreasing  # Ties are ordered by value, not first occurrence
+    assert counts.sort_index().equals(raw.GenreId.value_counts().sort_index())
+    assert track.GenreId.value_counts(normalize=True, n=3).equals(
+        raw.GenreId.value_counts(normalize=True).head(3))
+    assert list(track.GenreId.value_counts(sort=False).index) == sorted(raw.GenreId.unique())
+    assert track.Composer.nunique() == raw.Composer.nunique()
+    assert track.Composer.nunique(dropna=False) == raw.Composer.nunique(dropna=False)
+    assert track.nunique().equals(raw.nunique())
+    assert_raises(QueryDbError, track.value_counts)
+
+    for bins in [5, [0, 100000, 200000, 300000]]:
+        counts, edges = np.histogram(raw.Milliseconds, bins)
+        hist = track.Milliseconds.histogram(bins)
+        assert list(hist.values) == list(counts)
+        assert np.allclose(hist.index.left, edges[:-1])
+
+    # Casts round outside SQLite, so bins are floored there
+    col = track.table.c.Milliseconds
+    bucket = query.aggregate.bucket_expr(col, [0.0, 10.0, 20.0], dialect="postgresql")
+    sql = str(bucket.compile(dialect=sqlalchemy.dialects.postgresql.dialect()))
+    assert sql.startswith("CASE WHEN") and "ELSE CAST(floor(" in sql
+    assert "floor(" not in str(query.aggregate.bucket_expr(col, [0.0, 10.0], dialect="sqlite"))
+
+    spec = {"Milliseconds": ["sum", "mean"], "Bytes": "max"}
+    assert track.groupby("GenreId").agg(spec).equals(raw.groupby("GenreId").agg(spec))
+    assert track.groupby("AlbumId").size().equals(raw.groupby("AlbumId").size())
+    assert track.Milliseconds.groupby("GenreId").sum().equals(
+        raw.Milliseconds.groupby(raw.GenreId).sum())
+    named = track.groupby(["GenreId", "MediaTypeId"]).agg(total=("Milliseconds", "sum"))
+    assert named.equals(raw.groupby(["GenreId", "MediaTypeId"]).agg(
+        total=("Milliseconds", "sum")))
+
+    daily = db.inspect.Invoice.Total.groupby("DATE(InvoiceDate)", where="Total > 10").sum()
+    assert daily.index.name == "DATE(InvoiceDate)" and (daily > 10).all()
+
+
+@with_setup(my_setup)
+def test_querydborm_related():
+    db = QueryDb(instrumentation=True)
+    tracks = db.query("SELECT * FROM Track WHERE TrackId < 60")
+    albums = db.inspect.Album.related(tracks)
+    assert sorted(albums.AlbumId) == sorted(tracks.AlbumId.unique())
+    assert list(albums.columns) == list(db.inspect.Album.table.columns.keys())
+
+    expected = sorted(db.query("SELECT TrackId FROM Track WHERE AlbumId < 8").TrackId)
+    related = db.inspect.Track.related(albums, batch_size=3)  # 3 IN queries
+    assert sorted(related.TrackId) == expected
+    assert db.stats(by="label").loc[("Track.related", "total"), "count"] == 3
+    related = db.inspect.Track.related(albums, temp_table_threshold=5)
+    assert sorted(related.TrackId) == expected
+    assert list(db.inspect.Track.Name.related(albums.iloc[:0]).columns) == ["Name"]
+
+    # Self-referencing foreign key: both directions match, via= picks one
+    employees = db.query("SELECT * FROM Employee")
+    assert_raises(QueryDbError, db.inspect.Employee.related, employees)
+    managers = db.inspect.Employee.related(employees, via="Employee.ReportsTo")
+    assert sorted(managers.EmployeeId) == sorted(employees.ReportsTo.dropna().unique())
+    assert_raises(QueryDbError, db.inspect.Album.related, tracks, via="Genre")
+    assert_raises(QueryDbError, db.inspect.Album.related, tracks, method="join")
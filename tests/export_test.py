@@ -0,0 +1,90 @@
+from nose.tools import *  # noqa
+from nose.plugins.skip import SkipTest
+from query.export import export_batches, infer_format, iter_batches, part_path
+import os
+import pandas as pd
+import shutil
+import sqlalchemy
+import tempfile
+
+
+def _batches():
+    return [pd.DataFrame({"a": range(i, i + 4), "b": ["x"] * 4}) for i in range(0, 12, 4)]
+
+
+def test_infer_format():
+    assert infer_format("tracks.parquet") == "parquet"
+    assert infer_format("tracks.CSV.gz") == "csv"
+    assert infer_format("tracks.json") is None
+    assert part_path("/tmp/tracks.csv.gz", 3) == "/tmp/tracks-00003.csv.gz"
+
+
+def test_iter_batches():
+    engine = sqlalchemy.create_engine("sqlite://")
+    query = sqlalchemy.sql.text("WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL "
+                                "SELECT i + 1 FROM n WHERE i < 5000) SELECT i FROM n")
+    sizes = [len(df) for df in iter_batches(engine, query, batch_size=2000)]
+    assert sizes == [2000, 2000, 1000]
+
+    # Batches shrink to fit the memory ceiling
+    sizes = [len(df) for df in iter_batches(engine, query, max_batch_bytes=800)]
+    assert sum(sizes) == 5000 and max(sizes[1:]) <= 100
+
+    empty = list(iter_batches(engine, sqlalchemy.sql.text("SELECT 1 AS i WHERE 1 = 0")))
+    assert len(empty) == 1 and list(empty[0].columns) == ["i"]
+
+
+def test_export_csv():
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        progress = []
+        path = os.path.join(tmp_dir, "out.csv.gz")
+        paths = export_batches(_batches(), path, "csv", max_rows_per_file=5,
+                               progress=lambda rows, p: progress.append(rows))
+        assert paths == [part_path(path, i) for i in range(3)]
+        assert progress[-1] == 12
+        df = pd.concat([pd.read_csv(p) for p in paths], ignore_index=True)
+        assert df.equals(pd.concat(_batches(), ignore_index=True))
+        assert [len(pd.read_csv(p)) for p in paths] == [5, 5, 2]
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def test_export_parquet():
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise SkipTest("pyarrow is required for Parquet exports")
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp_dir, "out.parquet")
+        assert export_batches(_batches(), path, "parquet", compression="gzip") == [path]
+        parquet_file = pq.ParquetFile(path)
+        assert parquet_file.num_row_groups == 3  # One per batch
+        assert parquet_file.read().to_pandas().equals(pd.concat(_batches(), ignore_index=True))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def test_export_parquet_schema():
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise SkipTest("pyarrow is required for Parquet exports")
+
+    # NULLs only in some batches don't change the columns' types
+    batches = [pd.DataFrame({"a": [1, 2], "b": [None, None], "c": [None, None]}),
+               pd.DataFrame({"a": [None, 4], "b": ["x", None], "c": [1.5, None]})]
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp_dir, "out.parquet")
+        export_batches(batches, path, "parquet",
+                       column_types={"a": sqlalchemy.types.Integer(),
+                                     "c": sqlalchemy.types.Float()})
+        schema = pq.read_schema(path)
+        assert [str(schema.field(c).type) for c in "abc"] == ["int64", "string", "double"]
+        df = pq.read_table(path).to_pandas()
+        assert list(df.a.isnull()) == [False, False, True, False] and df.c[2] == 1.5
+    finally:
+        shutil.rmtree(tmp_dir)
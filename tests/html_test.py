@@ -0,0 +1,16 @@
+from nose.tools import *  # noqa
+from query.html import df_to_html
+import pandas as pd
+
+
+def test_df_to_html_truncates():
+    df = pd.DataFrame({"a": range(100000), "b": ["row %d" % i for i in range(100000)]})
+    html = df_to_html(df, "Big", max_rows=10)
+    assert "row 4</td>" in html and "row 99999</td>" in html
+    assert "row 5</td>" not in html
+    assert "Showing the first and last 5 of 100000 rows." in html
+
+    # Small frames are shown in full
+    html = df_to_html(df.head(10), "Small", max_rows=10)
+    assert "row 9</td>" in html and "Showing" not in html
+    assert "row 50000</td>" in df_to_html(df, "Full", max_rows=None)
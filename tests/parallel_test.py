@@ -0,0 +1,12 @@
+from nose.tools import *  # noqa
+from query.parallel import partition_bounds
+
+
+def test_partition_bounds():
+    assert partition_bounds(1, 10, 3) == [(1, 4), (4, 7), (7, 10)]
+    assert partition_bounds(1, 3, 3) == [(1, 2), (2, 3), (3, 3)]
+    assert partition_bounds(5, 5, 3) == [(5, 5)]  # No more partitions than keys
+    assert partition_bounds(0.0, 1.0, 2) == [(0.0, 0.5), (0.5, 1.0)]
+
+    with assert_raises(TypeError):
+        partition_bounds("a", "z", 2)
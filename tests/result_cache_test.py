@@ -0,0 +1,62 @@
+from nose.tools import *  # noqa
+from query.result_cache import ResultCache, normalize_sql, df_bytes
+import pandas as pd
+import shutil
+import tempfile
+import time
+
+
+def test_normalize_sql():
+    assert normalize_sql("SELECT *\n  FROM  Track ; ") == "SELECT * FROM Track"
+    assert (normalize_sql("SELECT  'a  b', \"c  d\"  FROM t WHERE x = 'it''s  ok'") ==
+            "SELECT 'a  b', \"c  d\" FROM t WHERE x = 'it''s  ok'")
+
+
+def test_result_cache_lru():
+    df = pd.DataFrame({"a": range(100)})
+    cache = ResultCache(max_bytes=df_bytes(df) * 2)
+    cache.set("one", df)
+    cache.set("two", df)
+    assert cache.get("one") is not None  # "two" is now least recently used
+    cache.set("three", df)
+    assert cache.get("two") is None
+    assert cache.get("one") is not None
+    assert cache.info()["entries"] == 2
+    assert cache.hits == 2 and cache.misses == 1
+
+    # Cached frames are copies
+    cached = cache.get("one")
+    cached["a"] = 0
+    assert (cache.get("one").a.values == df.a.values).all()
+
+    cache.invalidate("one")
+    assert cache.get("one") is None
+    cache.invalidate()
+    assert cache.info()["bytes"] == 0
+
+
+def test_result_cache_ttl_and_disk():
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        df = pd.DataFrame({"a": range(100)})
+        cache = ResultCache(max_bytes=1, cache_dir=tmp_dir)  # Too small for memory
+        key = cache.key("SELECT * FROM Track", {"n": 1})
+        assert key != cache.key("SELECT * FROM Track", {"n": 2})
+        cache.set(key, df)
+        assert cache.info()["entries"] == 0
+        assert (cache.get(key).a.values == df.a.values).all()
+
+        # Entries of a query are dropped together, from memory and disk
+        cache.set(cache.key("SELECT  * FROM Track;", {"n": 2}), df)
+        other = cache.key("SELECT * FROM Album")
+        cache.set(other, df)
+        cache.invalidate_sql("SELECT * FROM Track", params={"n": 2})
+        assert cache.get(key) is not None
+        cache.invalidate_sql("SELECT * FROM Track")
+        assert cache.get(key) is None and cache.get(other) is not None
+
+        cache.set("expiring", df, ttl=0.01)
+        time.sleep(0.02)
+        assert cache.get("expiring") is None
+    finally:
+        shutil.rmtree(tmp_dir)
@@ -0,0 +1,89 @@
+from nose.tools import *  # noqa
+from query.core import QueryDbError
+from query.sharded import ShardedQueryDb, merge_sorted
+import os
+import numpy as np
+import pandas as pd
+import shutil
+import sqlalchemy
+import tempfile
+
+
+def _shards(tmp_dir, n_shards=3, rows=30):
+    # Rows are dealt to the shards round-robin, so every shard holds part of each range
+    urls = []
+    for shard in range(n_shards):
+        path = os.path.join(tmp_dir, "shard%d.sqlite" % shard)
+        engine = sqlalchemy.create_engine("sqlite:///%s" % path)
+        with engine.begin() as conn:
+            conn.execute(sqlalchemy.sql.text("CREATE TABLE events (id INTEGER PRIMARY KEY, "
+                                             "name TEXT, score INTEGER, note TEXT)"))
+            for i in range(shard + 1, rows + 1, n_shards):
+                conn.execute(sqlalchemy.sql.text("INSERT INTO events VALUES "
+                                                 "(:id, :name, :score, :note)"),
+                             {"id": i, "name": "event%d" % i, "score": (i * 7) % 10,
+                              "note": None if i % 4 == 0 else "note%02d" % (i % 13)})
+        engine.dispose()
+        urls.append("sqlite:///%s" % path)
+    return urls
+
+
+def test_merge_sorted():
+    dfs = [pd.DataFrame({"k": [1, 4, 5]}), pd.DataFrame({"k": []}),
+           pd.DataFrame({"k": [2, 3, 6]})]
+    assert list(merge_sorted(dfs, "k", 4)["k"]) == [1, 2, 3, 4]
+    assert list(merge_sorted(dfs, "k", 10)["k"]) == [1, 2, 3, 4, 5, 6]
+    dfs = [df.iloc[::-1] for df in dfs]
+    assert list(merge_sorted(dfs, "k", 3, descending=True)["k"]) == [6, 5, 4]
+
+    dfs = [pd.DataFrame({"k": [None, "a", "c"]}), pd.DataFrame({"k": [None, "b"]})]
+    assert list(merge_sorted(dfs, "k", 5)["k"]) == [None, None, "a", "b", "c"]
+    dfs = [pd.DataFrame({"k": [2.0, np.nan]}), pd.DataFrame({"k": [1.0]})]
+    merged = merge_sorted(dfs, "k", 3, nulls_first=False)["k"]
+    assert list(merged[:2]) == [1.0, 2.0] and np.isnan(merged[2])
+
+
+def test_sharded_querydb():
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        urls = _shards(tmp_dir)
+        db = ShardedQueryDb(urls, show_table_stats=False)
+        assert "3 shards" in repr(db)
+
+        # Plain selects are concatenated
+        df = db.query("SELECT * FROM events WHERE score < 5")
+        assert sorted(df.id) == [i for i in range(1, 31) if (i * 7) % 10 < 5]
+        parts = db.query("SELECT COUNT(*) AS n FROM events", return_as="shards")
+        assert [int(p.n[0]) for p in parts] == [10, 10, 10]
+        df = db.inspect.events.where("id > :start", params={"start": 25})
+        assert sorted(df.id) == [26, 27, 28, 29, 30]
+
+        # Ordered helpers merge to a global limit
+        assert list(db.inspect.events.head(7).id) == list(range(1, 8))
+        assert list(db.inspect.events.tail(4).id) == [30, 29, 28, 27]
+        df = db.inspect.events.name.head(3)
+        assert list(df.columns) == ["name"]
+        assert list(df.name) == ["event1", "event2", "event3"]
+        assert list(db.inspect.events.head(3, by="score").score) == [0, 0, 0]
+
+        # Nullable sort columns merge with SQLite's NULLs first, expressions sort too
+        notes = db.query("SELECT note FROM events").note
+        expected = [None] * notes.isnull().sum() + sorted(notes.dropna())
+        assert list(db.inspect.events.head(30, by="note").note) == expected
+        assert list(db.inspect.events.note.tail(3, by="note").note) == expected[::-1][:3]
+        df = db.inspect.events.head(5, by="id * -1")
+        assert list(df.id) == [30, 29, 28, 27, 26] and "id * -1" not in df.columns
+
+        stats = db.table_stats()
+        assert int(stats.set_index("Table").loc["events", "Rows"]) == 30
+
+        assert_raises(QueryDbError, db.query, "SELECT * FROM events", return_as="result")
+        assert_raises(QueryDbError, db.inspect.events.sample)
+
+        # URL options reach every shard, the summary shows the summed stats
+        db = ShardedQueryDb(["%s?timeout=30" % url for url in urls])
+        assert all(dict(e.url.query) == {"timeout": "30"} for e in db._engines)
+        html = db._repr_html_()
+        assert "(3 shards)" in html and "Rows" in html and ">30<" in html
+    finally:
+        shutil.rmtree(tmp_dir)
@@ -0,0 +1,58 @@
+from nose.tools import *  # noqa
+from query.snapshot import Snapshot, open_store, snapshot_format
+import os
+import shutil
+import sqlalchemy
+import tempfile
+
+
+def _remote(tmp_dir):
+    engine = sqlalchemy.create_engine("sqlite:///%s" % os.path.join(tmp_dir, "remote.sqlite"))
+    with engine.begin() as conn:
+        conn.execute(sqlalchemy.sql.text("CREATE TABLE events (id INTEGER PRIMARY KEY, "
+                                         "status TEXT, updated_at INTEGER)"))
+        conn.execute(sqlalchemy.sql.text("INSERT INTO events VALUES (1, 'new', 10), "
+                                         "(2, 'new', 20), (3, 'new', 30)"))
+    table = sqlalchemy.Table("events", sqlalchemy.MetaData(), autoload_with=engine)
+    return engine, table
+
+
+def _local_rows(path):
+    engine = sqlalchemy.create_engine("sqlite:///%s" % path)
+    with engine.connect() as conn:
+        return conn.execute(sqlalchemy.sql.text("SELECT * FROM events ORDER BY id")).fetchall()
+
+
+def test_snapshot_format():
+    assert snapshot_format("tables.sqlite") == "sqlite"
+    assert snapshot_format("events.PARQUET") == "parquet"
+
+
+def test_snapshot_updated_at():
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        engine, table = _remote(tmp_dir)
+        path = os.path.join(tmp_dir, "local.db")
+        snapshot = Snapshot(table, engine, path, key="updated_at", batch_size=2)
+        assert snapshot.refresh() == 3
+        assert snapshot.info()["high_water_mark"] == 30
+        assert open_store(path).tables() == ["events"]
+
+        with engine.begin() as conn:
+            conn.execute(sqlalchemy.sql.text("UPDATE events SET status = 'done', "
+                                             "updated_at = 40 WHERE id = 1"))
+            conn.execute(sqlalchemy.sql.text("INSERT INTO events VALUES (4, 'new', 50)"))
+
+        # Rows at the mark are fetched again, updated rows replace their old versions
+        assert snapshot.refresh() == 3
+        rows = _local_rows(path)
+        assert [tuple(r) for r in rows] == [(1, "done", 40), (2, "new", 20), (3, "new", 30),
+                                            (4, "new", 50)]
+
+        # The key is remembered, and full=True copies everything again
+        snapshot = Snapshot(table, engine, path)
+        assert snapshot.key == "updated_at"
+        assert snapshot.refresh(full=True) == 4
+        assert len(_local_rows(path)) == 4
+    finally:
+        shutil.rmtree(tmp_dir)
@@ -0,0 +1,28 @@
+from nose.tools import *  # noqa
+from benchmarks.synthetic import column_names, make_database, table_name
+from query.core import QueryDb
+import os
+import shutil
+import tempfile
+
+
+def test_make_database():
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        path = make_database(os.path.join(tmp_dir, "synthetic.sqlite"), tables=3, columns=5,
+                             rows=2500, row_tables=2, batch_size=1000)
+        db = QueryDb(drivername="sqlite", database=path, use_env_vars=False)
+        assert list(db._summary_info["Table"]) == [table_name(i) for i in range(3)]
+
+        df = db.query("SELECT * FROM t0000")
+        assert list(df.columns) == column_names(5)
+        assert df.shape == (2500, 5) and df.id.is_unique
+        assert len(db.query("SELECT * FROM t0002")) == 0
+
+        # Generated values only depend on the seed
+        other = make_database(os.path.join(tmp_dir, "other.sqlite"), tables=1, columns=5,
+                              rows=2500, batch_size=1000)
+        other_db = QueryDb(drivername="sqlite", database=other, use_env_vars=False)
+        assert other_db.query("SELECT * FROM t0000").equals(df)
+    finally:
+        shutil.rmtree(tmp_dir)
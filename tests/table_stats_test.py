@@ -0,0 +1,51 @@
+from nose.tools import *  # noqa
+from query.table_stats import catalog_stats, collect_table_stats, count_rows
+import os
+import shutil
+import sqlalchemy
+import tempfile
+import threading
+import time
+
+
+def _engine(tmp_dir):
+    # A file, as each connection to an in-memory SQLite DB has its own DB
+    engine = sqlalchemy.create_engine("sqlite:///%s" % os.path.join(tmp_dir, "stats.sqlite"))
+    with engine.begin() as conn:
+        conn.execute(sqlalchemy.sql.text("CREATE TABLE a (id INTEGER PRIMARY KEY)"))
+        conn.execute(sqlalchemy.sql.text("INSERT INTO a VALUES (1), (2), (3)"))
+        conn.execute(sqlalchemy.sql.text("CREATE TABLE b (id INTEGER PRIMARY KEY)"))
+    return engine
+
+
+def test_count_rows():
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        engine = _engine(tmp_dir)
+        assert count_rows(engine, ["a", "b"], workers=2) == {"a": 3, "b": 0}
+        assert count_rows(engine, ["missing"]) == {"missing": None}  # Failures are None
+        assert count_rows(engine, []) == {}
+
+        # The timeout covers all tables, slow counts are interrupted
+        with engine.begin() as conn:
+            conn.execute(sqlalchemy.sql.text(
+                "CREATE VIEW slow AS WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL "
+                "SELECT x + 1 FROM c LIMIT 1000000000) SELECT x FROM c"))
+        threads, start = threading.active_count(), time.time()
+        counts = count_rows(engine, ["slow", "a", "slow", "slow"], workers=2, timeout=0.3)
+        assert counts == {"slow": None, "a": 3}
+        assert time.time() - start < 5 and threading.active_count() == threads
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def test_collect_table_stats():
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        engine = _engine(tmp_dir)
+        stats = collect_table_stats(engine, ["a", "b"])
+        assert stats["a"][0] == 3 and stats["b"][0] == 0
+        if catalog_stats(engine):  # SQLite built with dbstat
+            assert stats["a"][1] > 0
+    finally:
+        shutil.rmtree(tmp_dir)